@@ -0,0 +1,320 @@
+"""
+Benchmarks indexing and querying on synthetic wikis. generate_wiki writes a
+wiki in the same <page><title><id><text> schema as wikis/*.xml with a
+configurable number of pages, Zipf-distributed vocabulary and link density;
+run_benchmark indexes it, times every Indexer phase, the Querier's load and
+query latency percentiles, compares the words file formats with
+compression_report and the approximate mode of impact-ordered postings with
+impact_report, and writes the results as json so runs can be compared
+with compare_results
+"""
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from xml.sax.saxutils import escape
+import file_io
+from index import Indexer
+from query import Querier
+from relevance import RelevanceArrays
+
+DEFAULTS = {
+    "pages": 1000,
+    "vocabulary": 20000,
+    "zipf": 1.1,  # exponent of the word frequency distribution
+    "words": 200,  # mean words per page
+    "links": 10,  # mean links per page
+    "queries": 500,
+    "seed": 0,
+}
+IMPACT_LIMITS = [10, 100, 1000]  # impact_limit values impact_report tries
+
+
+def make_vocabulary(size: int, rng: random.Random):
+    """returns size distinct lowercase words of 3 to 10 letters
+    """
+    vocabulary = set()
+    while len(vocabulary) < size:
+        vocabulary.add("".join(rng.choices(
+            string.ascii_lowercase, k=rng.randint(3, 10))))
+    return sorted(vocabulary)
+
+
+def zipf_weights(size: int, exponent: float):
+    """returns the cumulative weights of a Zipf distribution over ranks
+    1..size, for random.choices
+    """
+    cumulative = []
+    total = 0.0
+    for rank in range(1, size + 1):
+        total += 1 / rank ** exponent
+        cumulative.append(total)
+    return cumulative
+
+
+def generate_wiki(xml_fp: str, pages=DEFAULTS["pages"],
+                  vocabulary=DEFAULTS["vocabulary"], zipf=DEFAULTS["zipf"],
+                  words=DEFAULTS["words"], links=DEFAULTS["links"],
+                  seed=DEFAULTS["seed"]):
+    """
+    writes a synthetic wiki to xml_fp. Page text draws words from a Zipf
+    distribution over the vocabulary, and links point at uniformly chosen
+    pages, a few of them outside the corpus or with piped display text
+    :return: the vocabulary with its cumulative Zipf weights, for sampling
+    queries
+    """
+    rng = random.Random(seed)
+    vocab = make_vocabulary(vocabulary, rng)
+    weights = zipf_weights(len(vocab), zipf)
+    titles = ["Page " + str(i) + " " + vocab[i % len(vocab)]
+              for i in range(pages)]
+
+    with open(xml_fp, "w") as xml_fh:
+        xml_fh.write("<xml>\n")
+        for i in range(pages):
+            text = rng.choices(vocab, cum_weights=weights,
+                               k=max(1, int(rng.expovariate(1 / words))))
+            for _ in range(int(rng.expovariate(1 / links)) if links else 0):
+                roll = rng.random()
+                if roll < 0.05:
+                    target = "[[Missing " + rng.choice(vocab) + "]]"
+                elif roll < 0.2:
+                    target = "[[" + rng.choice(titles) + "|" + \
+                        rng.choice(vocab) + "]]"
+                else:
+                    target = "[[" + rng.choice(titles) + "]]"
+                text.insert(rng.randrange(len(text) + 1), target)
+            xml_fh.write("<page><title>" + escape(titles[i]) +
+                         "</title><id>" + str(i) + "</id><text>" +
+                         escape(" ".join(text)) + "</text></page>\n")
+        xml_fh.write("</xml>\n")
+    return vocab, weights
+
+
+def percentiles(samples: list):
+    """returns the p50/p90/p99/max of samples (seconds) in milliseconds
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    return {"p50_ms": at(0.5) * 1000, "p90_ms": at(0.9) * 1000,
+            "p99_ms": at(0.99) * 1000, "max_ms": ordered[-1] * 1000}
+
+
+def compression_report(words_to_doc_relevance: dict, work_dir: str):
+    """
+    writes the relevances in every words file format and measures each one
+    :param words_to_doc_relevance: words -> ids -> relevance of an index
+    :param work_dir: where the files are written
+    :return: format -> {"bytes", "ratio" (text bytes / bytes), "decode_s"
+    (reading every posting list), "postings_per_second", "max_error" (largest
+    difference from the exact relevance)}
+    """
+    postings = sum(map(len, words_to_doc_relevance.values()))
+    writers = {
+        "text": file_io.write_words_file,
+        "binary": file_io.write_words_binary,
+        "compressed16": lambda fp, words: file_io.write_words_compressed(
+            fp, words, 16),
+        "compressed8": lambda fp, words: file_io.write_words_compressed(
+            fp, words, 8),
+    }
+    report = {}
+    for name, write in writers.items():
+        words_fp = os.path.join(work_dir, "words." + name)
+        write(words_fp, words_to_doc_relevance)
+        start = time.perf_counter()
+        if name == "text":
+            decoded = {}
+            file_io.read_words_file(words_fp, decoded)
+        else:
+            mapping = file_io.binary_postings(words_fp)
+            try:
+                decoded = {word: mapping.postings(word) for word in mapping}
+            finally:
+                mapping.close()
+        decode_time = time.perf_counter() - start
+        if name != "text":
+            decoded = {word: dict(zip(*found))
+                       for word, found in decoded.items()}
+        report[name] = {
+            "bytes": os.path.getsize(words_fp),
+            "decode_s": decode_time,
+            "postings_per_second": postings / decode_time
+            if decode_time else 0.0,
+            "max_error": max((abs(relevance - decoded[word][j])
+                              for word, docs in words_to_doc_relevance.items()
+                              for j, relevance in docs.items()), default=0.0),
+        }
+    for measured in report.values():
+        measured["ratio"] = report["text"]["bytes"] / measured["bytes"] \
+            if measured["bytes"] else 0.0
+    return report
+
+
+def impact_report(querier: Querier, queries: list, k=10,
+                  limits=IMPACT_LIMITS):
+    """
+    answers queries exactly and approximately from querier's impact-ordered
+    postings with each limit, in pagerank mode
+    :param querier: a Querier opened with an impact_fp and no result cache
+    :param queries: the queries
+    :param k: the number of results per query
+    :param limits: the impact_limit values to try
+    :return: "exact" or limit -> query latency percentiles, plus "recall"
+    (the mean fraction of a query's exact top k found) for each limit
+    """
+    querier.pagerank = True
+    report = {}
+    exact = {}
+    for limit in [None] + list(limits):
+        querier.impact_limit = limit
+        latencies = []
+        recalls = []
+        for user_input in queries:
+            start = time.perf_counter()
+            found = {j for j, _, _ in querier.search(user_input, k)}
+            latencies.append(time.perf_counter() - start)
+            if limit is None:
+                exact[user_input] = found
+            elif exact[user_input]:
+                recalls.append(len(found & exact[user_input]) /
+                               len(exact[user_input]))
+        report["exact" if limit is None else str(limit)] = \
+            percentiles(latencies)
+        if limit is not None:
+            report[str(limit)]["recall"] = \
+                sum(recalls) / len(recalls) if recalls else 1.0
+    querier.impact_limit = None
+    return report
+
+
+def run_benchmark(out_fp: str, work_dir=None, **options):
+    """
+    generates a wiki with the given options (see DEFAULTS), indexes it and
+    queries it in work_dir (a temporary directory by default), writing the
+    timings to out_fp as json
+    :return: the results dictionary
+    """
+    if work_dir is None:
+        with tempfile.TemporaryDirectory(prefix="search-bench-") as work_dir:
+            return run_benchmark(out_fp, work_dir, **options)
+
+    settings = dict(DEFAULTS, **options)
+    xml_fp = os.path.join(work_dir, "wiki.xml")
+    titles_fp = os.path.join(work_dir, "titles.txt")
+    docs_fp = os.path.join(work_dir, "docs.txt")
+    words_fp = os.path.join(work_dir, "words.txt")
+    impact_fp = os.path.join(work_dir, "words.impact")
+
+    start = time.perf_counter()
+    vocab, weights = generate_wiki(
+        xml_fp, settings["pages"], settings["vocabulary"], settings["zipf"],
+        settings["words"], settings["links"], settings["seed"])
+    generate_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexer = Indexer(xml_fp, titles_fp, docs_fp, words_fp)
+    index_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    querier = Querier(titles_fp, docs_fp, words_fp, False, cache_size=0)
+    load_time = time.perf_counter() - start
+
+    # queries of one to three words drawn from the same Zipf distribution
+    rng = random.Random(settings["seed"] + 1)
+    latencies = {"relevance": [], "pagerank": []}
+    queries = [" ".join(rng.choices(vocab, cum_weights=weights,
+                                    k=rng.randint(1, 3)))
+               for _ in range(settings["queries"])]
+    for user_input in queries:
+        for mode in latencies:
+            querier.pagerank = mode == "pagerank"
+            start = time.perf_counter()
+            querier.search(user_input)
+            latencies[mode].append(time.perf_counter() - start)
+
+    results = {
+        "settings": settings,
+        "xml_bytes": os.path.getsize(xml_fp),
+        "generate_s": generate_time,
+        "index": dict(indexer.timings, total=index_time),
+        "index_bytes": {
+            "titles": os.path.getsize(titles_fp),
+            "docs": os.path.getsize(docs_fp),
+            "words": os.path.getsize(words_fp)},
+        "terms": len(indexer.relevance_dict),
+        "compression": compression_report(indexer.relevance_dict, work_dir),
+        "querier_load_s": load_time,
+        "query": {mode: percentiles(samples)
+                  for mode, samples in latencies.items()},
+    }
+    RelevanceArrays.from_relevance(indexer.relevance_dict).write_impact(
+        impact_fp, indexer.ids_to_pageranks)
+    impact_querier = Querier(titles_fp, docs_fp, words_fp, True,
+                             cache_size=0, impact_fp=impact_fp)
+    try:
+        results["impact"] = impact_report(impact_querier, queries)
+    finally:
+        impact_querier.impact.close()
+    with open(out_fp, "w") as out_fh:
+        json.dump(results, out_fh, indent=2)
+    return results
+
+
+def compare_results(old: dict, new: dict, prefix=""):
+    """
+    returns (key, old, new, new / old) for every timing present in both
+    benchmark results, so a run can be checked against a baseline
+    """
+    rows = []
+    for key, value in new.items():
+        if key == "settings" or key not in old:
+            continue
+        if isinstance(value, dict):
+            rows += compare_results(old[key], value, prefix + key + ".")
+        elif isinstance(value, (int, float)) and \
+                (key.endswith("_s") or key.endswith("_ms") or
+                 prefix.startswith("index")):
+            ratio = value / old[key] if old[key] else float("inf")
+            rows.append((prefix + key, old[key], value, ratio))
+    return rows
+
+
+# usage: python bench.py out.json [--pages N] [--vocabulary N] [--zipf S]
+#        [--words N] [--links N] [--queries N] [--seed N] [--compare old.json]
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    options = {}
+    baseline = None
+    try:
+        out_fp = args.pop(0)
+        while args:
+            flag = args.pop(0)
+            value = args.pop(0)
+            if flag == "--compare":
+                baseline = value
+            elif flag[2:] in DEFAULTS:
+                options[flag[2:]] = type(DEFAULTS[flag[2:]])(value)
+            else:
+                raise ValueError(flag)
+    except (IndexError, ValueError):
+        print("usage: python bench.py out.json [--pages N] [--vocabulary N] "
+              "[--zipf S] [--words N] [--links N] [--queries N] [--seed N] "
+              "[--compare old.json]")
+        sys.exit()
+
+    results = run_benchmark(out_fp, **options)
+    print(json.dumps(results, indent=2))
+    if baseline is not None:
+        with open(baseline) as baseline_fh:
+            old = json.load(baseline_fh)
+        for key, before, after, ratio in compare_results(old, results):
+            print("%-32s %10.4f -> %10.4f  (x%.2f)" % (
+                key, before, after, ratio))
@@ -0,0 +1,154 @@
+"""
+Boolean queries: AND, OR, NOT and parentheses over the words index. A query
+is parsed into a tree of tuples and evaluated to the sorted list of ids that
+satisfy it; adjacent operands without an operator are ANDed, and AND binds
+tighter than OR
+"""
+import re
+from postings import difference, intersect, union
+
+TOKEN_REGEX = r"\(|\)|[^\s()]+"
+OPERATORS = {"AND", "OR", "NOT"}
+
+
+def is_boolean(user_input: str):
+    """
+    checks whether a query uses any boolean operator or parentheses, which
+    must be written in capitals to tell them from the words and, or and not
+    """
+    return any(token in OPERATORS or token in "()"
+               for token in re.findall(TOKEN_REGEX, user_input))
+
+
+def parse(user_input: str, normalize):
+    """
+    parses a boolean query into a tree of ("term", term), ("not", node),
+    ("and", nodes) and ("or", nodes) tuples
+    :param user_input: the query
+    :param normalize: turns a query word into its index term, or None for a
+    stop word, whose operand is dropped along with any NOT applied to it
+    :return: the tree
+    :raises ValueError: if the query is malformed, or has no term that is
+    neither a stop word nor negated to rank its results by
+    """
+    tokens = []
+    for token in re.findall(TOKEN_REGEX, user_input):
+        if token in OPERATORS or token in "()":
+            tokens.append(token)
+        else:
+            tokens.append(("term", normalize(token)))
+    parser = Parser(tokens)
+    tree = parser.parse_or()
+    if parser.pos != len(tokens):
+        raise ValueError("unexpected " + repr(tokens[parser.pos]))
+    if tree is None:
+        raise ValueError("a query needs a term that is not a stop word")
+    if not positive_terms(tree):
+        raise ValueError("a query needs a term that is not negated")
+    return tree
+
+
+class Parser:
+    """
+    Recursive descent parser over the tokens of a boolean query; a dropped
+    operand parses to None, and a group left without operands is dropped too
+    or := and (OR and)*
+    and := not (AND? not)*
+    not := NOT not | ( or ) | term
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == "OR":
+            self.pos += 1
+            nodes.append(self.parse_and())
+        return group("or", nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.peek() not in (None, "OR", ")"):
+            if self.peek() == "AND":
+                self.pos += 1
+            nodes.append(self.parse_not())
+        return group("and", nodes)
+
+    def parse_not(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError("query ends where a term was expected")
+        self.pos += 1
+        if token == "NOT":
+            node = self.parse_not()
+            return None if node is None else ("not", node)
+        if token == "(":
+            node = self.parse_or()
+            if self.peek() != ")":
+                raise ValueError("missing )")
+            self.pos += 1
+            return node
+        if token in OPERATORS or token == ")":
+            raise ValueError("unexpected " + repr(token))
+        return None if token[1] is None else token
+
+
+def group(kind, nodes):
+    """
+    returns the ("and"|"or", nodes) node of the operands that were not
+    dropped, the operand itself if only one is left, or None if none is
+    """
+    nodes = tuple(node for node in nodes if node is not None)
+    if len(nodes) <= 1:
+        return nodes[0] if nodes else None
+    return (kind, nodes)
+
+
+def evaluate(node, doc_ids, all_ids):
+    """
+    computes the ids that satisfy a parsed query. An AND intersects its
+    positive operands by galloping through the longer lists, then removes the
+    ids of its NOT operands, so a rare term ANDed with a common one costs about
+    the length of the rare term's list; only a bare NOT takes a complement
+    :param node: a tree returned by parse
+    :param doc_ids: returns the sorted ids of the docs containing a term
+    :param all_ids: the sorted ids of every doc
+    :return: sorted list of ids
+    """
+    kind = node[0]
+    if kind == "term":
+        return doc_ids(node[1])
+    if kind == "not":
+        return difference(all_ids, evaluate(node[1], doc_ids, all_ids))
+    if kind == "or":
+        return union([evaluate(child, doc_ids, all_ids)
+                      for child in node[1]])
+
+    positive = [evaluate(child, doc_ids, all_ids)
+                for child in node[1] if child[0] != "not"]
+    negative = [evaluate(child[1], doc_ids, all_ids)
+                for child in node[1] if child[0] == "not"]
+    ids = intersect(positive) if positive else all_ids
+    for excluded in negative:
+        ids = difference(ids, excluded)
+    return ids
+
+
+def positive_terms(node):
+    """
+    returns the terms of a parsed query that are not under a NOT, which are
+    the ones its results are ranked by
+    """
+    kind = node[0]
+    if kind == "term":
+        return [node[1]]
+    if kind == "not":
+        return []
+    return [term for child in node[1] for term in positive_terms(child)]
@@ -0,0 +1,163 @@
+"""
+Integer coding used by the binary index files.
+
+Variable-byte: a value is written 7 bits per byte, least significant group
+first, with the high bit set on every byte but the last; sorted sequences are
+delta encoded first so most values fit in a single byte.
+
+Blocks: compressed postings are cut into blocks of BLOCK_SIZE. A block holds
+its first doc id, the gaps to the following ids bit-packed at the width of
+the largest gap, and the quantized relevance of every posting; a whole block
+is packed and unpacked with a few NumPy operations
+"""
+import struct
+import numpy as np
+
+BLOCK_SIZE = 128
+BLOCK_HEADER = struct.Struct("<iB")  # first doc id, bit width of the gaps
+# place value of each bit of a packed value, by width
+BIT_WEIGHTS = [np.left_shift(1, np.arange(width - 1, -1, -1, dtype=np.int64))
+               for width in range(65)]
+
+
+def encode_varint(value: int, out: bytearray):
+    """
+    appends the variable-byte encoding of a non-negative value to out
+    """
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(buf, pos: int):
+    """
+    decodes the value starting at buf[pos]
+    :return: (value, position after it)
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_deltas(values, out: bytearray):
+    """
+    appends the count of an ascending sequence and the varint-encoded gaps
+    between its values to out
+    """
+    encode_varint(len(values), out)
+    previous = 0
+    for value in values:
+        encode_varint(value - previous, out)
+        previous = value
+
+
+def decode_deltas(buf, pos: int):
+    """
+    decodes a sequence written by encode_deltas starting at buf[pos]
+    :return: (list of values, position after them)
+    """
+    count, pos = decode_varint(buf, pos)
+    values = []
+    previous = 0
+    for _ in range(count):
+        gap, pos = decode_varint(buf, pos)
+        previous += gap
+        values.append(previous)
+    return values, pos
+
+
+def quantize(relevances, bits: int):
+    """
+    maps relevances onto the integers 0..2**bits - 1 with a per-term scale, the
+    largest relevance taking the top level. A positive relevance never
+    rounds to 0, so every posting still scores
+    :param relevances: the non-negative relevances of one term
+    :param bits: 8 or 16
+    :return: (array of levels, scale), where level * scale is within
+    scale / 2 of the relevance (within scale for the smallest ones, which
+    round up to level 1)
+    """
+    relevances = np.asarray(relevances, dtype=np.float64)
+    levels = (1 << bits) - 1
+    top = float(relevances.max()) if len(relevances) else 0.0
+    if top <= 0:
+        return np.zeros(len(relevances), dtype=np.int64), 0.0
+    scale = top / levels
+    quantized = np.clip(np.rint(relevances / scale), 0, levels)
+    quantized[(quantized == 0) & (relevances > 0)] = 1
+    return quantized.astype(np.int64), scale
+
+
+def pack_bits(values, width: int):
+    """
+    returns the values packed at width bits each, most significant bit first
+    """
+    if width == 0 or len(values) == 0:
+        return b""
+    shifts = np.arange(width - 1, -1, -1, dtype=np.int64)
+    bits = (values[:, None] >> shifts) & 1
+    return np.packbits(bits.astype(np.uint8)).tobytes()
+
+
+def unpack_bits(buf, pos: int, count: int, width: int):
+    """
+    unpacks count values of width bits packed by pack_bits at buf[pos]
+    :return: (int64 array of values, position after them)
+    """
+    if width == 0 or count == 0:
+        return np.zeros(count, dtype=np.int64), pos
+    size = (count * width + 7) // 8
+    bits = np.unpackbits(np.frombuffer(buf, dtype=np.uint8, count=size,
+                                       offset=pos), count=count * width)
+    return bits.reshape(count, width) @ BIT_WEIGHTS[width], pos + size
+
+
+def encode_blocks(ids, quantized, score_type: str, out: bytearray):
+    """
+    appends the blocks of one term's postings to out
+    :param ids: ascending doc ids
+    :param quantized: the level of each posting (see quantize)
+    :param score_type: NumPy dtype the levels are stored as ("<u1", "<u2")
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    scores = np.asarray(quantized).astype(score_type)
+    for start in range(0, len(ids), BLOCK_SIZE):
+        block = ids[start:start + BLOCK_SIZE]
+        gaps = np.diff(block)
+        width = int(gaps.max()).bit_length() if len(gaps) else 0
+        out += BLOCK_HEADER.pack(int(block[0]), width)
+        out += pack_bits(gaps, width)
+        out += scores[start:start + BLOCK_SIZE].tobytes()
+
+
+def decode_blocks(buf, pos: int, count: int, score_type: str):
+    """
+    decodes count postings written by encode_blocks starting at buf[pos],
+    one block at a time
+    :return: (int64 array of ids, array of levels)
+    """
+    dtype = np.dtype(score_type)
+    ids = []
+    scores = []
+    for start in range(0, count, BLOCK_SIZE):
+        n = min(BLOCK_SIZE, count - start)
+        first, width = BLOCK_HEADER.unpack_from(buf, pos)
+        pos += BLOCK_HEADER.size
+        ids.append([first])
+        if n > 1:
+            gaps, pos = unpack_bits(buf, pos, n - 1, width)
+            gaps = np.cumsum(gaps)
+            gaps += first
+            ids.append(gaps)
+        scores.append(np.frombuffer(buf, dtype=dtype, count=n, offset=pos))
+        pos += n * dtype.itemsize
+    if len(scores) == 1:
+        return np.concatenate(ids), scores[0]
+    return np.concatenate(ids), np.concatenate(scores)
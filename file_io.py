@@ -2,6 +2,68 @@
 Provides functionality for reading from/writing to the 3 index files used by
 indexer and querier in search
 """
+import locale
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
+from codec import BLOCK_SIZE, decode_blocks, decode_deltas, decode_varint, \
+    encode_blocks, encode_deltas, encode_varint, quantize
+from link_graph import LinkGraph
+
+# binary words file layout (all little endian):
+#   header: magic, number of terms
+#   table:  one (term offset, term length, postings offset, postings count,
+#           max relevance) entry per term, sorted by term
+#   terms:  utf-8 bytes of every term
+#   postings: per term, count int32 doc ids then count float32 relevances
+# the max relevance of a term bounds its contribution to any document's
+# score, which lets the querier skip documents that cannot reach the top k
+WORDS_MAGIC = b"SRCHWRD2"
+WORDS_HEADER = struct.Struct("<8sQ")
+WORDS_ENTRY = struct.Struct("<QIQIf")
+
+# compressed words file layout: the header adds the bits per quantized
+# relevance and the block size, and each table entry ends with the term's
+# scale instead of its max relevance; a term's postings are the blocks of
+# codec.encode_blocks (delta + bit-packed ids, relevances as levels of scale)
+COMPRESSED_MAGIC = b"SRCHWRD3"
+COMPRESSED_HEADER = struct.Struct("<8sQII")
+COMPRESSED_ENTRY = struct.Struct("<QIQId")
+SCORE_TYPES = {8: "<u1", 16: "<u2"}  # bits -> stored type of a level
+
+# impact-ordered words file layout: the header adds the name of the fusion
+# the postings are ordered by (see relevance.FUSIONS) and the table has no
+# bounds; a term's postings are sorted by fused static score, highest first
+# (ties by id), and stored as count float64 relevances, count float64 fused
+# scores, then count int32 ids, so any prefix of them can be read alone
+IMPACT_MAGIC = b"SRCHIMP1"
+IMPACT_HEADER = struct.Struct("<8sQ16s")
+IMPACT_ENTRY = struct.Struct("<QIQI")
+
+# link graph file layout (little endian): header of magic, number of pages and
+# number of targets, then the graph's ids (int64), offsets (int32), degrees
+# (int32), links_to_all flags (int8) and targets (int32) arrays
+GRAPH_MAGIC = b"SRCHLNK1"
+GRAPH_HEADER = struct.Struct("<8sQQ")
+
+# binary positions file layout: the header of a binary words file and a term
+# table without max relevances, where each entry points at a block of varints
+# holding the number of docs, then per doc (in id order) the gap from the
+# previous doc id followed by the count and gaps of the doc's ascending word
+# positions
+POSITIONS_MAGIC = b"SRCHPOS1"
+POSITIONS_ENTRY = struct.Struct("<QIQI")
+
+# offsets sidecar of a text words file: a line holding the words file's size
+# and mtime_ns, then a "term byte_offset" line per term
+OFFSETS_SUFFIX = ".offsets"
+LAZY_CACHE_SIZE = 10000  # decoded posting lists LazyPostings keeps
+
 
 def write_title_file(title: str, dictionary: dict):
     """
@@ -16,7 +78,27 @@ def write_title_file(title: str, dictionary: dict):
     with open(title, "w") as title_fh:
         for id_num, title in dictionary.items():
             title_fh.write(str(id_num) + "::" + title + "\n")
-    
+
+
+def append_title_file(titles: str, ids_to_titles: dict, changed):
+    """
+    Appends the current title of every changed id to a titles file, where it
+    replaces the id's earlier line; an id no longer in ids_to_titles is
+    written alone, which deletes it
+    :param titles: the titles file to append to
+    :param ids_to_titles: the dictionary of ids -> titles after the change
+    :param changed: the ids whose titles changed, were added or deleted
+    :return: n/a
+    """
+    with open(titles, "a") as titles_fh:
+        for id_num in changed:
+            if id_num in ids_to_titles:
+                titles_fh.write(str(id_num) + "::" + ids_to_titles[id_num] +
+                                "\n")
+            else:
+                titles_fh.write(str(id_num) + "\n")
+
+
 def write_docs_file(docs: str, ids_to_pageranks: dict):
     """
     Writes the dictionary of ids the value of
@@ -33,7 +115,8 @@ def write_docs_file(docs: str, ids_to_pageranks: dict):
             docs_fh.write(str(id_num) + " " + str(rank) + "\n")
 
 
-def write_words_file(words: str, words_to_doc_relevance: dict):
+def write_words_file(words: str, words_to_doc_relevance: dict,
+                     offsets=False):
     """
     Writes the dictionary of words to ids to number of appearances
     output looks like:
@@ -41,6 +124,7 @@ def write_words_file(words: str, words_to_doc_relevance: dict):
     word2 id2_1 freq2_1 id2_2 freq2_2 ...
     :param words: the file that will get written to
     :param words_to_doc_relevance: the dictionary that provides words -> ids -> term relevance
+    :param offsets: also write the offsets sidecar LazyPostings reads
     :return: n/a
     """
     with open(words, "w") as words_fh:
@@ -49,6 +133,795 @@ def write_words_file(words: str, words_to_doc_relevance: dict):
             for id_num, relevance in ids_to_relevance.items():
                 words_fh.write(str(id_num) + " " + str(relevance) + " ")
             words_fh.write("\n")
+    if offsets:
+        write_offsets_file(words)
+
+
+def append_words_file(words: str, words_to_doc_relevance: dict, changed,
+                      offsets=False):
+    """
+    Appends the current postings of every changed word to a words file
+    written by write_words_file, where they replace the word's earlier line;
+    a word no longer in words_to_doc_relevance is written without postings,
+    which deletes it
+    :param words: the words file to append to
+    :param words_to_doc_relevance: words -> ids -> relevance after the change
+    :param changed: the words whose postings changed
+    :param offsets: also bring the offsets sidecar LazyPostings reads up to
+    date
+    :return: n/a
+    """
+    term_offsets = {}
+    if offsets:
+        read_offsets_file(words, term_offsets)
+    encoding = locale.getpreferredencoding(False)
+    offset = os.path.getsize(words)
+    with open(words, "ab") as words_fh:
+        for word in changed:
+            ids_to_relevance = words_to_doc_relevance.get(word, {})
+            line = (word + " " + "".join([
+                str(id_num) + " " + str(relevance) + " "
+                for id_num, relevance in ids_to_relevance.items()]) +
+                "\n").encode(encoding)
+            words_fh.write(line)
+            if ids_to_relevance:
+                term_offsets[word] = offset
+            else:
+                term_offsets.pop(word, None)
+            offset += len(line)
+    if offsets:
+        write_offsets_file(words, term_offsets)
+
+
+def write_links_file(links: str, page_to_linked_pages: dict):
+    """
+    Writes the dictionary of page titles to the titles they link to
+    output looks like:
+    title1::link1_1::link1_2...
+    title2::link2_1...
+    :param links: the file that will get written to
+    :param page_to_linked_pages: the dictionary of titles -> linked titles
+    :return: n/a
+    """
+    with open(links, "w") as links_fh:
+        for title, linked in page_to_linked_pages.items():
+            links_fh.write("::".join([title] + linked) + "\n")
+
+
+def append_links_file(links: str, page_to_linked_pages: dict, changed):
+    """
+    Appends the links of every changed title to a links file, where they
+    replace the title's earlier line. Titles are not deleted; a reader keeps
+    only the titles of live pages
+    :param links: the links file to append to
+    :param page_to_linked_pages: the dictionary of titles -> linked titles
+    :param changed: the titles whose links changed
+    :return: n/a
+    """
+    with open(links, "a") as links_fh:
+        for title in changed:
+            links_fh.write(
+                "::".join([title] + page_to_linked_pages[title]) + "\n")
+
+
+def write_stems_file(stems: str, words_to_stems: dict):
+    """
+    Writes the dictionary of words to their stems
+    output looks like:
+    word1 stem1
+    word2 stem2
+    :param stems: the file that will get written to
+    :param words_to_stems: the dictionary of words -> stems
+    :return: n/a
+    """
+    with open(stems, "w") as stems_fh:
+        for word, stem in words_to_stems.items():
+            stems_fh.write(word + " " + stem + "\n")
+
+
+def write_dictionary_file(dictionary: str, terms: list, titles: list):
+    """
+    Writes the term dictionary the querier completes and corrects queries
+    from
+    output looks like:
+    number of terms
+    term1 document_frequency1 display_word1
+    id1 pagerank1 title1
+    :param dictionary: the file that will get written to
+    :param terms: (term, document frequency, the word shown for the term)
+    of every index term
+    :param titles: (id, pagerank, title) of every page
+    :return: n/a
+    """
+    with open(dictionary, "w") as dictionary_fh:
+        dictionary_fh.write(str(len(terms)) + "\n")
+        for term, df, display in terms:
+            dictionary_fh.write(term + " " + str(df) + " " + display + "\n")
+        for id_num, rank, title in titles:
+            dictionary_fh.write(
+                str(id_num) + " " + str(rank) + " " + title + "\n")
+
+
+def write_ids_file(ids_fp: str, ids):
+    """
+    Writes a collection of page ids, one per line
+    :param ids_fp: the file that will get written to
+    :param ids: the ids
+    :return: n/a
+    """
+    with open(ids_fp, "w") as ids_fh:
+        for id_num in ids:
+            ids_fh.write(str(id_num) + "\n")
+
+
+def write_manifest_file(manifest: str, segments: list):
+    """
+    Writes the live segments of a segmented index, oldest first. The file is
+    written beside manifest and then renamed over it, so readers always see
+    either the old or the new list of segments
+    output looks like:
+    name1 pages1
+    name2 pages2
+    :param manifest: filepath to the manifest
+    :param segments: list of (segment name, number of pages)
+    :return: n/a
+    """
+    with open(manifest + ".tmp", "w") as manifest_fh:
+        for name, pages in segments:
+            manifest_fh.write(name + " " + str(pages) + "\n")
+    os.replace(manifest + ".tmp", manifest)
+
+
+def write_words_binary(words: str, words_to_doc_relevance: dict):
+    """
+    Writes the dictionary of words to ids to relevance in the binary format
+    read by BinaryPostings: a sorted term table with offsets into packed
+    doc-id/float32 postings arrays, sorted by id, and each term's max
+    relevance
+    :param words: the file that will get written to
+    :param words_to_doc_relevance: the dictionary that provides words -> ids -> term relevance
+    :return: n/a
+    """
+    terms = sorted((word.encode("utf-8"), word)
+                   for word in words_to_doc_relevance)
+    table = []
+    for encoded, word in terms:
+        ids_to_relevance = words_to_doc_relevance[word]
+        # taken over the float32 values, so it equals the largest stored
+        # relevance exactly
+        bound = max(array("f", ids_to_relevance.values()), default=0.0)
+        table.append((encoded, len(ids_to_relevance), bound))
+
+    def postings():
+        for _, word in terms:
+            ids_to_relevance = words_to_doc_relevance[word]
+            ids = sorted(ids_to_relevance)
+            yield (packed(array("i", ids)),
+                   packed(array("f", [ids_to_relevance[i] for i in ids])))
+
+    write_postings_binary(words, table, postings())
+
+
+def write_postings_binary(words: str, table: list, postings):
+    """
+    Writes a binary words file from postings that are already packed
+    :param words: the file that will get written to
+    :param table: (term utf-8 bytes, postings count, max relevance) of every
+    term, sorted by term bytes
+    :param postings: yields the little endian int32 ids (ascending) and
+    float32 relevances of each term of table, in order, as bytes
+    :return: n/a
+    """
+    term_start = WORDS_HEADER.size + WORDS_ENTRY.size * len(table)
+    postings_start = term_start + sum(len(t) for t, _, _ in table)
+    postings_start += -postings_start % 4  # align the packed arrays
+
+    with open(words, "wb") as words_fh:
+        words_fh.write(WORDS_HEADER.pack(WORDS_MAGIC, len(table)))
+        term_off, post_off = term_start, postings_start
+        for encoded, count, bound in table:
+            words_fh.write(WORDS_ENTRY.pack(
+                term_off, len(encoded), post_off, count, bound))
+            term_off += len(encoded)
+            post_off += 8 * count
+        for encoded, _, _ in table:
+            words_fh.write(encoded)
+        words_fh.write(b"\0" * (postings_start - term_off))
+        for ids, relevances in postings:
+            words_fh.write(ids)
+            words_fh.write(relevances)
+
+
+def write_words_compressed(words: str, words_to_doc_relevance: dict,
+                           bits=16):
+    """
+    Writes the dictionary of words to ids to relevance in the compressed
+    format read by CompressedPostings
+    :param words: the file that will get written to
+    :param words_to_doc_relevance: the dictionary that provides words -> ids -> term relevance
+    :param bits: 8 or 16 bits per quantized relevance
+    :return: n/a
+    """
+    terms = sorted((word.encode("utf-8"), word)
+                   for word in words_to_doc_relevance)
+
+    def postings():
+        for _, word in terms:
+            ids_to_relevance = words_to_doc_relevance[word]
+            ids = sorted(ids_to_relevance)
+            yield ids, [ids_to_relevance[i] for i in ids]
+
+    write_postings_compressed(words, [encoded for encoded, _ in terms],
+                              postings(), bits)
+
+
+def write_postings_compressed(words: str, terms: list, postings, bits=16):
+    """
+    Writes a compressed words file, quantizing each term's relevances
+    :param words: the file that will get written to
+    :param terms: the utf-8 bytes of every term, sorted
+    :param postings: yields the ascending ids and the relevances of each term
+    of terms, in order
+    :param bits: 8 or 16 bits per quantized relevance
+    :return: n/a
+    """
+    score_type = SCORE_TYPES[bits]
+    term_start = COMPRESSED_HEADER.size + COMPRESSED_ENTRY.size * len(terms)
+    postings_start = term_start + sum(map(len, terms))
+
+    with open(words, "wb") as words_fh:
+        words_fh.write(COMPRESSED_HEADER.pack(
+            COMPRESSED_MAGIC, len(terms), bits, BLOCK_SIZE))
+        # the table is filled in once the postings offsets are known
+        words_fh.write(b"\0" * (term_start - COMPRESSED_HEADER.size))
+        for encoded in terms:
+            words_fh.write(encoded)
+        table = []
+        term_off, post_off = term_start, postings_start
+        for encoded, (ids, relevances) in zip(terms, postings):
+            quantized, scale = quantize(relevances, bits)
+            out = bytearray()
+            encode_blocks(ids, quantized, score_type, out)
+            words_fh.write(out)
+            table.append(COMPRESSED_ENTRY.pack(
+                term_off, len(encoded), post_off, len(ids), scale))
+            term_off += len(encoded)
+            post_off += len(out)
+        words_fh.seek(COMPRESSED_HEADER.size)
+        words_fh.write(b"".join(table))
+
+
+def write_postings_impact(impact: str, fusion: str, table: list, postings):
+    """
+    Writes an impact-ordered words file from postings that are already packed
+    :param impact: the file that will get written to
+    :param fusion: name of the fusion the postings are ordered by
+    :param table: (term utf-8 bytes, postings count) of every term, sorted by
+    term bytes
+    :param postings: yields the little endian float64 relevances, float64
+    fused scores and int32 ids of each term of table, in order, as bytes
+    :return: n/a
+    """
+    term_start = IMPACT_HEADER.size + IMPACT_ENTRY.size * len(table)
+    postings_start = term_start + sum(len(t) for t, _ in table)
+
+    with open(impact, "wb") as impact_fh:
+        impact_fh.write(IMPACT_HEADER.pack(
+            IMPACT_MAGIC, len(table), fusion.encode("ascii")))
+        term_off, post_off = term_start, postings_start
+        for encoded, count in table:
+            impact_fh.write(IMPACT_ENTRY.pack(
+                term_off, len(encoded), post_off, count))
+            term_off += len(encoded)
+            post_off += 20 * count
+        for encoded, _ in table:
+            impact_fh.write(encoded)
+        for relevances, fused, ids in postings:
+            impact_fh.write(relevances)
+            impact_fh.write(fused)
+            impact_fh.write(ids)
+
+
+def write_postings_file(words: str, postings, offsets=False):
+    """
+    Writes a text words file, in the format of write_words_file, from
+    postings given term by term
+    :param words: the file that will get written to
+    :param postings: yields (word, ids, relevances) with the ids and
+    relevances as parallel lists
+    :param offsets: also write the offsets sidecar LazyPostings reads
+    :return: n/a
+    """
+    with open(words, "w") as words_fh:
+        for word, ids, relevances in postings:
+            words_fh.write(word + " " + "".join([
+                str(id_num) + " " + str(relevance) + " "
+                for id_num, relevance in zip(ids, relevances)]) + "\n")
+    if offsets:
+        write_offsets_file(words)
+
+
+def scan_offsets(words: str, term_offsets: dict):
+    """
+    finds the byte offset of every term's line in a text words file without
+    parsing its postings
+    :param words: filepath to the words file
+    :param term_offsets: the dictionary terms -> offsets get written into
+    :return: n/a
+    """
+    offset = 0
+    with open(words, "rb") as words_fh:
+        for line in words_fh:
+            end = line.find(b" ")
+            if end > 0:
+                word = line[:end].decode(locale.getpreferredencoding(False))
+                # a word appended again without postings was deleted
+                if line[end:].strip():
+                    term_offsets[word] = offset
+                else:
+                    term_offsets.pop(word, None)
+            offset += len(line)
+
+
+def words_file_stamp(words: str):
+    """
+    returns the size and mtime_ns of words, which an offsets sidecar must
+    match to be used
+    """
+    stat = os.stat(words)
+    return str(stat.st_size) + " " + str(stat.st_mtime_ns)
+
+
+def write_offsets_file(words: str, term_offsets=None):
+    """
+    Writes the offsets sidecar (words + OFFSETS_SUFFIX) of a text words file
+    output looks like:
+    size mtime_ns
+    word1 offset1
+    word2 offset2
+    :param words: the words file, which must already be written
+    :param term_offsets: the terms -> offsets of the words file, scanned
+    from it if None
+    :return: n/a
+    """
+    if term_offsets is None:
+        term_offsets = {}
+        scan_offsets(words, term_offsets)
+    with open(words + OFFSETS_SUFFIX, "w") as offsets_fh:
+        offsets_fh.write(words_file_stamp(words) + "\n")
+        for word, offset in term_offsets.items():
+            offsets_fh.write(word + " " + str(offset) + "\n")
+
+
+def write_positions_file(positions: str, words_to_docs_to_positions: dict):
+    """
+    Writes the positional index read by PositionalPostings
+    :param positions: the file that will get written to
+    :param words_to_docs_to_positions: the dictionary that provides words ->
+    ids -> ascending positions of the word in the document
+    :return: n/a
+    """
+    terms = sorted((word.encode("utf-8"), word)
+                   for word in words_to_docs_to_positions)
+    blocks = []
+    for _, word in terms:
+        docs_to_positions = words_to_docs_to_positions[word]
+        block = bytearray()
+        encode_varint(len(docs_to_positions), block)
+        previous = 0
+        for id in sorted(docs_to_positions):
+            encode_varint(id - previous, block)
+            encode_deltas(docs_to_positions[id], block)
+            previous = id
+        blocks.append(block)
+
+    term_start = WORDS_HEADER.size + POSITIONS_ENTRY.size * len(terms)
+    block_start = term_start + sum(len(t) for t, _ in terms)
+    with open(positions, "wb") as positions_fh:
+        positions_fh.write(WORDS_HEADER.pack(POSITIONS_MAGIC, len(terms)))
+        term_off, block_off = term_start, block_start
+        for (encoded, word), block in zip(terms, blocks):
+            positions_fh.write(POSITIONS_ENTRY.pack(
+                term_off, len(encoded), block_off,
+                len(words_to_docs_to_positions[word])))
+            term_off += len(encoded)
+            block_off += len(block)
+        for encoded, _ in terms:
+            positions_fh.write(encoded)
+        for block in blocks:
+            positions_fh.write(block)
+
+
+def packed(values: array):
+    """
+    returns the bytes of an array in little endian byte order
+    """
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def write_packed(fh, values: array):
+    """
+    writes an array to fh in little endian byte order
+    """
+    fh.write(packed(values))
+
+
+def write_graph_file(graph_fp: str, graph: LinkGraph):
+    """
+    Writes a LinkGraph so PageRank can be recomputed without reparsing the xml
+    :param graph_fp: the file that will get written to
+    :param graph: the link graph of the corpus
+    :return: n/a
+    """
+    with open(graph_fp, "wb") as graph_fh:
+        graph_fh.write(GRAPH_HEADER.pack(
+            GRAPH_MAGIC, len(graph), len(graph.targets)))
+        for values in (graph.ids, graph.offsets, graph.degrees,
+                       graph.links_to_all, graph.targets):
+            write_packed(graph_fh, array(values.typecode, values))
+
+
+def read_graph_file(graph_fp: str):
+    """
+    reads a LinkGraph written by write_graph_file
+    :param graph_fp: filepath to the graph file
+    :return: the LinkGraph
+    """
+    with open(graph_fp, "rb") as graph_fh:
+        magic, pages, targets = GRAPH_HEADER.unpack(
+            graph_fh.read(GRAPH_HEADER.size))
+        if magic != GRAPH_MAGIC:
+            raise ValueError(graph_fp + " is not a link graph file")
+        arrays = []
+        for typecode, count in (("q", pages), ("i", pages + 1),
+                                ("i", pages), ("b", pages), ("i", targets)):
+            values = array(typecode)
+            values.fromfile(graph_fh, count)
+            if sys.byteorder == "big":
+                values.byteswap()
+            arrays.append(values)
+    ids, offsets, degrees, links_to_all, targets = arrays
+    return LinkGraph(ids, offsets, targets, degrees, links_to_all)
+
+
+def is_binary_words_file(words: str):
+    """
+    checks whether words was written by write_words_binary or
+    write_words_compressed
+    :param words: filepath to the words file
+    :return: True if the file starts with a binary words header
+    """
+    with open(words, "rb") as words_fh:
+        return words_fh.read(len(WORDS_MAGIC)) in (WORDS_MAGIC,
+                                                   COMPRESSED_MAGIC)
+
+
+def binary_postings(words: str):
+    """
+    opens a binary words file with the mapping that reads its format
+    :param words: filepath to a file written by write_words_binary or
+    write_words_compressed
+    :return: BinaryPostings or CompressedPostings
+    """
+    with open(words, "rb") as words_fh:
+        compressed = words_fh.read(len(COMPRESSED_MAGIC)) == COMPRESSED_MAGIC
+    return CompressedPostings(words) if compressed else BinaryPostings(words)
+
+
+class BinaryPostings(Mapping):
+    """
+    Read-only words -> ids -> relevance mapping over a memory-mapped binary
+    words file. Nothing is decoded up front: a lookup binary searches the term
+    table and unpacks only that term's postings
+    """
+    MAGIC = WORDS_MAGIC
+    HEADER = WORDS_HEADER
+    ENTRY = WORDS_ENTRY
+    KIND = "binary words"
+
+    def __init__(self, words: str):
+        with open(words, "rb") as words_fh:
+            self.mm = mmap.mmap(words_fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.term_count = self.HEADER.unpack_from(self.mm, 0)[:2]
+        if magic != self.MAGIC:
+            raise ValueError(words + " is not a " + self.KIND + " file")
+
+    def entry(self, i: int):
+        """
+        returns (term bytes, postings offset, postings count, ...) of the i-th
+        term, followed by any other fields of its table entry
+        """
+        term_off, term_len, *fields = self.ENTRY.unpack_from(
+            self.mm, self.HEADER.size + self.ENTRY.size * i)
+        return (self.mm[term_off:term_off + term_len], *fields)
+
+    def find(self, word: str):
+        """
+        binary searches the term table for word
+        :return: (postings offset, postings count, ...), or None if absent
+        """
+        encoded = word.encode("utf-8")
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            term, *fields = self.entry(mid)
+            if term == encoded:
+                return fields
+            if term < encoded:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def postings(self, word: str):
+        """
+        decodes the postings of word into parallel id and relevance arrays
+        :return: (array of ids, array of relevances), or None if absent
+        """
+        found = self.find(word)
+        if found is None:
+            return None
+        post_off, count, _ = found
+        ids = array("i", self.mm[post_off:post_off + 4 * count])
+        relevances = array("f", self.mm[post_off + 4 * count:
+                                        post_off + 8 * count])
+        if sys.byteorder == "big":
+            ids.byteswap()
+            relevances.byteswap()
+        return ids, relevances
+
+    def max_relevance(self, word: str):
+        """
+        returns the highest relevance in the postings of word, or None if
+        absent
+        """
+        found = self.find(word)
+        return None if found is None else found[2]
+
+    def close(self):
+        """
+        unmaps the file
+        """
+        self.mm.close()
+
+    def __getitem__(self, word):
+        found = self.postings(word)
+        if found is None:
+            raise KeyError(word)
+        return dict(zip(*found))
+
+    def __contains__(self, word):
+        return self.find(word) is not None
+
+    def __iter__(self):
+        for i in range(self.term_count):
+            yield self.entry(i)[0].decode("utf-8")
+
+    def __len__(self):
+        return self.term_count
+
+
+class CompressedPostings(BinaryPostings):
+    """
+    Read-only words -> ids -> relevance mapping over a memory-mapped file
+    written by write_words_compressed. A lookup decodes the term's blocks and
+    scales its quantized relevances back
+    """
+    MAGIC = COMPRESSED_MAGIC
+    HEADER = COMPRESSED_HEADER
+    ENTRY = COMPRESSED_ENTRY
+    KIND = "compressed words"
+
+    def __init__(self, words: str):
+        super().__init__(words)
+        _, _, self.bits, block_size = self.HEADER.unpack_from(self.mm, 0)
+        if block_size != BLOCK_SIZE or self.bits not in SCORE_TYPES:
+            raise ValueError(words + " uses an unsupported block layout")
+        self.score_type = SCORE_TYPES[self.bits]
+        self.levels = (1 << self.bits) - 1
+
+    def postings(self, word: str):
+        """
+        decodes the postings of word
+        :return: (list of ids, list of relevances), or None if absent
+        """
+        found = self.find(word)
+        if found is None:
+            return None
+        post_off, count, scale = found
+        ids, quantized = decode_blocks(self.mm, post_off, count,
+                                       self.score_type)
+        return ids.tolist(), (quantized * scale).tolist()
+
+    def max_relevance(self, word: str):
+        """
+        returns the highest decoded relevance word can have, or None if
+        absent
+        """
+        found = self.find(word)
+        return None if found is None else found[2] * self.levels
+
+
+class ImpactPostings(BinaryPostings):
+    """
+    Read-only words -> ids -> relevance mapping over a memory-mapped file
+    written by RelevanceArrays.write_impact, whose postings are in impact
+    order, so the most important documents of a term can be read without
+    the rest
+    fusion: name of the fusion the postings are ordered by
+    """
+    MAGIC = IMPACT_MAGIC
+    HEADER = IMPACT_HEADER
+    ENTRY = IMPACT_ENTRY
+    KIND = "impact-ordered words"
+
+    def __init__(self, impact: str):
+        super().__init__(impact)
+        fusion = self.HEADER.unpack_from(self.mm, 0)[2]
+        self.fusion = fusion.rstrip(b"\0").decode("ascii")
+
+    def postings(self, word: str, limit=None):
+        """
+        decodes the first limit postings of word (all of them by default)
+        :return: (array of ids, array of relevances, array of fused scores),
+        highest fused score first, or None if absent
+        """
+        found = self.find(word)
+        if found is None:
+            return None
+        post_off, count = found
+        n = count if limit is None else min(limit, count)
+        relevances = array("d", self.mm[post_off:post_off + 8 * n])
+        fused_off = post_off + 8 * count
+        fused = array("d", self.mm[fused_off:fused_off + 8 * n])
+        ids_off = post_off + 16 * count
+        ids = array("i", self.mm[ids_off:ids_off + 4 * n])
+        if sys.byteorder == "big":
+            relevances.byteswap()
+            fused.byteswap()
+            ids.byteswap()
+        return ids, relevances, fused
+
+    def count(self, word: str):
+        """
+        returns the number of postings of word, or None if absent
+        """
+        found = self.find(word)
+        return None if found is None else found[1]
+
+    def __getitem__(self, word):
+        found = self.postings(word)
+        if found is None:
+            raise KeyError(word)
+        return dict(zip(found[0], found[1]))
+
+
+class PositionalPostings(BinaryPostings):
+    """
+    Read-only words -> ids -> positions mapping over a memory-mapped file
+    written by write_positions_file, decoding one term's block per lookup
+    """
+    MAGIC = POSITIONS_MAGIC
+    ENTRY = POSITIONS_ENTRY
+    KIND = "positions"
+
+    def postings(self, word: str):
+        """
+        decodes the positions of word in every doc that contains it
+        :return: dictionary of ids -> ascending positions, or None if absent
+        """
+        found = self.find(word)
+        if found is None:
+            return None
+        pos, _ = found
+        count, pos = decode_varint(self.mm, pos)
+        docs_to_positions = {}
+        id = 0
+        for _ in range(count):
+            gap, pos = decode_varint(self.mm, pos)
+            id += gap
+            docs_to_positions[id], pos = decode_deltas(self.mm, pos)
+        return docs_to_positions
+
+    def __getitem__(self, word):
+        found = self.postings(word)
+        if found is None:
+            raise KeyError(word)
+        return found
+
+
+class LazyPostings(Mapping):
+    """
+    Read-only words -> ids -> relevance mapping over a text words file. Only
+    the byte offset of every term is known up front (from the offsets sidecar
+    when it matches the file, otherwise from a scan); a term's line is read
+    and parsed the first time it is looked up, and the last cache_size parsed
+    terms are kept
+    """
+
+    def __init__(self, words: str, cache_size=LAZY_CACHE_SIZE):
+        self.term_offsets = {}
+        read_offsets_file(words, self.term_offsets)
+        self.words_fh = open(words, "rb")
+        self.encoding = locale.getpreferredencoding(False)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def postings(self, word: str):
+        """
+        parses the postings of word, or takes them from the cache
+        :return: (ids ascending, their relevances, max relevance), or None if
+        absent
+        """
+        offset = self.term_offsets.get(word)
+        if offset is None:
+            return None
+        with self.lock:
+            try:
+                found = self.cache[word]
+                self.cache.move_to_end(word)
+                self.hits += 1
+                return found
+            except KeyError:
+                self.misses += 1
+            self.words_fh.seek(offset)
+            line = self.words_fh.readline()
+
+        split = line.decode(self.encoding).strip().split(" ")
+        ids_to_relevance = {}
+        for i in range(1, len(split), 2):
+            ids_to_relevance[int(split[i])] = float(split[i + 1])
+        ids = sorted(ids_to_relevance)
+        relevances = [ids_to_relevance[j] for j in ids]
+        found = (ids, relevances, max(relevances, default=0.0))
+        with self.lock:
+            self.cache[word] = found
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return found
+
+    def max_relevance(self, word: str):
+        """
+        returns the highest relevance in the postings of word, or None if
+        absent
+        """
+        found = self.postings(word)
+        return None if found is None else found[2]
+
+    def stats(self):
+        """
+        returns the cache's hit/miss counts and sizes
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self.cache), "size": self.cache_size,
+                    "terms": len(self.term_offsets)}
+
+    def close(self):
+        """
+        closes the words file
+        """
+        self.words_fh.close()
+
+    def __getitem__(self, word):
+        found = self.postings(word)
+        if found is None:
+            raise KeyError(word)
+        return dict(zip(found[0], found[1]))
+
+    def __contains__(self, word):
+        return word in self.term_offsets
+
+    def __iter__(self):
+        return iter(self.term_offsets)
+
+    def __len__(self):
+        return len(self.term_offsets)
 
 
 def read_title_file(titles: str, ids_to_titles: dict):
@@ -56,15 +929,23 @@ def read_title_file(titles: str, ids_to_titles: dict):
     reads the id and titles written in titles into the ids_to_titles dictionary
     :param titles: the file name that contains ids and titles
     :param ids_to_titles: the dictionary that ids and title will get written into
-    :return: n/a
+    :return: the number of lines read, more than the ids kept when
+    append_title_file replaced or deleted some
     """
+    lines = 0
     with open(titles, "r") as titles_fh:
         for line in titles_fh:
             line = line.strip()
             if line == "":
                 continue
+            lines += 1
             split = line.split("::")
-            ids_to_titles[int(split[0])] = split[1]
+            if len(split) == 1:
+                # an id appended alone was deleted
+                ids_to_titles.pop(int(split[0]), None)
+            else:
+                ids_to_titles[int(split[0])] = split[1]
+    return lines
 
 
 def read_docs_file(docs: str, ids_to_pageranks: dict):
@@ -84,24 +965,136 @@ def read_docs_file(docs: str, ids_to_pageranks: dict):
                 ids_to_pageranks[int(split[0])] = float(split[1])
 
 
-def read_words_file(words: str, words_to_doc_relevance: dict):
+def read_links_file(links: str, page_to_linked_pages: dict):
+    """
+    reads the links written in links into page_to_linked_pages
+    :param links: filepath to the links file
+    :param page_to_linked_pages: the dictionary of titles -> linked titles
+    :return: the number of lines read, more than the titles kept when
+    append_links_file replaced some
+    """
+    lines = 0
+    with open(links, "r") as links_fh:
+        for line in links_fh:
+            line = line.rstrip("\n")
+            if line == "":
+                continue
+            lines += 1
+            split = line.split("::")
+            page_to_linked_pages[split[0]] = split[1:]
+    return lines
+
+
+def read_ids_file(ids_fp: str, ids: set):
+    """
+    reads the page ids written by write_ids_file into ids
+    :param ids_fp: filepath to the ids file
+    :param ids: the set the ids get added to
+    :return: n/a
+    """
+    with open(ids_fp, "r") as ids_fh:
+        for line in ids_fh:
+            line = line.strip()
+            if line != "":
+                ids.add(int(line))
+
+
+def read_manifest_file(manifest: str, segments: list):
+    """
+    reads the live segments written by write_manifest_file into segments
+    :param manifest: filepath to the manifest
+    :param segments: the list (segment name, number of pages) pairs get
+    appended to, oldest first
+    :return: n/a
+    """
+    with open(manifest, "r") as manifest_fh:
+        for line in manifest_fh:
+            split = line.split()
+            if len(split) == 2:
+                segments.append((split[0], int(split[1])))
+
+
+def read_stems_file(stems: str, words_to_stems: dict):
+    """
+    reads the words and stems written in stems into words_to_stems
+    :param stems: filepath to the stems file
+    :param words_to_stems: the dictionary that words and stems get written into
+    :return: n/a
+    """
+    with open(stems, "r") as stems_fh:
+        for line in stems_fh:
+            split = line.split()
+            if len(split) == 2:
+                words_to_stems[split[0]] = split[1]
+
+
+def read_words_file(words: str, words_to_doc_relevance: dict, parse=float):
     """
     reads in the term relevance written in words into words_to_doc_relevance dictionary
     :param words: the file name that the words_to_doc_frequency dictionary was written to
     :param words_to_doc_frequency: a double dictionary, where a word is a key to a dictionary
     in which an id is a key to a frequency
-    :return: n/a
+    :param parse: converts each written value (int for a counts file)
+    :return: the number of lines read, more than the words kept when
+    append_words_file replaced or deleted some
     """
+    lines = 0
     with open(words, "r") as words_fh:
         for line in words_fh:
             line = line.strip()
             if line == "":
                 continue
+            lines += 1
             split = line.split(" ")
             word = split[0]
+            # a word appended again replaces its earlier postings
+            words_to_doc_relevance.pop(word, None)
             for i in range(1, len(split), 2):
                 page_id = int(split[i])
-                relevance = float(split[i+1])
+                relevance = parse(split[i+1])
                 if word not in words_to_doc_relevance:
                     words_to_doc_relevance[word] = {}
                 words_to_doc_relevance[word][page_id] = relevance
+    return lines
+
+
+def read_dictionary_file(dictionary: str, terms: list, titles: list):
+    """
+    reads the term dictionary written by write_dictionary_file
+    :param dictionary: filepath to the dictionary file
+    :param terms: the list (term, document frequency, display word) entries
+    get appended to
+    :param titles: the list (id, pagerank, title) entries get appended to
+    :return: n/a
+    """
+    with open(dictionary, "r") as dictionary_fh:
+        term_count = int(dictionary_fh.readline())
+        for _ in range(term_count):
+            term, df, display = dictionary_fh.readline().split()
+            terms.append((term, int(df), display))
+        for line in dictionary_fh:
+            split = line.rstrip("\n").split(" ", 2)
+            if len(split) == 3:
+                titles.append((int(split[0]), float(split[1]), split[2]))
+
+
+def read_offsets_file(words: str, term_offsets: dict):
+    """
+    reads the byte offset of every term's line in a text words file from its
+    offsets sidecar, or scans the words file if the sidecar is missing or was
+    written for a different version of it
+    :param words: filepath to the words file
+    :param term_offsets: the dictionary terms -> offsets get written into
+    :return: n/a
+    """
+    try:
+        with open(words + OFFSETS_SUFFIX, "r") as offsets_fh:
+            if offsets_fh.readline().strip() == words_file_stamp(words):
+                for line in offsets_fh:
+                    split = line.split(" ")
+                    if len(split) == 2:
+                        term_offsets[split[0]] = int(split[1])
+                return
+    except FileNotFoundError:
+        pass
+    scan_offsets(words, term_offsets)
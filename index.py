@@ -1,214 +1,292 @@
 import math
-import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
 from xml.dom.minidom import Element
 import xml.etree.ElementTree as et
-from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer
 import sys
 import file_io
+import pagerank
+import stemming
+import tokenizer
+from link_graph import LinkGraphBuilder
+from metrics import Metrics, profiled
+from relevance import FUSIONS, RelevanceArrays
+from title_index import ALL_PAGES, TitleIndex
 
 
 class Indexer:
 
-    STOP_WORDS = set(stopwords.words('english'))
+    STOP_WORDS = tokenizer.STOP_WORDS
 
-    def __init__(self, xml_fp, titles_fp, docs_fp, words_fp):
+    def __init__(self, xml_fp, titles_fp, docs_fp, words_fp, streaming=False,
+                 binary=False, workers=1, stems_fp=None, counts_fp=None,
+                 links_fp=None, graph_fp=None, positions_fp=None,
+                 arrays=False, rank_options=None, compressed=None,
+                 impact_fp=None, fusion="product", dictionary_fp=None):
+        # time, CPU and memory of each indexing phase, and corpus counts
+        self.metrics = Metrics()
         try:
-            self.root: Element = et.parse(xml_fp).getroot()
-            self.all_pages: et.ElementTree = self.root.findall("page")
+            self.workers = workers
+            # the words stemmed while parsing, kept when the stems are saved
+            # or the dictionary shows terms as words
+            self.words_to_stems = None
+            if stems_fp is not None or dictionary_fp is not None:
+                self.words_to_stems = {}
+            # compute tf-idf over flat arrays (RelevanceArrays) instead of
+            # filling relevance_dict
+            self.arrays = arrays
+            self.relevance_arrays = None
+            # keyword arguments of pagerank.page_rank (method, damping, tol...)
+            self.rank_options = rank_options or {}
+            if streaming:
+                # pages are read (and released) one at a time while parsing
+                self.all_pages = self.iter_pages(xml_fp)
+            else:
+                with self.timed("load"):
+                    self.root: Element = et.parse(xml_fp).getroot()
+                    self.all_pages: et.ElementTree = self.root.findall("page")
+            self.streaming = streaming
             self.number_of_documents = 0  # our n value
             self.ids_to_titles = {}
             self.ids_to_pageranks = {}
             self.relevance_dict = {}
+            self.words_to_docs_to_count = {}
+            # word positions are only collected for a positional index
+            self.words_to_docs_to_positions = \
+                {} if positions_fp is not None else None
+            self.link_builder = LinkGraphBuilder()
+            self.link_graph = None
 
             # parse xml file
             self.parse_xml()
 
             # write to files
-            file_io.write_title_file(titles_fp, self.ids_to_titles)
-            file_io.write_docs_file(docs_fp, self.ids_to_pageranks)
-            file_io.write_words_file(words_fp, self.relevance_dict)
+            with self.timed("write"):
+                file_io.write_title_file(titles_fp, self.ids_to_titles)
+                file_io.write_docs_file(docs_fp, self.ids_to_pageranks)
+                if compressed is not None:
+                    # delta + bit-packed ids, relevances quantized to
+                    # compressed (8 or 16) bits
+                    if self.relevance_arrays is not None:
+                        self.relevance_arrays.write_compressed(
+                            words_fp, compressed)
+                    else:
+                        file_io.write_words_compressed(
+                            words_fp, self.relevance_dict, compressed)
+                elif self.relevance_arrays is not None:
+                    if binary:
+                        self.relevance_arrays.write_binary(words_fp)
+                    else:
+                        self.relevance_arrays.write_text(words_fp)
+                elif binary:
+                    file_io.write_words_binary(words_fp, self.relevance_dict)
+                else:
+                    file_io.write_words_file(words_fp, self.relevance_dict,
+                                             offsets=True)
+
+                # keep the raw counts and links so update.py can apply deltas
+                # without reparsing the whole corpus
+                if counts_fp is not None:
+                    file_io.write_words_file(
+                        counts_fp, self.words_to_docs_to_count)
+                if links_fp is not None:
+                    file_io.write_links_file(
+                        links_fp, self.link_builder.page_links())
+                # postings ordered by fused relevance and rank, for the
+                # querier's approximate mode
+                if impact_fp is not None:
+                    relevance_arrays = self.relevance_arrays
+                    if relevance_arrays is None:
+                        relevance_arrays = RelevanceArrays.from_relevance(
+                            self.relevance_dict)
+                    relevance_arrays.write_impact(
+                        impact_fp, self.ids_to_pageranks, fusion)
+                # vocabulary and titles for completion and spelling
+                # correction
+                if dictionary_fp is not None:
+                    self.write_dictionary(dictionary_fp)
+                # positional index for phrase and proximity queries
+                if positions_fp is not None:
+                    file_io.write_positions_file(
+                        positions_fp, self.words_to_docs_to_positions)
+                # keep the link graph so PageRank can be rerun on its own
+                if graph_fp is not None:
+                    file_io.write_graph_file(graph_fp, self.link_graph)
+
+                # persist the stems seen while indexing so querying starts warm
+                if stems_fp is not None:
+                    # stems computed in worker processes join the cache
+                    stemming.STEM_CACHE.add(self.words_to_stems)
+                    stemming.STEM_CACHE.save(stems_fp)
 
         except FileNotFoundError:
             print("Entered incorrect filepath! Please try again.")
 
-    def parse_xml(self):
-        """ parses xml_fp and populates all instance variables
+    def write_dictionary(self, dictionary_fp):
+        """writes the index terms with their document frequencies, and the
+        titles with their pageranks, to dictionary_fp. A term is shown as the
+        shortest word of the corpus that stems to it
+
+        Parameters:
+        dictionary_fp (str): filepath of the dictionary file
+        """
+        if self.relevance_arrays is not None:
+            terms_to_df = self.relevance_arrays.document_frequencies()
+        else:
+            terms_to_df = {term: len(docs)
+                           for term, docs in self.relevance_dict.items()}
+        surface = stemming.surface_words(self.words_to_stems)
+        file_io.write_dictionary_file(
+            dictionary_fp,
+            [(term, df, surface.get(term, term))
+             for term, df in terms_to_df.items()],
+            [(id_num, self.ids_to_pageranks.get(id_num, 0.0), title)
+             for id_num, title in self.ids_to_titles.items()])
+
+    def timed(self, phase):
+        """returns a context manager that adds the time spent inside its
+        with block to phase in self.metrics
         """
+        return self.metrics.phase(phase)
 
-        # ids_to_titles = {}
-        n_regex = '''\[\[[^\[]+?\]\]|[a-zA-Z0-9]+'[a-zA-Z0-9]+|[a-zA-Z0-9]+'''
-        words_to_docs_to_count = {}
-        page_to_linked_pages = {}
+    @property
+    def timings(self):
+        """seconds of wall time spent in each indexing phase
+        """
+        return self.metrics.wall_times()
 
-        for page in self.all_pages:
-            # populate ids_to_titles
-            title: str = page.find('title').text.strip().lower()
-            id: int = int(page.find('id').text)
-            self.ids_to_titles[id] = title
+    def iter_pages(self, xml_fp):
+        """yields the <page> elements of xml_fp one at a time (see
+        iter_pages)
+        """
+        yield from iter_pages(xml_fp)
 
-            # tokenize data
-            try:
-                t = re.findall(n_regex, page.find('text').text)
-                t += re.findall(n_regex, page.find('title').text)
-                tokens = [x.strip() for x in t]
-            except TypeError:
-                tokens = []
-
-            link_count = 0
-
-            for word in tokens:
-                # tokenize the word
-                return_list = []
-                pg_list = []  # tokenized word for use in page rank
-                stemmer = PorterStemmer()  # instantiate stemmer
-
-                # check if word is a link and handle appropriately based on
-                # contents of word
-                if '[[' and ']]' in word:
-                    link_count += 1
-                    word = word.replace('[[', '').replace(']]', '')
-                    pg_list = word
-
-                    if ":" in word:
-                        # strip, remove stop words
-                        return_list = [i.strip().lower() for i in word.split(
-                            ":") if i not in self.STOP_WORDS and i.strip(
-                        ) != ""]
-
-                        # remove spaces in words
-                        for i in return_list:
-                            z = i.split()
-                            z = [j.strip() for j in z if j.strip() != ""]
-                            return_list = z + return_list
-                            return_list.remove(i)
-
-                        # remove newlines in words
-                        for i in return_list:
-                            z = i.split("\n")
-                            z = [k.strip() for k in z if k.strip() != ""]
-                            return_list = z + return_list
-                            return_list.remove(i)
-
-                        # strip, remove stop words
-                        return_list = [i.strip()
-                                       for i in return_list if i.strip() != ""]
-
-                        # handle pipes after splitting on colon
-                        for i in return_list:
-                            if "|" in i:
-                                ind = i.index("|")
-                                words = i[ind + 1:]
-                                words = [i.strip().lower(
-                                ) for i in words if i.strip().lower(
-                                ) not in self.STOP_WORDS and i.strip(
-                                ).lower() != ""]
-                                return_list = words + return_list
-
-                    # handle pipes if colon is not in word
-                    if "|" in word:
-                        ind = word.index("|")
-
-                        # don't include words before pipe
-                        return_list = word[ind + 1:]
-
-                        # strip, remove stop words
-                        return_list = [i.strip().lower(
-                        ) for i in return_list if i.strip().lower(
-                        ) not in self.STOP_WORDS and i.strip().lower() != ""]
-
-                        pg_list = word.split("|")
-                        pg_list = pg_list[0]
-
-                    # stem words in return_list
-                    return_list = [stemmer.stem(
-                        i) for i in return_list if stemmer.stem(i) != ""]
-
-                    # handle KeyError when inner dictionary key does not exist
-                    try:
-                        page_to_linked_pages[title]
-                    except KeyError:
-                        page_to_linked_pages[title] = []
+    def tokenized_pages(self):
+        """yields tokenize_page results for every page in corpus order,
+        spreading the tokenizing over self.workers processes when asked to
 
-                    # add titles of linked pages
-                    page_to_linked_pages[title].append(pg_list.strip().lower())
+        Returns:
+        generator of tokenize_page results
+        """
+        pages = (page_fields(page) for page in self.all_pages)
+        positions = self.words_to_docs_to_positions is not None
+        if self.workers <= 1:
+            yield from map(partial(tokenize_page, positions=positions,
+                                   words_to_stems=self.words_to_stems), pages)
+            return
+
+        # workers stem with their own caches, so the stems are sent back
+        # when the parent needs them
+        keep_stems = self.words_to_stems is not None
+        tokenize = partial(tokenize_page_stems if keep_stems else
+                           tokenize_page, positions=positions)
+        with ProcessPoolExecutor(self.workers) as executor:
+            # hand out bounded batches so a streamed corpus is never held in
+            # memory all at once; map keeps each batch in corpus order
+            batch = list(islice(pages, PAGE_BATCH))
+            while batch:
+                results = executor.map(
+                    tokenize, batch,
+                    chunksize=max(1, len(batch) // (4 * self.workers)))
+                batch = list(islice(pages, PAGE_BATCH))
+                if not keep_stems:
+                    yield from results
+                    continue
+                for result, words_to_stems in results:
+                    self.words_to_stems.update(words_to_stems)
+                    yield result
 
-                else:  # handling word if it is not a link
-                    word = word.strip().lower()
-                    word = stemmer.stem(word)
+    def parse_xml(self):
+        """ parses xml_fp and populates all instance variables
+        """
+        words_to_docs_to_count = self.words_to_docs_to_count
+        stem_seconds = stemming.STEM_CACHE.seconds
+        tokens = 0
 
-                    if word not in self.STOP_WORDS:
-                        return_list = [word]
-                    else:
-                        return_list = []
+        with self.timed("parse"):
+            for title, id, words_to_count, links, words_to_positions in \
+                    self.tokenized_pages():
+                # populate ids_to_titles
+                self.ids_to_titles[id] = title
+                tokens += sum(words_to_count.values())
 
                 # populate words_to_docs_to_count
-                for i in return_list:
-                    if i != ":" and i != "|":
-                        # handle KeyErrors when inner dict key does not exist
-                        try:
-                            words_to_docs_to_count[i]
-                        except KeyError:
-                            words_to_docs_to_count[i] = {}
-                        try:
-                            words_to_docs_to_count[i][id] += 1
-                        except KeyError:
-                            words_to_docs_to_count[i][id] = 1
-
-            # check if the page has any links:
-            if link_count == 0:
-                page_to_linked_pages[title] = [
-                    i.find('title').text.strip().lower(
-                    ) for i in self.all_pages if i != page]
+                for word, count in words_to_count.items():
+                    # handle KeyErrors when inner dict key does not exist
+                    try:
+                        words_to_docs_to_count[word]
+                    except KeyError:
+                        words_to_docs_to_count[word] = {}
+                    try:
+                        words_to_docs_to_count[word][id] += count
+                    except KeyError:
+                        words_to_docs_to_count[word][id] = count
+
+                # populate words_to_docs_to_positions, if it is being kept
+                if words_to_positions is not None:
+                    for word, positions in words_to_positions.items():
+                        docs = self.words_to_docs_to_positions.setdefault(
+                            word, {})
+                        # a repeated id keeps the positions of both pages
+                        docs[id] = sorted(docs.get(id, []) + positions)
+
+                # record the page's links as integers; a page without valid
+                # links links to every other page (see get_valid_links)
+                self.link_builder.add_page(id, title, links)
+        if self.workers <= 1:
+            # the part of parse spent computing stems; worker processes stem
+            # with their own caches, which are not seen here
+            self.metrics.record(
+                "stem", stemming.STEM_CACHE.seconds - stem_seconds)
 
         # set number of documents in the corpus
         self.number_of_documents = len(self.ids_to_titles)
 
         # populate relevance dictionary
-        self.fill_relevancy(words_to_docs_to_count)
+        with self.timed("fill_relevancy"):
+            if self.arrays:
+                self.relevance_arrays = RelevanceArrays.from_counts(
+                    words_to_docs_to_count, self.number_of_documents)
+            else:
+                self.fill_relevancy(words_to_docs_to_count)
 
         # populate pageranks for each document in the corpus
-        self.ids_to_pageranks = self.page_rank(self.calculate_weights(
-            self.get_valid_links(page_to_linked_pages, self.all_pages)))
-
-    def get_valid_links(self, page_links, all_pages):
+        with self.timed("build_links"):
+            self.link_graph = self.link_builder.build(self.ids_to_titles)
+        with self.timed("page_rank"):
+            history = self.rank_options.get("history", [])
+            self.ids_to_pageranks = pagerank.page_rank(
+                self.link_graph, **dict(self.rank_options, history=history))
+
+        self.metrics.count("pages", self.number_of_documents)
+        self.metrics.count("tokens", tokens)
+        self.metrics.count("unique_terms", len(words_to_docs_to_count))
+        self.metrics.count("links", len(self.link_graph.targets))
+        self.metrics.count("pagerank_iterations", len(history))
+
+    def get_valid_links(self, page_links, titles=None):
         """returns a modified list of page_to_linked_pages
         so that only valid links are included in the linking associations.
         
         Parameters:
         page_links (dict): the dictionary that maps all the pages in the corpus 
         to their linked pages
-        all_pages (list):  the root of the xml file
+        titles (TitleIndex): the title index of the corpus, built from
+        ids_to_titles if not given
 
         Returns:
-        the dictionary that maps pages to an array of pages it links to that 
-        only contains valid links
+        the dictionary that maps pages to the distinct pages they link to that
+        are in the corpus, or to ALL_PAGES for pages that only link to
+        themselves or to pages outside the corpus
         """
+        if titles is None:
+            titles = TitleIndex(self.ids_to_titles)
+
         valid_links = {}  # the new dictionary that only contains the valid 
         # links
-
         for pg in page_links:
-            page_links[pg] = list(set(page_links[pg]))  # remove duplicates
-            valid_links[pg] = []
-            for link in page_links[pg]:
-
-                # only adds links to titles in the corpus
-                if link in self.ids_to_titles.values():
-                    valid_links[pg].append(link)
-
-            # if page only links to itself
-            if len(page_links[pg]) == 1 and pg in page_links[pg]:
-                valid_links[pg] = [
-                    x.find('title').text.strip().lower() for x in all_pages]
-                valid_links[pg].remove(pg)
-
-            # if valid is empty after removing invalid links (page only links to
-            # those outside the corpus)
-            elif len(valid_links[pg]) == 0:
-                valid_links[pg] = [
-                    x.find('title').text.strip().lower() for x in all_pages]
-                valid_links[pg].remove(pg)
-
+            valid_links[pg] = titles.valid_links(pg, page_links[pg])
         return valid_links
 
     def fill_relevancy(self, dict):
@@ -280,11 +358,12 @@ class Indexer:
 
     def calculate_weights(self, link_dict):
         """Calculates the weights (the pageRank authority) per document in the 
-        corpus
+        corpus. This is the dense N x N reference for the sparse engine in
+        pagerank.py
 
         Parameters:
         link_dict (dict): the dictionary that maps page titles to titles of 
-        pages it links to 
+        pages it links to (or ALL_PAGES), as returned by get_valid_links
 
         Returns:
         (int): the max occurences of the most prevalent term in the document
@@ -293,13 +372,22 @@ class Indexer:
 
         weight_dict = {}
         for page in self.ids_to_titles:
+            links = link_dict[self.ids_to_titles[page]]
+            if links is ALL_PAGES:
+                nk = self.number_of_documents - 1
+            else:
+                links = set(links)
+                nk = len(links)
             for i in self.ids_to_titles:
                 try:
                     weight_dict[page]
                 except KeyError:
                     weight_dict[page] = {}
-                if self.ids_to_titles[i] in link_dict[self.ids_to_titles[page]]:
-                    nk = len(link_dict[self.ids_to_titles[page]])
+                if links is ALL_PAGES:
+                    linked = i != page
+                else:
+                    linked = self.ids_to_titles[i] in links
+                if linked:
                     weight_dict[page][i] = (
                         0.15 / self.number_of_documents) + (0.85 / nk)
                 else:
@@ -349,18 +437,214 @@ class Indexer:
         return rp
 
 
+PAGE_BATCH = 512  # pages handed to the worker pool at a time
+
+
+def iter_pages(xml_fp):
+    """yields the <page> elements of xml_fp one at a time using iterparse,
+    clearing each page once it has been handled so that the parsed tree
+    never holds more than a single page
+
+    Parameters:
+    xml_fp (str): filepath to the wiki xml
+
+    Returns:
+    generator of page elements
+    """
+    context = et.iterparse(xml_fp, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event == "end" and elem.tag == "page":
+            yield elem
+            # drop the finished page (and its children) from the tree
+            elem.clear()
+            root.clear()
+
+
+def page_fields(page):
+    """returns the raw (title, id, text) strings of a page element, which is
+    all tokenize_page needs and can be sent to worker processes
+    """
+    return (page.find('title').text, page.find('id').text,
+            page.find('text').text)
+
+
+def tokenize_page(fields, positions=False, words_to_stems=None):
+    """ tokenizes and stems one page with tokenizer.tokenize. This is the
+    per-page work of Indexer.parse_xml and has no shared state, so pages can
+    be tokenized in worker processes and merged in corpus order
+
+    Parameters:
+    fields (tuple): the raw (title, id, text) of the page
+    positions (bool): whether to record the position of every word. Each
+    indexed word takes one position, and a token that indexes nothing (a stop
+    word or a plain link) still takes one, so phrases keep their gaps
+    words_to_stems (dict): optional dictionary the page's lowercase words
+    are recorded in, with their stems
+
+    Returns:
+    (title, id, words_to_count, links, words_to_positions): the page's
+    lowercase title and id, its stemmed words mapped to their counts in
+    first-occurrence order, the titles of the pages it links to, and its
+    words mapped to their ascending positions (None unless asked for)
+    """
+    raw_title, raw_id, text = fields
+    title: str = raw_title.strip().lower()
+    id: int = int(raw_id)
+    words_to_count = {}
+    links = []
+    words_to_positions = {} if positions else None
+    position = 0
+
+    for term, is_link_target in tokenizer.tokenize(text, raw_title,
+                                                   words_to_stems):
+        if is_link_target:
+            links.append(term)
+            continue
+        if term is not None:
+            try:
+                words_to_count[term] += 1
+            except KeyError:
+                words_to_count[term] = 1
+            if positions:
+                try:
+                    words_to_positions[term].append(position)
+                except KeyError:
+                    words_to_positions[term] = [position]
+        position += 1
+
+    return title, id, words_to_count, links, words_to_positions
+
+
+def tokenize_page_stems(fields, positions=False):
+    """ tokenize_page for a worker process, which also returns the words
+    the page was stemmed from, as the worker's stem cache is not seen by the
+    parent
+
+    Returns:
+    (tokenize_page result, dictionary of the page's words -> stems)
+    """
+    words_to_stems = {}
+    return tokenize_page(fields, positions, words_to_stems), words_to_stems
+
+
 # REPL
 if __name__ == "__main__":
+    args = sys.argv[1:]
+    state = "--state" in args  # write counts, links and graph files
+    if state:
+        args.remove("--state")
+    streaming = "--streaming" in args
+    if streaming:
+        args.remove("--streaming")
+    binary = "--binary" in args
+    if binary:
+        args.remove("--binary")
+    arrays = "--arrays" in args  # vectorized tf-idf
+    if arrays:
+        args.remove("--arrays")
+    compressed = None
+    if "--compressed" in args:
+        pos = args.index("--compressed")
+        try:
+            compressed = int(args[pos + 1])
+            if compressed not in file_io.SCORE_TYPES:
+                raise ValueError
+        except (IndexError, ValueError):
+            print("--compressed needs 8 or 16 bits per relevance.")
+            sys.exit()
+        del args[pos:pos + 2]
+    workers = 1
+    if "--workers" in args:
+        pos = args.index("--workers")
+        try:
+            workers = int(args[pos + 1])
+        except (IndexError, ValueError):
+            print("--workers needs a number of processes.")
+            sys.exit()
+        del args[pos:pos + 2]
+    positions_fp = None
+    if "--positions" in args:
+        pos = args.index("--positions")
+        try:
+            positions_fp = args[pos + 1]
+        except IndexError:
+            print("--positions needs a filepath.")
+            sys.exit()
+        del args[pos:pos + 2]
+    stems_fp = None
+    if "--stems" in args:
+        pos = args.index("--stems")
+        try:
+            stems_fp = args[pos + 1]
+        except IndexError:
+            print("--stems needs a filepath.")
+            sys.exit()
+        del args[pos:pos + 2]
+    # --impact FILE writes impact-ordered postings, sorted by the --fusion
+    # (see relevance.FUSIONS) of relevance and pagerank
+    impact_fp = None
+    fusion = "product"
+    try:
+        if "--impact" in args:
+            pos = args.index("--impact")
+            impact_fp = args[pos + 1]
+            del args[pos:pos + 2]
+        if "--fusion" in args:
+            pos = args.index("--fusion")
+            fusion = args[pos + 1]
+            if fusion not in FUSIONS:
+                raise ValueError
+            del args[pos:pos + 2]
+    except (IndexError, ValueError):
+        print("--impact needs a filepath, and --fusion one of",
+              ", ".join(FUSIONS) + ".")
+        sys.exit()
+    # --dictionary FILE writes the terms and titles the querier completes
+    # and spell-corrects queries from
+    dictionary_fp = None
+    if "--dictionary" in args:
+        pos = args.index("--dictionary")
+        try:
+            dictionary_fp = args[pos + 1]
+        except IndexError:
+            print("--dictionary needs a filepath.")
+            sys.exit()
+        del args[pos:pos + 2]
+    # --metrics FILE writes the build metrics (Prometheus text for a .prom
+    # file, json otherwise); --profile and --tracemalloc FILE capture a
+    # cProfile dump and an allocation report of the build
+    outputs = {"--metrics": None, "--profile": None, "--tracemalloc": None}
+    for flag in outputs:
+        if flag in args:
+            pos = args.index(flag)
+            try:
+                outputs[flag] = args[pos + 1]
+            except IndexError:
+                print(flag, "needs a filepath.")
+                sys.exit()
+            del args[pos:pos + 2]
     try:
-        if len(sys.argv) - 1 < 4:
+        if len(args) < 4:
             raise IOError
-        elif len(sys.argv) - 1 > 4:
+        elif len(args) > 4:
             raise IOError
         else:
-            i = Indexer(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
+            with profiled(outputs["--profile"], outputs["--tracemalloc"]):
+                i = Indexer(args[0], args[1], args[2], args[3],
+                            streaming=streaming, binary=binary,
+                            workers=workers, stems_fp=stems_fp,
+                            counts_fp=args[3] + ".counts" if state else None,
+                            links_fp=args[3] + ".links" if state else None,
+                            graph_fp=args[3] + ".graph" if state else None,
+                            positions_fp=positions_fp, arrays=arrays,
+                            compressed=compressed, impact_fp=impact_fp,
+                            fusion=fusion, dictionary_fp=dictionary_fp)
+            if outputs["--metrics"] is not None:
+                i.metrics.write(outputs["--metrics"], "search_index")
     except FileNotFoundError:
         print("File not found!")
         sys.exit()
     except IOError:
-        print(len(sys.argv) - 1, "args entered. Please enter 4.")
+        print(len(args), "args entered. Please enter 4.")
         sys.exit()
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""
+Compact link graph of the corpus. Links are stored as integer page positions
+in CSR layout (an offsets array and a targets array per graph) instead of
+per-page lists of title strings, and pages that link to every other page are
+flagged rather than materialized
+"""
+from array import array
+from title_index import ALL_PAGES, TitleIndex
+
+
+class LinkGraph:
+    """
+    Out-links of pages 0..n-1 (corpus order) in CSR layout
+    ids: page ids by position
+    offsets: the links of page k are targets[offsets[k]:offsets[k + 1]]
+    degrees: the n_k that weights each of page k's links in PageRank
+    links_to_all: 1 for pages that link to every other page, which store no
+    targets
+    """
+    __slots__ = ("ids", "offsets", "targets", "degrees", "links_to_all")
+
+    def __init__(self, ids, offsets, targets, degrees, links_to_all):
+        self.ids = ids
+        self.offsets = offsets
+        self.targets = targets
+        self.degrees = degrees
+        self.links_to_all = links_to_all
+
+    def __len__(self):
+        return len(self.ids)
+
+    def links(self, pos: int):
+        """
+        returns the positions page pos links to, or ALL_PAGES
+        """
+        if self.links_to_all[pos]:
+            return ALL_PAGES
+        return self.targets[self.offsets[pos]:self.offsets[pos + 1]]
+
+    @classmethod
+    def from_page_links(cls, ids_to_titles: dict, page_links: dict,
+                        titles=None):
+        """
+        builds the graph from a dictionary of titles -> linked titles (such
+        as a links file), resolving every link through the corpus's
+        TitleIndex with the rules of Indexer.get_valid_links
+        :param ids_to_titles: dictionary of ids -> titles, in corpus order
+        :param page_links: dictionary of titles -> titles they link to
+        :param titles: the TitleIndex of ids_to_titles, built if not given
+        :return: LinkGraph over the pages of ids_to_titles
+        """
+        if titles is None:
+            titles = TitleIndex(ids_to_titles)
+
+        graph = cls(array("q", titles.ids), array("i", [0]), array("i"),
+                    array("i"), array("b"))
+        for id_num in titles.ids:
+            title = ids_to_titles[id_num]
+            positions, degree = titles.resolve(
+                title, page_links.get(title, []))
+            graph.append(positions, degree)
+        return graph
+
+    def append(self, positions, degree: int):
+        """
+        adds the next page's links: a list of positions, or ALL_PAGES
+        """
+        self.degrees.append(degree)
+        self.links_to_all.append(positions is ALL_PAGES)
+        if positions is not ALL_PAGES:
+            self.targets.extend(positions)
+        self.offsets.append(len(self.targets))
+
+
+class LinkGraphBuilder:
+    """
+    Collects the links of each page as it is parsed. Titles are interned to
+    integers on first sight, so links are stored as integers even before the
+    page they point to has been read; build resolves them to page positions
+    once the whole corpus is known
+    """
+    __slots__ = ("titles", "title_numbers", "page_ids", "page_titles",
+                 "offsets", "targets")
+
+    def __init__(self):
+        self.titles = []  # title number -> title
+        self.title_numbers = {}  # title -> title number
+        self.page_ids = array("q")
+        self.page_titles = array("i")
+        self.offsets = array("i", [0])
+        self.targets = array("i")
+
+    def intern(self, title: str):
+        """
+        returns the number of title, assigning the next one if it is new
+        """
+        try:
+            return self.title_numbers[title]
+        except KeyError:
+            self.title_numbers[title] = len(self.titles)
+            self.titles.append(title)
+            return len(self.titles) - 1
+
+    def add_page(self, id: int, title: str, links):
+        """
+        records a page and the titles it links to
+        """
+        self.page_ids.append(id)
+        self.page_titles.append(self.intern(title))
+        self.targets.extend(self.intern(link) for link in links)
+        self.offsets.append(len(self.targets))
+
+    def page_links(self):
+        """
+        returns the dictionary of titles -> linked titles (as written to a
+        links file) of the recorded pages
+        """
+        page_to_linked_pages = {}
+        for page, title_number in enumerate(self.page_titles):
+            page_to_linked_pages[self.titles[title_number]] = [
+                self.titles[link] for link in
+                self.targets[self.offsets[page]:self.offsets[page + 1]]]
+        return page_to_linked_pages
+
+    def build(self, ids_to_titles: dict):
+        """
+        resolves the recorded links to page positions, applying the rules of
+        Indexer.get_valid_links: duplicate links are dropped, links outside
+        the corpus are ignored, and a page that only links to itself or has no
+        valid links links to every other page
+        :param ids_to_titles: dictionary of ids -> titles, in corpus order
+        :return: LinkGraph over the pages of ids_to_titles
+        """
+        ids = list(ids_to_titles)
+        numbers = [self.intern(ids_to_titles[id_num]) for id_num in ids]
+        positions_by_number = [[] for _ in self.titles]
+        for pos, title_number in enumerate(numbers):
+            positions_by_number[title_number].append(pos)
+
+        # the last recorded version of each page id
+        pages = {}
+        for page, id_num in enumerate(self.page_ids):
+            pages[id_num] = page
+
+        graph = LinkGraph(array("q", ids), array("i", [0]), array("i"),
+                          array("i"), array("b"))
+        for id_num in ids:
+            page = pages[id_num]
+            title_number = self.page_titles[page]
+            links = set(self.targets[self.offsets[page]:
+                                     self.offsets[page + 1]])
+            valid = sorted(link for link in links if positions_by_number[link])
+            if (len(links) == 1 and title_number in links) or len(valid) == 0:
+                graph.append(ALL_PAGES, len(ids) - 1)
+            else:
+                positions = []
+                for link in valid:
+                    positions.extend(positions_by_number[link])
+                graph.append(positions, len(valid))
+        return graph
@@ -0,0 +1,184 @@
+"""
+Build and query instrumentation. A Metrics object accumulates the wall time,
+CPU time and peak resident set size of named phases together with plain
+counts (pages, tokens, PageRank iterations...), and exports them as json or
+as Prometheus text exposition so dashboards can track them across runs.
+profiled wraps a block in cProfile and/or tracemalloc for a closer look
+"""
+import cProfile
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+TRACEMALLOC_TOP = 25  # allocation sites listed in a tracemalloc report
+
+
+def peak_rss():
+    """
+    returns the peak resident set size of this process so far in bytes, or
+    None where the platform does not report it
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Metrics:
+    """
+    Per-phase timings and counts of one Indexer or Querier
+    phases: name -> {"calls", "wall_s", "cpu_s", "peak_rss_bytes"}, where the
+    times add up over every call and peak_rss_bytes is the process's peak
+    when the phase last ended
+    counts: name -> number
+    CPU time is that of the thread running the phase, so work done in worker
+    processes is not included
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        adds the wall and CPU time spent inside the with block to phase name
+        """
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - wall,
+                        time.thread_time() - cpu)
+
+    def record(self, name: str, wall_s: float, cpu_s=None):
+        """
+        adds one call of phase name that was timed elsewhere
+        """
+        rss = peak_rss()
+        with self.lock:
+            phase = self.phases.setdefault(name, {"calls": 0, "wall_s": 0.0})
+            phase["calls"] += 1
+            phase["wall_s"] += wall_s
+            if cpu_s is not None:
+                phase["cpu_s"] = phase.get("cpu_s", 0.0) + cpu_s
+            if rss is not None:
+                phase["peak_rss_bytes"] = rss
+
+    def count(self, name: str, n=1):
+        """
+        adds n to count name
+        """
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def wall_times(self):
+        """
+        returns phase name -> total wall seconds
+        """
+        with self.lock:
+            return {name: phase["wall_s"]
+                    for name, phase in self.phases.items()}
+
+    def to_dict(self):
+        """
+        returns the phases, counts and current peak RSS as one dictionary
+        """
+        with self.lock:
+            return {"phases": {name: dict(phase)
+                               for name, phase in self.phases.items()},
+                    "counts": dict(self.counts),
+                    "peak_rss_bytes": peak_rss()}
+
+    def to_json(self):
+        """
+        returns to_dict as indented json
+        """
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self, prefix: str):
+        """
+        returns the metrics in Prometheus text exposition format, every name
+        starting with prefix (e.g. "search_index")
+        """
+        metrics = self.to_dict()
+        lines = []
+
+        def gauge(name, samples, help_text):
+            lines.append("# HELP %s_%s %s" % (prefix, name, help_text))
+            lines.append("# TYPE %s_%s gauge" % (prefix, name))
+            for labels, value in samples:
+                lines.append("%s_%s%s %r" % (prefix, name, labels, value))
+
+        phases = sorted(metrics["phases"].items())
+        for key, name, help_text in [
+                ("calls", "phase_calls", "times the phase ran"),
+                ("wall_s", "phase_wall_seconds", "wall time of the phase"),
+                ("cpu_s", "phase_cpu_seconds", "CPU time of the phase"),
+                ("peak_rss_bytes", "phase_peak_rss_bytes",
+                 "peak resident set size when the phase ended")]:
+            samples = [('{phase="%s"}' % phase_name, phase[key])
+                       for phase_name, phase in phases if key in phase]
+            if samples:
+                gauge(name, samples, help_text)
+        for name, value in sorted(metrics["counts"].items()):
+            gauge(name, [("", value)], name.replace("_", " "))
+        if metrics["peak_rss_bytes"] is not None:
+            gauge("peak_rss_bytes", [("", metrics["peak_rss_bytes"])],
+                  "peak resident set size of the process")
+        return "\n".join(lines) + "\n"
+
+    def write(self, metrics_fp: str, prefix: str):
+        """
+        writes the metrics to metrics_fp, as Prometheus text if its name ends
+        in .prom and as json otherwise
+        """
+        with open(metrics_fp, "w") as metrics_fh:
+            if metrics_fp.endswith(".prom"):
+                metrics_fh.write(self.to_prometheus(prefix))
+            else:
+                metrics_fh.write(self.to_json() + "\n")
+
+
+@contextmanager
+def profiled(profile_fp=None, tracemalloc_fp=None, top=TRACEMALLOC_TOP):
+    """
+    profiles the with block
+    :param profile_fp: if given, cProfile stats are dumped there (read them
+    with pstats or snakeviz)
+    :param tracemalloc_fp: if given, the peak traced memory and the top
+    allocation sites still live at the end of the block are written there
+    :param top: number of allocation sites to list
+    """
+    profiler = None
+    if profile_fp is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if tracemalloc_fp is not None:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_fp)
+        if tracemalloc_fp is not None:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(tracemalloc_fp, "w") as report_fh:
+                report_fh.write("traced memory: current %d bytes, peak %d "
+                                "bytes\n" % (current, peak))
+                for stat in snapshot.statistics("lineno")[:top]:
+                    report_fh.write(str(stat) + "\n")
@@ -0,0 +1,314 @@
+"""
+Sparse PageRank engine used by the indexer. It iterates over a LinkGraph, which
+stores only the real out-links of each page (CSR layout); the teleport term and
+the "no valid links means link to every other page" rule are applied
+analytically on every iteration, so memory and time per iteration are linear
+in the number of links.
+
+The solver is pluggable (see METHODS): plain power iteration, Gauss-Seidel
+sweeps, adaptive iteration that stops recomputing converged pages, and power
+iteration with periodic Aitken or quadratic extrapolation. Every step's
+residual is logged at DEBUG level on the "pagerank" logger
+"""
+import logging
+import math
+import sys
+import numpy as np
+import file_io
+from link_graph import LinkGraph
+
+DAMPING = 0.85
+THRESHOLD = 0.001
+MAX_ITER = 1000
+EXTRAPOLATE_EVERY = 10  # power steps between extrapolations
+
+log = logging.getLogger("pagerank")
+
+
+def distance(r, rp, norm: str):
+    """
+    returns the l1 or l2 distance between two rank vectors
+    """
+    if norm == "l1":
+        return float(np.abs(rp - r).sum())
+    if norm == "l2":
+        return math.sqrt(float(np.dot(rp - r, rp - r)))
+    raise ValueError("norm must be l1 or l2, not " + repr(norm))
+
+
+class Problem:
+    """
+    The arrays one PageRank computation iterates over
+    n: number of pages
+    rows, targets: source and target position of every stored link
+    share: damping / out degree of each page
+    all_share: share of the pages that link to every other page, else 0
+    """
+
+    def __init__(self, graph: LinkGraph, damping: float):
+        self.n = len(graph)
+        self.damping = damping
+        # zero-copy views of the graph's arrays
+        offsets = np.frombuffer(graph.offsets, dtype=np.intc)
+        self.targets = np.frombuffer(graph.targets, dtype=np.intc)
+        degrees = np.frombuffer(graph.degrees, dtype=np.intc)
+        links_to_all = np.frombuffer(graph.links_to_all, dtype=np.int8) != 0
+        # source position of every stored link, for the scatter below
+        self.rows = np.repeat(np.arange(self.n), np.diff(offsets))
+
+        # weight of each of page k's links; pages with no targets contribute
+        # nothing but teleportation
+        self.share = np.zeros(self.n)
+        has_links = degrees > 0
+        self.share[has_links] = damping / degrees[has_links]
+        self.all_share = np.where(links_to_all, self.share, 0.0)
+
+    def step(self, r):
+        """
+        returns the ranks after one power iteration step from r
+        """
+        weighted = r * self.share
+        rp = np.bincount(self.targets, weights=weighted[self.rows],
+                         minlength=self.n)
+        # every page receives the teleport term, and the link-to-all pages'
+        # share from everyone but themselves
+        spread = r * self.all_share
+        return rp + (1 - self.damping) / self.n * r.sum() + spread.sum() - \
+            spread
+
+
+def power(problem: Problem, rp, tol, norm, max_iter, history):
+    """
+    power iteration: r <- M r until successive vectors are within tol
+    """
+    r = np.zeros(problem.n)
+    iterations = 0
+    while True:
+        residual = distance(r, rp, norm)
+        if iterations:
+            record(history, iterations, residual)
+        if residual < tol or iterations == max_iter:
+            return rp, iterations
+        r = rp
+        rp = problem.step(r)
+        iterations += 1
+
+
+def extrapolated(kind: str):
+    """
+    returns a solver that runs power iteration and replaces the iterate by
+    an extrapolation of the last ones every EXTRAPOLATE_EVERY steps, which
+    cancels the slowest decaying error terms
+    :param kind: "aitken" (componentwise delta squared over three iterates)
+    or "quadratic" (the least squares quadratic of four iterates)
+    """
+    def solve(problem: Problem, rp, tol, norm, max_iter, history):
+        recent = [rp]
+        iterations = 0
+        while iterations < max_iter:
+            r = recent[-1]
+            rp = problem.step(r)
+            iterations += 1
+            residual = distance(r, rp, norm)
+            record(history, iterations, residual)
+            if residual < tol:
+                break
+            recent = (recent + [rp])[-4:]
+            if iterations % EXTRAPOLATE_EVERY == 0 and len(recent) == 4:
+                guess = aitken(*recent[1:]) if kind == "aitken" else \
+                    quadratic(*recent)
+                recent = [guess / guess.sum()]
+        return rp, iterations
+    return solve
+
+
+def aitken(x0, x1, x2):
+    """
+    Aitken's delta squared extrapolation of each component, left alone where
+    the second difference vanishes
+    """
+    second = x2 - 2 * x1 + x0
+    safe = np.abs(second) > 1e-15
+    guess = x2.copy()
+    guess[safe] -= (x2[safe] - x1[safe]) ** 2 / second[safe]
+    return np.maximum(guess, 0)
+
+
+def quadratic(x0, x1, x2, x3):
+    """
+    quadratic extrapolation (Kamvar et al.) from four successive iterates,
+    assuming the error lies in the span of the two next eigenvectors
+    """
+    y = np.column_stack((x1 - x0, x2 - x0))
+    gamma, *_ = np.linalg.lstsq(y, -(x3 - x0), rcond=None)
+    g1, g2, g3 = gamma[0], gamma[1], 1.0
+    guess = (g1 + g2 + g3) * x1 + (g2 + g3) * x2 + g3 * x3
+    return np.maximum(guess, 0)
+
+
+def adaptive(problem: Problem, rp, tol, norm, max_iter, history):
+    """
+    adaptive PageRank (Kamvar et al.): a page whose rank moved less than
+    tol / n in a step is frozen, and the links into frozen pages are dropped
+    from later steps, so the work per step shrinks as pages converge
+    """
+    n = problem.n
+    active = np.ones(n, dtype=bool)
+    rows, targets = problem.rows, problem.targets
+    page_tol = tol / n
+    iterations = 0
+    r = rp
+    while iterations < max_iter:
+        weighted = r * problem.share
+        scattered = np.bincount(targets, weights=weighted[rows], minlength=n)
+        spread = r * problem.all_share
+        full = scattered + (1 - problem.damping) / n * r.sum() + \
+            spread.sum() - spread
+        rp = np.where(active, full, r)
+        iterations += 1
+        residual = distance(r, rp, norm)
+        record(history, iterations, residual)
+        if residual < tol:
+            break
+        converged = active & (np.abs(rp - r) < page_tol)
+        if converged.any():
+            active &= ~converged
+            keep = active[targets]
+            rows, targets = rows[keep], targets[keep]
+        r = rp
+    return rp, iterations
+
+
+def gauss_seidel(problem: Problem, rp, tol, norm, max_iter, history):
+    """
+    Gauss-Seidel on the linear system r = (1 - damping) / n + M r: pages are
+    updated in place one at a time, each from the already updated ranks of
+    the pages before it, which usually takes fewer sweeps than power
+    iteration takes steps. Each sweep is a Python loop over the in-links of
+    every page
+    """
+    n = problem.n
+    damping = problem.damping
+    by_target = np.argsort(problem.targets, kind="stable")
+    sources = problem.rows[by_target].tolist()
+    starts = np.searchsorted(problem.targets[by_target],
+                             np.arange(n + 1)).tolist()
+    share = problem.share.tolist()
+    all_share = problem.all_share.tolist()
+
+    teleport = (1 - damping) / n
+    x = rp.tolist()
+    iterations = 0
+    while iterations < max_iter:
+        previous = np.array(x)
+        spread = sum(s * v for s, v in zip(all_share, x))
+        for i in range(n):
+            new = teleport + spread - all_share[i] * x[i]
+            for j in sources[starts[i]:starts[i + 1]]:
+                new += share[j] * x[j]
+            spread += all_share[i] * (new - x[i])
+            x[i] = new
+        iterations += 1
+        residual = distance(previous, np.array(x), norm)
+        record(history, iterations, residual)
+        if residual < tol:
+            break
+    x = np.array(x)
+    return x / x.sum(), iterations
+
+
+METHODS = {
+    "power": power,
+    "gauss_seidel": gauss_seidel,
+    "adaptive": adaptive,
+    "aitken": extrapolated("aitken"),
+    "quadratic": extrapolated("quadratic"),
+}
+
+
+def record(history, iteration, residual):
+    """
+    logs one step's residual, and appends it to history if one was given
+    """
+    log.debug("iteration %d residual %.3g", iteration, residual)
+    if history is not None:
+        history.append(residual)
+
+
+def page_rank(graph: LinkGraph, start=None, method="power", damping=DAMPING,
+              tol=THRESHOLD, norm="l2", max_iter=MAX_ITER, history=None):
+    """
+    computes the page rank of every page, where each step is a sparse mat-vec
+    over the stored links plus the analytic teleport and link-to-all terms
+    :param graph: LinkGraph of the corpus
+    :param start: optional dictionary of ids -> previous pageranks to start
+    iterating from instead of the uniform 1/n; missing pages start at 1/n
+    :param method: the solver, one of METHODS
+    :param damping: probability of following a link rather than teleporting
+    :param tol: iteration stops once successive ranks are within tol
+    :param norm: "l1" or "l2", the distance tol is measured in
+    :param max_iter: the most steps to take, converged or not
+    :param history: optional list the residual of every step is appended to
+    :return: dictionary of ids -> pageranks
+    """
+    if method not in METHODS:
+        raise ValueError("unknown PageRank method " + repr(method))
+    distance(np.zeros(1), np.zeros(1), norm)  # rejects an unknown norm early
+    n = len(graph)
+    if n == 0:
+        return {}
+
+    problem = Problem(graph, damping)
+    if start is None:
+        rp = np.full(n, 1 / n)
+    else:
+        rp = np.array([start.get(id_num, 1 / n) for id_num in graph.ids])
+        rp /= rp.sum()
+    rp, iterations = METHODS[method](problem, rp, tol, norm, max_iter, history)
+    if iterations == max_iter:
+        log.warning("%s PageRank stopped after max_iter=%d steps", method,
+                    max_iter)
+    log.info("%s PageRank of %d pages took %d steps", method, n, iterations)
+    return dict(zip(graph.ids, rp.tolist()))
+
+
+# recomputes the docs file from a saved link graph without reparsing the xml
+# usage: python pagerank.py graph_file docs_file [--method M] [--damping D]
+#        [--tol T] [--norm l1|l2] [--max-iter N] [--start prior_docs_file]
+#        [--verbose]
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    options = {}
+    start_fp = None
+    if "--verbose" in args:
+        args.remove("--verbose")
+        logging.basicConfig(level=logging.DEBUG)
+    flags = {"--method": ("method", str), "--damping": ("damping", float),
+             "--tol": ("tol", float), "--norm": ("norm", str),
+             "--max-iter": ("max_iter", int), "--start": (None, str)}
+    try:
+        for flag, (option, parse) in flags.items():
+            if flag in args:
+                pos = args.index(flag)
+                value = parse(args[pos + 1])
+                del args[pos:pos + 2]
+                if option is None:
+                    start_fp = value
+                else:
+                    options[option] = value
+    except (IndexError, ValueError):
+        print("every option needs a value.")
+        sys.exit()
+    if len(args) != 2:
+        print("usage: python pagerank.py graph_file docs_file [--method M] "
+              "[--damping D] [--tol T] [--norm l1|l2] [--max-iter N] "
+              "[--start prior_docs_file] [--verbose]")
+        sys.exit()
+    try:
+        if start_fp is not None:
+            options["start"] = {}
+            file_io.read_docs_file(start_fp, options["start"])
+        file_io.write_docs_file(
+            args[1], page_rank(file_io.read_graph_file(args[0]), **options))
+    except FileNotFoundError:
+        print("File not found!")
@@ -0,0 +1,107 @@
+"""
+Algorithms over sorted posting lists: galloping intersection and difference
+and merged union of doc-id lists, and phrase and proximity matching over the
+word positions of one document
+"""
+import heapq
+from bisect import bisect_left
+
+
+def gallop(ids, target, lo: int):
+    """
+    finds the first index at or after lo whose id is >= target, probing
+    exponentially larger steps ahead before binary searching, so skipping
+    over a long run of ids costs its logarithm
+    """
+    step = 1
+    hi = lo
+    while hi < len(ids) and ids[hi] < target:
+        lo = hi + 1
+        hi += step
+        step *= 2
+    return bisect_left(ids, target, lo, min(hi, len(ids)))
+
+
+def intersect(lists):
+    """
+    returns the ids present in every sorted list. The shortest list drives the
+    intersection and the others are galloped through, so the cost is roughly
+    the length of the shortest list times the log of the others
+    """
+    if not lists:
+        return []
+    lists = sorted(lists, key=len)
+    result = []
+    cursors = [0] * len(lists)
+    for target in lists[0]:
+        for k in range(1, len(lists)):
+            cursors[k] = gallop(lists[k], target, cursors[k])
+            if cursors[k] == len(lists[k]):
+                return result
+            if lists[k][cursors[k]] != target:
+                break
+        else:
+            result.append(target)
+    return result
+
+
+def phrase_match(position_lists, offsets):
+    """
+    checks whether the words occur as a phrase: some position p of the first
+    word such that each other word i occurs at p + offsets[i] - offsets[0]
+    :param position_lists: ascending positions of each phrase word in one doc
+    :param offsets: the position of each word within the phrase
+    """
+    rest = [(set(positions), offset - offsets[0]) for positions, offset in
+            zip(position_lists[1:], offsets[1:])]
+    for p in position_lists[0]:
+        if all(p + gap in positions for positions, gap in rest):
+            return True
+    return False
+
+
+def min_span(position_lists):
+    """
+    returns the width (in positions) of the smallest window that contains at
+    least one position from every list, sweeping all lists at once
+    """
+    heap = [(positions[0], k, 0) for k, positions in
+            enumerate(position_lists) if positions]
+    if len(heap) < len(position_lists):
+        return None
+    heapq.heapify(heap)
+    highest = max(p for p, _, _ in heap)
+    best = highest - heap[0][0]
+    while True:
+        lowest, k, i = heapq.heappop(heap)
+        best = min(best, highest - lowest)
+        if i + 1 == len(position_lists[k]):
+            return best
+        following = position_lists[k][i + 1]
+        highest = max(highest, following)
+        heapq.heappush(heap, (following, k, i + 1))
+
+
+def difference(ids, excluded):
+    """
+    returns the ids of a sorted list that are not in the sorted list
+    excluded, galloping through excluded
+    """
+    result = []
+    cursor = 0
+    for target in ids:
+        cursor = gallop(excluded, target, cursor)
+        if cursor == len(excluded) or excluded[cursor] != target:
+            result.append(target)
+    return result
+
+
+def union(lists):
+    """
+    returns the sorted ids present in any of the sorted lists
+    """
+    result = []
+    for target in heapq.merge(*lists):
+        if not result or result[-1] != target:
+            result.append(target)
+    return result
@@ -1,36 +1,608 @@
+import boolean_query
 import file_io
+import heapq
+import json
+import logging
+import re
 import sys
-from nltk.stem import PorterStemmer
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import result_cache
+import stemming
+from metrics import Metrics, profiled
 from nltk.corpus import stopwords
+from postings import gallop, intersect, min_span, phrase_match
+from term_dictionary import COMPLETIONS, MAX_EDITS, TermDictionary
+
+PHRASE_REGEX = '"([^"]*)"'
+WORD_REGEX = "[a-zA-Z0-9]+'[a-zA-Z0-9]+|[a-zA-Z0-9]+"
+# relative margin on score bounds, so float rounding in summing a document's
+# relevances can never prune a document that belongs in the top k
+BOUND_SLACK = 1e-9
+BATCH_CHUNK = 1000  # queries of a batch resolved, fetched and scored together
+
+log = logging.getLogger("query")
 
 
 class Querier:
     STOP_WORDS = set(stopwords.words('english'))
 
-    def __init__(self, titles_fp, docs_fp, words_fp, pagerank):
+    def __init__(self, titles_fp, docs_fp, words_fp, pagerank, stems_fp=None,
+                 cache_size=result_cache.DEFAULT_SIZE,
+                 cache_ttl=result_cache.DEFAULT_TTL, positions_fp=None,
+                 proximity=0.0, lazy=False, impact_fp=None,
+                 impact_limit=None, dictionary_fp=None):
         self.ids_to_titles = {}
         self.ids_to_pagerank = {}
+        self.max_pagerank = 0.0
         self.words_to_doc_to_relevance = {}
+        self.ids_to_order = {}
         self.pagerank = pagerank
+        self.index_fps = (titles_fp, docs_fp, words_fp)
+        # parse a text words file's postings only when a query first needs
+        # them (LazyPostings) instead of all at startup
+        self.lazy = lazy
+
+        # a positional index (index.py --positions) enables "quoted phrase"
+        # queries, and with proximity > 0 boosts documents whose query terms
+        # occur close together
+        self.positions = None
+        self.positions_fp = positions_fp
+        if positions_fp is not None:
+            self.index_fps += (positions_fp,)
+        self.proximity = proximity
+        # impact-ordered postings (index.py --impact); with impact_limit
+        # set, queries are answered approximately from only the first
+        # impact_limit postings of each term, fewer trading recall for speed
+        self.impact = None
+        self.impact_fp = impact_fp
+        if impact_fp is not None:
+            self.index_fps += (impact_fp,)
+        self.impact_limit = impact_limit
+        # the index's term dictionary (index.py --dictionary) completes
+        # queries and suggests corrections of misspelled words
+        self.term_dictionary = None
+        self.title_dictionary = None
+        self.dictionary_fp = dictionary_fp
+        if dictionary_fp is not None:
+            self.index_fps += (dictionary_fp,)
+        self.stems_fp = stems_fp
+        self.reload_lock = threading.Lock()
+
+        # postings walked by pruned top-k scoring versus passed over
+        self.postings_scored = 0
+        self.postings_skipped = 0
+        self.stats_lock = threading.Lock()
+        # time spent loading the index and answering queries, and counts
+        self.metrics = Metrics()
+
+        # results are cached until the index files change (cache_size=0 to
+        # disable)
+        self.result_cache = None
+        if cache_size > 0:
+            self.result_cache = result_cache.ResultCache(cache_size, cache_ttl)
 
         try:
-            file_io.read_title_file(titles_fp, self.ids_to_titles)
-            file_io.read_docs_file(docs_fp, self.ids_to_pagerank)
-            file_io.read_words_file(words_fp, self.words_to_doc_to_relevance)
+            with self.metrics.phase("load"):
+                self.load_index()
+            if stems_fp is not None:
+                stemming.STEM_CACHE.load(stems_fp)
         except FileNotFoundError:
             print("No file found! Please try re-entering arguments.")
 
-    def query(self, user_input):
-        """This method takes in a user input from our REPL and scores the items 
-        in the query against the relevance and pagerank dictionaries read in the 
-        constructor
+    def load_index(self):
+        """Reads the titles, docs and words files into the instance variables,
+        replacing whatever was loaded before
+        """
+        titles_fp, docs_fp, words_fp = self.index_fps[:3]
+        # the version is taken first so a rewrite during loading is seen
+        version = result_cache.index_version(self.index_fps)
 
-        Paramters:
-        user_input -- the query 
+        ids_to_titles = {}
+        ids_to_pagerank = {}
+        words_to_doc_to_relevance = {}
+        file_io.read_title_file(titles_fp, ids_to_titles)
+        file_io.read_docs_file(docs_fp, ids_to_pagerank)
+        if file_io.is_binary_words_file(words_fp):
+            # postings are decoded from the mapped file on first use
+            words_to_doc_to_relevance = file_io.binary_postings(words_fp)
+        elif self.lazy:
+            words_to_doc_to_relevance = file_io.LazyPostings(words_fp)
+        else:
+            file_io.read_words_file(words_fp, words_to_doc_to_relevance)
+
+        positions = None
+        if self.positions_fp is not None:
+            positions = file_io.PositionalPostings(self.positions_fp)
+        impact = None
+        if self.impact_fp is not None:
+            impact = file_io.ImpactPostings(self.impact_fp)
+        if self.dictionary_fp is not None:
+            terms = []
+            titles = []
+            file_io.read_dictionary_file(self.dictionary_fp, terms, titles)
+            self.term_dictionary = TermDictionary(terms)
+            self.title_dictionary = TermDictionary(
+                (title.lower(), rank, (id, title))
+                for id, rank, title in titles)
+        self.set_index(ids_to_titles, ids_to_pagerank,
+                       words_to_doc_to_relevance, positions, impact)
+        if self.result_cache is not None:
+            # only once loaded, so a failed load is retried
+            self.result_cache.validate(version)
+
+    def set_index(self, ids_to_titles, ids_to_pagerank,
+                  words_to_doc_to_relevance, positions=None, impact=None):
+        """Replaces the index being searched. The postings replaced are not
+        closed: queries running meanwhile still read them, and their files
+        are released with the last reference
+
+        Parameters:
+        ids_to_titles -- ids -> titles, in corpus order
+        ids_to_pagerank -- ids -> pageranks
+        words_to_doc_to_relevance -- words -> ids -> relevance, a dict or a
+        mapping such as BinaryPostings or LazyPostings
+        positions -- the PositionalPostings of the index, if any
+        impact -- the ImpactPostings of the index, if any
         """
-        stemmer = PorterStemmer()
-        queried_terms = []
+        self.ids_to_titles = ids_to_titles
+        self.ids_to_pagerank = ids_to_pagerank
+        self.max_pagerank = max(ids_to_pagerank.values(), default=0.0)
+        self.words_to_doc_to_relevance = words_to_doc_to_relevance
+        # id-sorted postings and max relevance of each text-index term,
+        # filled as terms are queried
+        self.sorted_postings = {}
+        self.positions = positions
+        self.impact = impact
+        # corpus order of each id, used to break ties between equal scores
+        self.ids_to_order = {id: pos for pos, id in enumerate(ids_to_titles)}
+
+    def check_index(self):
+        """Reloads the index and clears the result cache if any of the index
+        files changed since they were loaded. If the index cannot be read,
+        for instance while it is being rewritten, the loaded one keeps being
+        searched and the reload is tried again on the next query
+        """
+        version = result_cache.index_version(self.index_fps)
+        if version == self.result_cache.version:
+            return
+        with self.reload_lock:
+            if version != self.result_cache.version:
+                try:
+                    with self.metrics.phase("load"):
+                        self.load_index()
+                except FileNotFoundError as e:
+                    log.warning("index not reloaded, searching the one "
+                                "already loaded: %s", e)
+
+    def rank(self, queried_terms, k=10, phrases=(), expression=None,
+             postings=None):
+        """Returns the k best documents for the queried terms as (id, score)
+        pairs, from the result cache when the same terms were ranked before
+
+        Parameters:
+        queried_terms -- the stemmed, stop-word-filtered query terms
+        k -- the number of results to return
+        phrases -- phrases every result must contain (see parse_phrases)
+        expression -- a boolean_query tree every result must satisfy
+        postings -- optional term -> term_postings result already fetched for
+        some of the terms (see search_chunk)
+
+        Returns:
+        list of (id, score) with nonzero score, best first, ties in corpus order
+        """
+        if self.result_cache is None:
+            return self.score(queried_terms, k, phrases, expression, postings)
+
+        self.check_index()
+        key = (tuple(queried_terms), self.pagerank, k, tuple(phrases),
+               expression, self.impact_limit)
+        results = self.result_cache.get(key)
+        if results is None:
+            results = tuple(self.score(queried_terms, k, phrases, expression,
+                                       postings))
+            self.result_cache.put(key, results)
+        return list(results)
+
+    def score(self, queried_terms, k=10, phrases=(), expression=None,
+              postings=None):
+        """Scores the documents containing the queried terms and returns the
+        k best as (id, score) pairs. Scores are bounded by each term's max
+        relevance, so the top k is found with MaxScore pruning (see
+        score_pruned) unless a proximity boost, which the bounds do not
+        cover, is applied. With an impact_limit the top k is approximated
+        instead (see score_approximate)
+
+        Parameters:
+        queried_terms -- the stemmed, stop-word-filtered query terms
+        k -- the number of results to return
+        phrases -- phrases every result must contain (see parse_phrases)
+        expression -- a boolean_query tree every result must satisfy
+        postings -- optional term -> term_postings result already fetched
+
+        Returns:
+        list of (id, score) with nonzero score, best first, ties in corpus
+        order; a boolean query's other matches follow with score 0
+        """
+        page_to_relevance = {}  # sparse accumulator
+        # one consistent view of the index, even if it is reloaded meanwhile
+        words = self.words_to_doc_to_relevance
+        ids_to_pagerank = self.ids_to_pagerank
+        ids_to_order = self.ids_to_order
+        positions = self.positions
+
+        allowed = ids_to_order
+        if expression is not None:
+            allowed = set(self.boolean_docs(expression, words, ids_to_order))
+        if phrases and positions is not None:
+            allowed = self.phrase_docs(phrases, positions).intersection(
+                allowed)
+
+        if self.proximity <= 0 or positions is None:
+            if self.impact_limit is not None and self.impact is not None:
+                ranked = self.score_approximate(queried_terms, k, allowed)
+            else:
+                ranked = self.score_pruned(queried_terms, k, allowed,
+                                           postings)
+            return self.pad_matches(ranked, k, expression, allowed,
+                                    ids_to_order)
+
+        for term in queried_terms:
+            if term not in words:
+                continue
+            for j, relevance in words[term].items():
+                if j not in allowed or j not in ids_to_order:
+                    continue
+                tot = page_to_relevance.get(j, 0) + relevance
+                if self.pagerank:
+                    tot *= ids_to_pagerank[j]
+                page_to_relevance[j] = tot
+
+        if self.proximity > 0 and positions is not None:
+            self.boost_proximity(page_to_relevance, queried_terms, positions)
+
+        ranked = heapq.nlargest(
+            k, ((j, tot) for j, tot in page_to_relevance.items() if tot != 0),
+            key=lambda x: (x[1], -ids_to_order[x[0]]))
+        return self.pad_matches(ranked, k, expression, allowed, ids_to_order)
+
+    def pad_matches(self, ranked, k, expression, allowed, ids_to_order):
+        """Fills the results of a boolean query up to k with the matches that
+        scored nothing, e.g. those of `war OR NOT carthage` without "war",
+        with score 0 in corpus order after the scored ones
+
+        Parameters:
+        ranked -- the scored (id, score) pairs, best first
+        k -- the number of results to return
+        expression -- the boolean_query tree, or None
+        allowed -- the ids satisfying the expression and phrases
+        ids_to_order -- id -> corpus position
+
+        Returns:
+        ranked, followed by up to k - len(ranked) (id, 0.0) pairs
+        """
+        if expression is None or len(ranked) >= k:
+            return ranked
+        scored = {j for j, _ in ranked}
+        rest = sorted((j for j in allowed
+                       if j in ids_to_order and j not in scored),
+                      key=ids_to_order.__getitem__)
+        return ranked + [(j, 0.0) for j in rest[:k - len(ranked)]]
+
+    def score_pruned(self, queried_terms, k, allowed, postings=None):
+        """Finds the k best documents document-at-a-time with MaxScore. Each
+        term's max relevance bounds what it adds to a score; once k documents
+        are held, the terms whose bounds together cannot reach the k-th score
+        are non-essential: only documents in the other terms' posting lists
+        are considered, and the non-essential lists are galloped to those
+        documents only while the bound of the document's score still reaches
+        the k-th. Documents are scored exactly as score does, so the results
+        are the same as scoring every document
+
+        Parameters:
+        queried_terms -- the stemmed, stop-word-filtered query terms
+        k -- the number of results to return
+        allowed -- the ids results are restricted to
+        postings -- optional term -> term_postings result already fetched
+
+        Returns:
+        list of (id, score) with nonzero score, best first, ties in corpus order
+        """
+        words = self.words_to_doc_to_relevance
+        sorted_postings = self.sorted_postings
+        ids_to_pagerank = self.ids_to_pagerank
+        ids_to_order = self.ids_to_order
+        pagerank = self.pagerank
+
+        # (bound, term, ids, relevances) of each distinct term, weakest bound
+        # first; a term repeated in the query adds its relevance each time
+        repeats = {term: queried_terms.count(term) for term in queried_terms}
+        lists = []
+        for term, repeat in repeats.items():
+            if postings is not None and term in postings:
+                found = postings[term]
+            else:
+                found = self.term_postings(term, words, sorted_postings)
+            if found is not None:
+                ids, relevances, max_relevance = found
+                lists.append((max_relevance * repeat, term, ids, relevances))
+        lists.sort(key=lambda x: x[:2])
+        total = sum(len(ids) for _, _, ids, _ in lists)
+        if k <= 0 or not lists:
+            return []
+
+        # with pagerank a document's score is at most its rank times the sum
+        # of its relevances, as every rank is at most 1. Lists can only be
+        # made non-essential by the highest rank of any page though, so a
+        # skewed pagerank prunes far less than plain tf-idf
+        factor = self.max_pagerank if pagerank else 1.0
+        prunable = factor <= 1
+        prefix = []  # bound of the terms up to and including each one
+        for bound, _, _, _ in lists:
+            prefix.append((prefix[-1] if prefix else 0) + bound)
+
+        heap = []  # the best k as (score, -corpus order, id), worst first
+        threshold = None
+        essential = 0  # lists[:essential] are the non-essential terms
+        cursors = [0] * len(lists)
+        scored = 0
+        while True:
+            candidate = None
+            for t in range(essential, len(lists)):
+                ids = lists[t][2]
+                if cursors[t] < len(ids) and (
+                        candidate is None or ids[cursors[t]] < candidate):
+                    candidate = ids[cursors[t]]
+            if candidate is None:
+                break
+
+            term_to_relevance = {}
+            for t in range(essential, len(lists)):
+                ids = lists[t][2]
+                if cursors[t] < len(ids) and ids[cursors[t]] == candidate:
+                    term_to_relevance[lists[t][1]] = lists[t][3][cursors[t]]
+                    cursors[t] += 1
+            if candidate not in allowed or candidate not in ids_to_order:
+                continue
+
+            # look the document up in the non-essential lists, strongest
+            # first, while its bound can still reach the threshold
+            rank = ids_to_pagerank[candidate] if pagerank else 1.0
+            partial = sum(relevance * repeats[term]
+                          for term, relevance in term_to_relevance.items())
+            pruned = False
+            for t in range(essential - 1, -1, -1):
+                if (rank * (partial + prefix[t]) * (1 + BOUND_SLACK) <
+                        threshold[0]):
+                    pruned = True
+                    break
+                _, term, ids, relevances = lists[t]
+                cursors[t] = gallop(ids, candidate, cursors[t])
+                if cursors[t] < len(ids) and ids[cursors[t]] == candidate:
+                    term_to_relevance[term] = relevances[cursors[t]]
+                    partial += relevances[cursors[t]] * repeats[term]
+            if pruned:
+                continue
+
+            # score in query order, as score does
+            scored += len(term_to_relevance)
+            tot = 0
+            for term in queried_terms:
+                if term in term_to_relevance:
+                    tot += term_to_relevance[term]
+                    if pagerank:
+                        tot *= ids_to_pagerank[candidate]
+            if tot == 0:
+                continue
+            entry = (tot, -ids_to_order[candidate], candidate)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+            else:
+                continue
+            if len(heap) == k and prunable:
+                threshold = heap[0]
+                while essential < len(lists) and (
+                        factor * prefix[essential] * (1 + BOUND_SLACK) <
+                        threshold[0]):
+                    essential += 1
+
+        with self.stats_lock:
+            self.postings_scored += scored
+            self.postings_skipped += total - scored
+        return [(j, tot) for tot, _, j in sorted(heap, reverse=True)]
+
+    def score_approximate(self, queried_terms, k, allowed):
+        """Approximates the k best documents from the impact-ordered
+        postings: only the first impact_limit postings of each term, those
+        with the highest fused static scores, are read, and a document is
+        scored as score does from the relevances read. A document missing
+        from a term's prefix is scored without that term, or not found at
+        all, so results can be missed or ranked lower than they should
+        be; once impact_limit covers every posting the results are exact
+
+        Parameters:
+        queried_terms -- the stemmed, stop-word-filtered query terms
+        k -- the number of results to return
+        allowed -- the ids results are restricted to
+
+        Returns:
+        list of (id, score) with nonzero score, best first, ties in corpus order
+        """
+        impact = self.impact
+        ids_to_pagerank = self.ids_to_pagerank
+        ids_to_order = self.ids_to_order
+        pagerank = self.pagerank
+
+        term_to_docs = {}  # term -> ids -> relevance of its prefix
+        read = total = 0
+        for term in dict.fromkeys(queried_terms):
+            found = impact.postings(term, self.impact_limit)
+            if found is None:
+                continue
+            ids, relevances, _ = found
+            term_to_docs[term] = dict(zip(ids, relevances))
+            read += len(ids)
+            total += impact.count(term)
+
         page_to_relevance = {}
+        for j in set().union(*term_to_docs.values()):
+            if j not in allowed or j not in ids_to_order:
+                continue
+            tot = 0
+            for term in queried_terms:
+                docs = term_to_docs.get(term)
+                if docs is not None and j in docs:
+                    tot += docs[j]
+                    if pagerank:
+                        tot *= ids_to_pagerank[j]
+            if tot != 0:
+                page_to_relevance[j] = tot
+
+        with self.stats_lock:
+            self.postings_scored += read
+            self.postings_skipped += total - read
+        return heapq.nlargest(
+            k, page_to_relevance.items(),
+            key=lambda x: (x[1], -ids_to_order[x[0]]))
+
+    def term_postings(self, term, words, sorted_postings):
+        """Returns the postings of a term as (ids, relevances, max relevance)
+        with ids ascending, or None if the term is not in the index
+
+        Parameters:
+        term -- the term
+        words -- the words index
+        sorted_postings -- the cache of sorted text-index postings
+        """
+        if isinstance(words, file_io.BinaryPostings):
+            found = words.postings(term)
+            if found is None:
+                return None
+            return found[0], found[1], words.max_relevance(term)
+        if isinstance(words, file_io.LazyPostings):
+            # sorted when parsed, and kept in its bounded cache instead
+            return words.postings(term)
+        found = sorted_postings.get(term)
+        if found is None:
+            ids_to_relevance = words.get(term)
+            if ids_to_relevance is None:
+                return None
+            ids = sorted(ids_to_relevance)
+            relevances = [ids_to_relevance[j] for j in ids]
+            found = (ids, relevances, max(relevances))
+            sorted_postings[term] = found
+        return found
+
+    def pruning_stats(self):
+        """returns the counts of postings scored and skipped by pruning
+        """
+        with self.stats_lock:
+            return {"postings_scored": self.postings_scored,
+                    "postings_skipped": self.postings_skipped}
+
+    def boolean_docs(self, expression, words, ids_to_order):
+        """Evaluates a boolean query over the sorted doc ids of its terms
+
+        Parameters:
+        expression -- a tree returned by boolean_query.parse
+        words -- the words index to take the posting lists from
+        ids_to_order -- the ids of every document
+
+        Returns:
+        sorted list of the ids that satisfy the query
+        """
+        def doc_ids(term):
+            if isinstance(words, (file_io.BinaryPostings,
+                                  file_io.LazyPostings)):
+                found = words.postings(term)
+                return [] if found is None else found[0]
+            return sorted(words.get(term, ()))
+
+        return boolean_query.evaluate(
+            expression, doc_ids, sorted(ids_to_order))
+
+    def phrase_docs(self, phrases, positions):
+        """Finds the documents that contain every phrase. The docs holding all
+        of a phrase's words are intersected first, and only those have their
+        positions checked
+
+        Parameters:
+        phrases -- tuples of (term, offset in the phrase) pairs
+        positions -- the PositionalPostings of the index
+
+        Returns:
+        set of ids
+        """
+        matches = []
+        for phrase in phrases:
+            docs_to_positions = [positions.get(term) for term, _ in phrase]
+            if None in docs_to_positions:
+                return set()
+            offsets = [offset for _, offset in phrase]
+            candidates = intersect([list(docs) for docs in docs_to_positions])
+            matches.append([
+                j for j in candidates if phrase_match(
+                    [docs[j] for docs in docs_to_positions], offsets)])
+        return set(intersect(matches))
+
+    def boost_proximity(self, page_to_relevance, queried_terms, positions):
+        """Multiplies the score of each document containing two or more of
+        the query terms by 1 + proximity / span, where span is the width of
+        the smallest window holding one occurrence of each of them
+
+        Parameters:
+        page_to_relevance -- ids -> scores, updated in place
+        queried_terms -- the stemmed, stop-word-filtered query terms
+        positions -- the PositionalPostings of the index
+        """
+        term_positions = [positions.get(term) for term in set(queried_terms)]
+        term_positions = [docs for docs in term_positions if docs is not None]
+        if len(term_positions) < 2:
+            return
+        for j in page_to_relevance:
+            lists = [docs[j] for docs in term_positions if j in docs]
+            if len(lists) >= 2:
+                span = min_span(lists)
+                page_to_relevance[j] *= 1 + self.proximity / max(span, 1)
+
+    def parse_phrases(self, user_input):
+        """Splits the "quoted" phrases out of a query. Phrase words are
+        stemmed and stop words dropped as the indexer does, each keeping its
+        offset within the phrase so the gaps left by stop words still count
+
+        Parameters:
+        user_input -- the query
+
+        Returns:
+        (the query without its phrases, list of phrases), where a phrase is a
+        tuple of (term, offset) pairs
+        """
+        phrases = []
+        for quoted in re.findall(PHRASE_REGEX, user_input):
+            phrase = []
+            for offset, word in enumerate(re.findall(WORD_REGEX, quoted)):
+                word = stemming.stem(word.lower())
+                if word not in self.STOP_WORDS:
+                    phrase.append((word, offset))
+            if phrase:
+                phrases.append(tuple(phrase))
+        return re.sub(PHRASE_REGEX, " ", user_input), phrases
+
+    def parse_query(self, user_input):
+        """Stems the words of a query and removes its stop words
+
+        Parameters:
+        user_input -- the query
+
+        Returns:
+        the list of queried terms
+        """
+        queried_terms = []
 
         # stem and remove stop words
         for i in user_input.split(" "):
@@ -38,61 +610,427 @@ class Querier:
                 i = i.lower()
                 if i.strip() != "":
                     i = i.strip()
-                i = stemmer.stem(i)
+                i = stemming.stem(i)
                 queried_terms.append(i)
+        return queried_terms
 
-        # sort based on relevance
-        for j in self.ids_to_titles:
-            # populate page_to_relevance
-            tot = 0
-            for k in queried_terms:
-                if k in self.words_to_doc_to_relevance:
-                    if j in self.words_to_doc_to_relevance[k]:
-                        tot += self.words_to_doc_to_relevance[k][j]
-                        if self.pagerank:
-                            tot *= self.ids_to_pagerank[j]
-            page_to_relevance[j] = tot
-
-        # sort
-        rel_list = sorted(page_to_relevance.items(),
-                          key=lambda x: x[1], reverse=True)
-        try:
-            if rel_list[0][1] == 0.0:
-                print("Search item", user_input, "has no relevant documents")
-        except IndexError:
+    def complete(self, prefix, n=COMPLETIONS):
+        """Completes a partly typed query from the term dictionary
+
+        Parameters:
+        prefix -- the query typed so far
+        n -- the number of completions of each kind
+
+        Returns:
+        {"terms": [(word, document frequency)], "titles": [(id, title,
+        pagerank)]}: the most frequent terms completing the last word
+        (matched as typed, else by its stem), and the highest ranked titles
+        starting with the whole prefix, ignoring case
+        """
+        completions = {"terms": [], "titles": []}
+        if self.term_dictionary is None:
+            return completions
+        words = prefix.lower().split()
+        if words and not prefix[-1].isspace():
+            found = self.term_dictionary.complete(words[-1], n)
+            if not found:
+                found = self.term_dictionary.complete(
+                    stemming.stem(words[-1]), n)
+            completions["terms"] = [(display, df)
+                                    for _, df, display in found]
+        completions["titles"] = [
+            (id, title, rank) for _, rank, (id, title) in
+            self.title_dictionary.complete(prefix.lower().lstrip(), n)]
+        return completions
+
+    def did_you_mean(self, user_input, max_edits=MAX_EDITS):
+        """Rewrites the words of a query that are not in the index into the
+        closest index terms, the most frequent among equally close ones
+
+        Parameters:
+        user_input -- the query
+        max_edits -- the most edits a correction may be from its word
+
+        Returns:
+        the corrected query, or None if no word needed or had a correction
+        """
+        if self.term_dictionary is None:
+            return None
+        corrected = False
+
+        def correct(match):
+            nonlocal corrected
+            word = match.group()
+            lowered = word.lower()
+            if (word in boolean_query.OPERATORS or
+                    lowered in self.STOP_WORDS):
+                return word
+            term = stemming.stem(lowered)
+            if term in self.term_dictionary:
+                return word
+            found = self.term_dictionary.corrections(term, max_edits, 1)
+            if not found:
+                return word
+            corrected = True
+            return found[0][2]
+
+        rewritten = re.sub(WORD_REGEX, correct, user_input)
+        return rewritten if corrected else None
+
+    def search(self, user_input, k=10):
+        """Scores a query and returns its results instead of printing them
+
+        Parameters:
+        user_input -- the query
+        k -- the number of results to return
+
+        Returns:
+        list of (id, title, score), best first
+
+        Raises:
+        ValueError -- if a boolean query is malformed or only negates
+        """
+        self.metrics.count("queries")
+        with self.metrics.phase("parse_query"):
+            queried_terms, phrases, expression = self.resolve(user_input)
+        with self.metrics.phase("rank"):
+            ranked = self.rank(queried_terms, k, phrases, expression)
+        self.metrics.count("results", len(ranked))
+        return [(j, self.ids_to_titles[j], score) for j, score in ranked]
+
+    def resolve(self, user_input):
+        """Turns a query into what rank takes: its phrases are split out,
+        and a boolean query is parsed
+
+        Parameters:
+        user_input -- the query
+
+        Returns:
+        (queried terms, phrases, boolean expression or None)
+
+        Raises:
+        ValueError -- if a boolean query is malformed or only negates
+        """
+        phrases = []
+        if self.positions is not None:
+            user_input, phrases = self.parse_phrases(user_input)
+        expression = None
+        if boolean_query.is_boolean(user_input):
+            # results must satisfy the query and are ranked by the terms
+            # that are not negated; stop words are dropped as in parse_query
+            expression = boolean_query.parse(
+                user_input, lambda word: None if word in self.STOP_WORDS
+                else stemming.stem(word.lower()))
+            queried_terms = boolean_query.positive_terms(expression)
+        else:
+            queried_terms = self.parse_query(user_input)
+        for phrase in phrases:
+            queried_terms.extend(term for term, _ in phrase)
+        return queried_terms, phrases, expression
+
+    def query_batch(self, queries, k=10, workers=1):
+        """Answers many queries, BATCH_CHUNK at a time (see search_chunk).
+        With workers > 1 the chunks are scored in that many processes, each
+        of which opens the index itself
+
+        Parameters:
+        queries -- iterable of queries, which may be a generator
+        k -- the number of results per query
+        workers -- number of processes to score in
+
+        Returns:
+        generator of (query, results, error) in the order of queries, where
+        results is a list of (id, title, score) and error is the message of
+        a malformed query, else None
+        """
+        queries = iter(queries)
+        chunks = iter(lambda: list(islice(queries, BATCH_CHUNK)), [])
+        if workers <= 1:
+            for chunk in chunks:
+                yield from zip(chunk, *zip(*self.search_chunk(chunk, k)))
+            return
+
+        with ProcessPoolExecutor(workers, initializer=open_batch_querier,
+                                 initargs=self.reopen_args()) as executor:
+            # a bounded window of chunks in flight keeps the output streaming
+            pending = deque()
+            for chunk in chunks:
+                pending.append((chunk, executor.submit(
+                    search_batch_chunk, chunk, k)))
+                if len(pending) > 2 * workers:
+                    chunk, future = pending.popleft()
+                    yield from zip(chunk, *zip(*future.result()))
+            while pending:
+                chunk, future = pending.popleft()
+                yield from zip(chunk, *zip(*future.result()))
+
+    def search_chunk(self, queries, k=10):
+        """Answers a list of queries together. Each distinct query is
+        resolved once, the posting list of every distinct term is fetched
+        once for all the queries sharing it, and then each distinct query is
+        ranked
+
+        Parameters:
+        queries -- list of queries
+        k -- the number of results per query
+
+        Returns:
+        list of (results, error) per query, as query_batch yields them
+        """
+        self.metrics.count("queries", len(queries))
+        resolved = {}
+        with self.metrics.phase("parse_query"):
+            for user_input in queries:
+                if user_input not in resolved:
+                    try:
+                        resolved[user_input] = self.resolve(user_input)
+                    except ValueError as e:
+                        resolved[user_input] = str(e)
+
+        words = self.words_to_doc_to_relevance
+        postings = {}
+        with self.metrics.phase("fetch"):
+            for parsed in resolved.values():
+                if isinstance(parsed, str):
+                    continue
+                for term in parsed[0]:
+                    if term not in postings:
+                        postings[term] = self.term_postings(
+                            term, words, self.sorted_postings)
+
+        answers = {}
+        with self.metrics.phase("rank"):
+            for user_input, parsed in resolved.items():
+                if isinstance(parsed, str):
+                    answers[user_input] = ([], parsed)
+                    continue
+                queried_terms, phrases, expression = parsed
+                ranked = self.rank(queried_terms, k, phrases, expression,
+                                   postings)
+                answers[user_input] = ([
+                    (j, self.ids_to_titles[j], score)
+                    for j, score in ranked], None)
+        return [answers[user_input] for user_input in queries]
+
+    def reopen_args(self):
+        """Returns (class, args, kwargs) that open this index again, e.g. in
+        a worker process of query_batch
+        """
+        return type(self), self.index_fps[:3] + (self.pagerank,), {
+            "stems_fp": self.stems_fp, "positions_fp": self.positions_fp,
+            "proximity": self.proximity, "lazy": self.lazy,
+            "impact_fp": self.impact_fp, "impact_limit": self.impact_limit,
+            "dictionary_fp": self.dictionary_fp}
+
+    def query(self, user_input):
+        """This method takes in a user input from our REPL and scores the items 
+        in the query against the relevance and pagerank dictionaries read in the 
+        constructor
+
+        Paramters:
+        user_input -- the query 
+        """
+        if len(self.ids_to_titles) == 0:
             print("Search item", user_input,
                   "has no relevant documents, empty wiki.")
             sys.exit()
 
-        count = 0
+        try:
+            rel_list = self.search(user_input)
+        except ValueError as e:
+            print("Search item", user_input, "is not a valid query:", e)
+            return
+        if len(rel_list) == 0:
+            print("Search item", user_input, "has no relevant documents")
+            suggestion = self.did_you_mean(user_input)
+            if suggestion is not None:
+                print("Did you mean:", suggestion)
+
         for i in rel_list:
-            if i[1] != 0 and count < 10:
-                print(self.ids_to_titles[i[0]])
-                count += 1
+            print(i[1])
+
+
+# the Querier of a query_batch worker process
+batch_querier = None
+
+
+def open_batch_querier(cls, args, kwargs):
+    """Opens the index in a query_batch worker process"""
+    global batch_querier
+    batch_querier = cls(*args, **kwargs)
+
+
+def search_batch_chunk(queries, k):
+    """Answers a chunk of a batch in a worker process (see search_chunk)"""
+    return batch_querier.search_chunk(queries, k)
+
+
+def write_batch(answers, out_fh, jsonl):
+    """Writes query_batch answers to out_fh, one json object per query when
+    jsonl, else one tab-separated line per result: query, rank, id, title,
+    score (a query with no results or an error gets a line with rank 0)
+
+    Returns:
+    the number of queries written
+    """
+    n = 0
+    for user_input, results, error in answers:
+        n += 1
+        if jsonl:
+            answer = {"query": user_input, "results": [
+                {"id": j, "title": title, "score": score}
+                for j, title, score in results]}
+            if error is not None:
+                answer["error"] = error
+            out_fh.write(json.dumps(answer) + "\n")
+        elif not results:
+            out_fh.write("%s\t0\t\t\t%s\n" % (user_input, error or ""))
+        else:
+            for rank, (j, title, score) in enumerate(results, 1):
+                out_fh.write("%s\t%d\t%d\t%s\t%r\n" %
+                             (user_input, rank, j, title, score))
+    return n
 
 
 if __name__ == "__main__":
     search = True
+    args = sys.argv[1:]
+    lazy = "--lazy" in args  # parse text postings on first use
+    if lazy:
+        args.remove("--lazy")
+    stems_fp = None
+    if "--stems" in args:
+        pos = args.index("--stems")
+        try:
+            stems_fp = args[pos + 1]
+        except IndexError:
+            print("--stems needs a filepath.")
+            sys.exit()
+        del args[pos:pos + 2]
+    positions_fp = None
+    if "--positions" in args:
+        pos = args.index("--positions")
+        try:
+            positions_fp = args[pos + 1]
+        except IndexError:
+            print("--positions needs a filepath.")
+            sys.exit()
+        del args[pos:pos + 2]
+    proximity = 0.0
+    if "--proximity" in args:
+        pos = args.index("--proximity")
+        try:
+            proximity = float(args[pos + 1])
+        except (IndexError, ValueError):
+            print("--proximity needs a weight.")
+            sys.exit()
+        del args[pos:pos + 2]
+    # --dictionary FILE reads the term dictionary (index.py --dictionary) so
+    # queries without results get a "did you mean" suggestion
+    dictionary_fp = None
+    if "--dictionary" in args:
+        pos = args.index("--dictionary")
+        try:
+            dictionary_fp = args[pos + 1]
+        except IndexError:
+            print("--dictionary needs a filepath.")
+            sys.exit()
+        del args[pos:pos + 2]
+    # --impact FILE reads impact-ordered postings (index.py --impact), and
+    # --approximate N answers from the first N postings of each term
+    impact_fp = None
+    impact_limit = None
     try:
-        for x in range(2, len(sys.argv[1:])):
-            if not sys.argv[x].endswith('.txt'):
-                raise IOError
-
-        if len(sys.argv) - 1 == 3:  # no pagerank
-            q = Querier(sys.argv[1], sys.argv[2], sys.argv[3], False)
-        # pagerank
-        elif len(sys.argv) - 1 == 4 and sys.argv[1] == '--pagerank':
-            q = Querier(sys.argv[2], sys.argv[3], sys.argv[4], True)
-        else:
-            print("\ncannot accept arguments. please try again :)\n")
-            search = False
-
-    except IOError:
-        print("Please enter proper, existing file. You may be missing .txt")
+        if "--impact" in args:
+            pos = args.index("--impact")
+            impact_fp = args[pos + 1]
+            del args[pos:pos + 2]
+        if "--approximate" in args:
+            pos = args.index("--approximate")
+            impact_limit = int(args[pos + 1])
+            del args[pos:pos + 2]
+    except (IndexError, ValueError):
+        print("--impact needs a filepath and --approximate a number of "
+              "postings.")
+        sys.exit()
+    # --batch INFILE OUTFILE answers every line of INFILE as a query instead
+    # of starting the REPL, writing the top --k results of each to OUTFILE
+    # (json lines for a .jsonl file, tab-separated otherwise) using --workers
+    # processes
+    batch = None
+    batch_options = {"--k": 10, "--workers": 1}
+    try:
+        if "--batch" in args:
+            pos = args.index("--batch")
+            batch = args[pos + 1], args[pos + 2]
+            del args[pos:pos + 3]
+        for flag in batch_options:
+            if flag in args:
+                pos = args.index(flag)
+                batch_options[flag] = int(args[pos + 1])
+                del args[pos:pos + 2]
+    except (IndexError, ValueError):
+        print("--batch needs an input and an output filepath, and --k and "
+              "--workers a number.")
         sys.exit()
+    # --metrics FILE writes the session's metrics on :quit (Prometheus text
+    # for a .prom file, json otherwise); --profile and --tracemalloc FILE
+    # capture a cProfile dump and an allocation report of the session
+    outputs = {"--metrics": None, "--profile": None, "--tracemalloc": None}
+    for flag in outputs:
+        if flag in args:
+            pos = args.index(flag)
+            try:
+                outputs[flag] = args[pos + 1]
+            except IndexError:
+                print(flag, "needs a filepath.")
+                sys.exit()
+            del args[pos:pos + 2]
+    with profiled(outputs["--profile"], outputs["--tracemalloc"]):
+        try:
+            for x in range(1, len(args) - 1):
+                if not args[x].endswith('.txt'):
+                    raise IOError
+
+            if len(args) == 3:  # no pagerank
+                q = Querier(args[0], args[1], args[2], False,
+                            stems_fp=stems_fp, positions_fp=positions_fp,
+                            proximity=proximity, lazy=lazy,
+                            impact_fp=impact_fp, impact_limit=impact_limit,
+                            dictionary_fp=dictionary_fp)
+            # pagerank
+            elif len(args) == 4 and args[0] == '--pagerank':
+                q = Querier(args[1], args[2], args[3], True,
+                            stems_fp=stems_fp, positions_fp=positions_fp,
+                            proximity=proximity, lazy=lazy,
+                            impact_fp=impact_fp, impact_limit=impact_limit,
+                            dictionary_fp=dictionary_fp)
+            else:
+                print("\ncannot accept arguments. please try again :)\n")
+                search = False
+
+        except IOError:
+            print("Please enter proper, existing file. "
+                  "You may be missing .txt")
+            sys.exit()
 
-    if search:
-        user_input = input("search> ")
-        while user_input != ":quit":
-            q.query(user_input)
-            user_input = input("search> ")
\ No newline at end of file
+        if search and batch is not None:
+            start = time.perf_counter()
+            with open(batch[0]) as in_fh, open(batch[1], "w") as out_fh:
+                answered = write_batch(
+                    q.query_batch((line.rstrip("\n") for line in in_fh),
+                                  batch_options["--k"],
+                                  batch_options["--workers"]),
+                    out_fh, batch[1].endswith(".jsonl"))
+            seconds = time.perf_counter() - start
+            print("answered %d queries in %.3f s (%.1f queries/s)" %
+                  (answered, seconds, answered / seconds if seconds else 0))
+            if outputs["--metrics"] is not None:
+                q.metrics.write(outputs["--metrics"], "search_query")
+        elif search:
+            user_input = input("search> ")
+            while user_input != ":quit":
+                q.query(user_input)
+                user_input = input("search> ")
+            if outputs["--metrics"] is not None:
+                q.metrics.write(outputs["--metrics"], "search_query")
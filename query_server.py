@@ -0,0 +1,148 @@
+import json
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import stemming
+from file_io import LazyPostings
+from query import Querier
+
+DEFAULT_PORT = 8080
+MAX_RESULTS = 100
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answers GET /query?q=<query>&k=<number of results> with the ranked
+    results as json (and a "did_you_mean" rewrite when there are none), GET
+    /complete?q=<prefix>&k=<number of completions> with the term and title
+    completions of a partly typed query, GET /stats with the cache and
+    pruning counters and the querier's metrics, and GET /metrics with the
+    metrics as Prometheus text.
+    Every request is served on its own thread against the server's single,
+    already loaded Querier
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            result_cache = self.server.querier.result_cache
+            words = self.server.querier.words_to_doc_to_relevance
+            self.send_json(200, {
+                "lazy_postings": words.stats()
+                if isinstance(words, LazyPostings) else None,
+                "result_cache": result_cache.stats() if result_cache else None,
+                "pruning": self.server.querier.pruning_stats(),
+                "stem_cache": stemming.STEM_CACHE.stats(),
+                "metrics": self.server.querier.metrics.to_dict()})
+            return
+        if url.path == "/metrics":
+            data = self.server.querier.metrics.to_prometheus(
+                "search_query").encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if url.path not in ("/query", "/complete"):
+            self.send_json(404, {"error": "unknown path " + url.path})
+            return
+
+        params = parse_qs(url.query)
+        user_input = params.get("q", [""])[0]
+        try:
+            k = min(int(params.get("k", ["10"])[0]), MAX_RESULTS)
+        except ValueError:
+            self.send_json(400, {"error": "k must be a number"})
+            return
+        if url.path == "/complete":
+            completions = self.server.querier.complete(user_input, k)
+            self.send_json(200, {
+                "prefix": user_input,
+                "terms": [{"term": term, "df": df}
+                          for term, df in completions["terms"]],
+                "titles": [{"id": j, "title": title, "pagerank": rank}
+                           for j, title, rank in completions["titles"]]})
+            return
+
+        start = time.perf_counter()
+        try:
+            results = self.server.querier.search(user_input, k)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        took = time.perf_counter() - start
+        body = {
+            "query": user_input,
+            "took_ms": took * 1000,
+            "results": [{"id": j, "title": title, "score": score}
+                        for j, title, score in results]}
+        if not results:
+            body["did_you_mean"] = self.server.querier.did_you_mean(
+                user_input)
+        self.send_json(200, body)
+
+    def send_json(self, status, body):
+        """writes body as a json response with the given status
+        """
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # per-request logging to stderr would dominate latency under load
+        pass
+
+
+class QueryServer(ThreadingHTTPServer):
+    """A long-running http server that loads the index files once
+    """
+    daemon_threads = True
+
+    def __init__(self, querier: Querier, host="127.0.0.1", port=DEFAULT_PORT):
+        self.querier = querier
+        super().__init__((host, port), QueryHandler)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    pagerank = "--pagerank" in args
+    if pagerank:
+        args.remove("--pagerank")
+    lazy = "--lazy" in args  # parse text postings on first use
+    if lazy:
+        args.remove("--lazy")
+    port = DEFAULT_PORT
+    if "--port" in args:
+        pos = args.index("--port")
+        try:
+            port = int(args[pos + 1])
+        except (IndexError, ValueError):
+            print("--port needs a number.")
+            sys.exit()
+        del args[pos:pos + 2]
+    dictionary_fp = None  # index.py --dictionary, for /complete
+    if "--dictionary" in args:
+        pos = args.index("--dictionary")
+        try:
+            dictionary_fp = args[pos + 1]
+        except IndexError:
+            print("--dictionary needs a filepath.")
+            sys.exit()
+        del args[pos:pos + 2]
+
+    if len(args) != 3:
+        print("\ncannot accept arguments. please try again :)\n")
+        sys.exit()
+
+    server = QueryServer(Querier(args[0], args[1], args[2], pagerank,
+                                 lazy=lazy, dictionary_fp=dictionary_fp),
+                         port=port)
+    print("serving queries on http://127.0.0.1:" + str(port) + "/query")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
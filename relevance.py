@@ -0,0 +1,211 @@
+"""
+Array-backed tf-idf. The postings of the whole corpus are held as parallel
+term-number, doc-id and count arrays (COO layout), and the per-doc max counts,
+document frequencies, term frequencies and relevances are NumPy reductions
+and broadcasts over them; the words files are written straight from the
+arrays, without a nested dict or a float object per posting
+"""
+import math
+from itertools import chain
+import numpy as np
+import file_io
+
+# fused static score of a posting from its relevance and its page's rank,
+# which orders the postings of an impact-ordered words file. "product" is
+# what a one-term pagerank query scores and "relevance" what a one-term
+# plain query scores; "sqrt" dampens the rank's weight
+FUSIONS = {
+    "product": lambda relevances, ranks: relevances * ranks,
+    "relevance": lambda relevances, ranks: relevances,
+    "sqrt": lambda relevances, ranks: relevances * np.sqrt(ranks),
+}
+
+
+class RelevanceArrays:
+    """
+    tf-idf relevance of every posting of a corpus
+    terms: the words, by term number
+    term_numbers, doc_ids, relevances: one entry per posting, in the order
+    the postings were read from words_to_docs_to_count
+    """
+
+    def __init__(self, terms, term_numbers, doc_ids, relevances):
+        self.terms = terms
+        self.term_numbers = term_numbers
+        self.doc_ids = doc_ids
+        self.relevances = relevances
+
+    @classmethod
+    def from_counts(cls, words_to_docs_to_count: dict,
+                    number_of_documents: int):
+        """
+        computes the relevance of every posting, as Indexer.fill_relevancy
+        does: (count / max count in the doc) * log(n / document frequency)
+        :param words_to_docs_to_count: words -> ids -> counts
+        :param number_of_documents: n
+        :return: RelevanceArrays
+        """
+        terms = list(words_to_docs_to_count)
+        postings = words_to_docs_to_count.values()
+        df = np.fromiter(map(len, postings), dtype=np.int64,
+                         count=len(terms))
+        total = int(df.sum())
+        term_numbers = np.repeat(np.arange(len(terms)), df)
+        doc_ids = np.fromiter(chain.from_iterable(postings), dtype=np.int64,
+                              count=total)
+        counts = np.fromiter(
+            chain.from_iterable(docs.values() for docs in postings),
+            dtype=np.float64, count=total)
+
+        docs, doc_numbers = np.unique(doc_ids, return_inverse=True)
+        max_counts = np.zeros(len(docs))
+        np.maximum.at(max_counts, doc_numbers, counts)
+        # one log per term, taken with math.log so the relevances match
+        # fill_relevancy's to the bit
+        idf = np.array([math.log(number_of_documents / ni) for ni in
+                        df.tolist()], dtype=np.float64)
+        relevances = idf[term_numbers] * (counts / max_counts[doc_numbers])
+        return cls(terms, term_numbers, doc_ids, relevances)
+
+    @classmethod
+    def from_relevance(cls, words_to_doc_relevance: dict):
+        """
+        holds relevances that were already computed
+        :param words_to_doc_relevance: words -> ids -> relevance
+        :return: RelevanceArrays
+        """
+        terms = list(words_to_doc_relevance)
+        postings = words_to_doc_relevance.values()
+        df = np.fromiter(map(len, postings), dtype=np.int64,
+                         count=len(terms))
+        total = int(df.sum())
+        term_numbers = np.repeat(np.arange(len(terms)), df)
+        doc_ids = np.fromiter(chain.from_iterable(postings), dtype=np.int64,
+                              count=total)
+        relevances = np.fromiter(
+            chain.from_iterable(docs.values() for docs in postings),
+            dtype=np.float64, count=total)
+        return cls(terms, term_numbers, doc_ids, relevances)
+
+    def document_frequencies(self):
+        """
+        returns words -> the number of documents holding the word
+        """
+        return dict(zip(self.terms, np.bincount(
+            self.term_numbers, minlength=len(self.terms)).tolist()))
+
+    def text_order(self):
+        """
+        returns the posting indices in the order fill_relevancy's dictionary
+        holds them: words in the order they first occur when the postings are
+        read doc by doc (docs by first occurrence), and each word's docs in
+        that same order
+        """
+        n = len(self.doc_ids)
+        docs, first, doc_numbers = np.unique(
+            self.doc_ids, return_index=True, return_inverse=True)
+        doc_rank = np.empty(len(docs), dtype=np.int64)
+        doc_rank[np.argsort(first, kind="stable")] = np.arange(len(docs))
+        by_doc = np.argsort(doc_rank[doc_numbers], kind="stable")
+
+        term_sequence = self.term_numbers[by_doc]
+        term_first = np.full(len(self.terms), n, dtype=np.int64)
+        seen, first = np.unique(term_sequence, return_index=True)
+        term_first[seen] = first
+        return by_doc[np.argsort(term_first[term_sequence], kind="stable")]
+
+    def write_text(self, words_fp: str):
+        """
+        writes the relevances as a text words file (and its offsets sidecar),
+        identical to file_io.write_words_file of fill_relevancy's dictionary
+        """
+        order = self.text_order()
+        term_numbers = self.term_numbers[order]
+        doc_ids = self.doc_ids[order].tolist()
+        relevances = self.relevances[order].tolist()
+        bounds = np.flatnonzero(np.diff(term_numbers)) + 1
+        starts = [0] + bounds.tolist()
+        ends = bounds.tolist() + [len(order)]
+        file_io.write_postings_file(words_fp, (
+            (self.terms[term_numbers[s]], doc_ids[s:e], relevances[s:e])
+            for s, e in zip(starts, ends) if e > s), offsets=True)
+
+    def write_binary(self, words_fp: str):
+        """
+        writes the relevances as a binary words file, identical to
+        file_io.write_words_binary of fill_relevancy's dictionary
+        """
+        encoded = [term.encode("utf-8") for term in self.terms]
+        term_order = sorted(range(len(encoded)), key=encoded.__getitem__)
+        term_rank = np.empty(len(encoded), dtype=np.int64)
+        term_rank[term_order] = np.arange(len(encoded))
+
+        order = np.lexsort((self.doc_ids, term_rank[self.term_numbers]))
+        ids = self.doc_ids[order].astype("<i4")
+        relevances = self.relevances[order].astype("<f4")
+        counts = np.bincount(self.term_numbers, minlength=len(encoded))
+        ends = np.cumsum(counts[term_order]).tolist()
+        starts = [0] + ends[:-1]
+        bounds = [float(relevances[s:e].max()) for s, e in zip(starts, ends)]
+
+        table = [(encoded[t], int(counts[t]), bound)
+                 for t, bound in zip(term_order, bounds)]
+        file_io.write_postings_binary(words_fp, table, (
+            (ids[s:e].tobytes(), relevances[s:e].tobytes())
+            for s, e in zip(starts, ends)))
+
+    def write_compressed(self, words_fp: str, bits=16):
+        """
+        writes the relevances as a compressed words file, identical to
+        file_io.write_words_compressed of fill_relevancy's dictionary
+        """
+        encoded = [term.encode("utf-8") for term in self.terms]
+        term_order = sorted(range(len(encoded)), key=encoded.__getitem__)
+        term_rank = np.empty(len(encoded), dtype=np.int64)
+        term_rank[term_order] = np.arange(len(encoded))
+
+        order = np.lexsort((self.doc_ids, term_rank[self.term_numbers]))
+        ids = self.doc_ids[order]
+        relevances = self.relevances[order]
+        counts = np.bincount(self.term_numbers, minlength=len(encoded))
+        ends = np.cumsum(counts[term_order]).tolist()
+        starts = [0] + ends[:-1]
+        file_io.write_postings_compressed(
+            words_fp, [encoded[t] for t in term_order],
+            ((ids[s:e], relevances[s:e]) for s, e in zip(starts, ends)),
+            bits)
+
+    def write_impact(self, impact_fp: str, ids_to_pagerank: dict,
+                     fusion="product"):
+        """
+        writes the postings in impact order, read by file_io.ImpactPostings:
+        each term's postings sorted by their fused static score, highest
+        first, with the score stored beside the relevance
+        :param impact_fp: the file that will get written to
+        :param ids_to_pagerank: ids -> pageranks; missing ids rank 0
+        :param fusion: the name of one of FUSIONS
+        """
+        if fusion not in FUSIONS:
+            raise ValueError("unknown fusion " + repr(fusion))
+        encoded = [term.encode("utf-8") for term in self.terms]
+        term_order = sorted(range(len(encoded)), key=encoded.__getitem__)
+        term_rank = np.empty(len(encoded), dtype=np.int64)
+        term_rank[term_order] = np.arange(len(encoded))
+
+        docs, doc_numbers = np.unique(self.doc_ids, return_inverse=True)
+        ranks = np.array([ids_to_pagerank.get(j, 0.0) for j in docs.tolist()],
+                         dtype=np.float64)
+        fused = FUSIONS[fusion](self.relevances, ranks[doc_numbers])
+        order = np.lexsort(
+            (self.doc_ids, -fused, term_rank[self.term_numbers]))
+        ids = self.doc_ids[order].astype("<i4")
+        relevances = self.relevances[order].astype("<f8")
+        fused = fused[order].astype("<f8")
+        counts = np.bincount(self.term_numbers, minlength=len(encoded))
+        ends = np.cumsum(counts[term_order]).tolist()
+        starts = [0] + ends[:-1]
+        file_io.write_postings_impact(
+            impact_fp, fusion,
+            [(encoded[t], int(counts[t])) for t in term_order],
+            ((relevances[s:e].tobytes(), fused[s:e].tobytes(),
+              ids[s:e].tobytes()) for s, e in zip(starts, ends)))
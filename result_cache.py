@@ -0,0 +1,104 @@
+"""
+Caches ranked query results. Entries are evicted least recently used first
+once the cache is full, expire after a time to live, and are all dropped when
+the index files they were computed from change
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_SIZE = 4096
+DEFAULT_TTL = 300.0  # seconds
+
+
+def index_version(paths):
+    """
+    identifies the current contents of the index files by their modification
+    times and sizes
+    :param paths: filepaths of the index files
+    :return: a tuple that changes whenever one of the files is rewritten
+    """
+    version = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            version.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            version.append(None)
+    return tuple(version)
+
+
+class ResultCache:
+    """
+    A size and time bounded LRU of query key -> results, with hit, miss,
+    eviction, expiration and invalidation counters
+    """
+
+    def __init__(self, size=DEFAULT_SIZE, ttl=DEFAULT_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (time stored, results)
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """returns the cached results for key, or None on a miss
+        """
+        with self.lock:
+            try:
+                stored, results = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if time.monotonic() - stored > self.ttl:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return results
+
+    def put(self, key, results):
+        """caches results under key, evicting the least recently used entry
+        if the cache is full
+        """
+        with self.lock:
+            self.entries[key] = (time.monotonic(), results)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def validate(self, version):
+        """drops every entry if the index version differs from the one the
+        entries were computed against
+
+        :return: True if the cache was invalidated
+        """
+        with self.lock:
+            if version == self.version:
+                return False
+            changed = self.version is not None
+            self.version = version
+            if changed:
+                self.entries.clear()
+                self.invalidations += 1
+            return changed
+
+    def stats(self):
+        """returns the cache's counters and hit rate
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "entries": len(self.entries), "size": self.size,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
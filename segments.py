@@ -0,0 +1,556 @@
+"""
+Segmented index for continuous ingest. Every batch of pages is written as an
+immutable segment (titles, term frequencies, links and deleted ids) and
+listed in a manifest; a page in a newer segment replaces the same id in older
+ones, and a deleted id hides it. SegmentQuerier searches all live segments
+with corpus-wide idf, so results match a single index of the same pages,
+while background merger threads compact small segments as batches arrive
+"""
+import logging
+import math
+import os
+import sys
+import threading
+from collections import Counter
+from collections.abc import Mapping
+import file_io
+import pagerank
+import result_cache
+from index import iter_pages, page_fields, tokenize_page
+from link_graph import LinkGraph
+from query import Querier
+
+log = logging.getLogger("segments")
+
+MANIFEST = "manifest"
+RANKS = "ranks"
+
+
+def segment_path(directory: str, name: str, kind: str):
+    """
+    returns the filepath of one of a segment's files
+    :param kind: titles, words, links or deleted
+    """
+    return os.path.join(directory, name + "." + kind)
+
+
+class Segment:
+    """
+    One immutable segment
+    ids_to_titles: the segment's pages, in the order they were added
+    words_to_tf: words -> ids -> term frequency (count / max count in page)
+    page_links: titles -> titles they link to
+    deleted: ids deleted by the segment, which hides them in older segments
+    """
+
+    def __init__(self, ids_to_titles, words_to_tf, page_links, deleted):
+        self.ids_to_titles = ids_to_titles
+        self.words_to_tf = words_to_tf
+        self.page_links = page_links
+        self.deleted = deleted
+
+    @classmethod
+    def read(cls, directory: str, name: str):
+        """
+        reads a segment written by write
+        """
+        segment = cls({}, {}, {}, set())
+        file_io.read_title_file(segment_path(directory, name, "titles"),
+                                segment.ids_to_titles)
+        file_io.read_words_file(segment_path(directory, name, "words"),
+                                segment.words_to_tf)
+        file_io.read_links_file(segment_path(directory, name, "links"),
+                                segment.page_links)
+        file_io.read_ids_file(segment_path(directory, name, "deleted"),
+                              segment.deleted)
+        return segment
+
+    @classmethod
+    def from_xml(cls, xml_fp: str):
+        """
+        tokenizes the pages of an xml into a segment. A page given twice keeps
+        its last version, and <page deleted="true"> with an <id> deletes it
+        """
+        pages = {}
+        deleted = set()
+        for page in iter_pages(xml_fp):
+            id = int(page.find('id').text)
+            pages.pop(id, None)
+            if page.get('deleted') == 'true':
+                deleted.add(id)
+            else:
+                deleted.discard(id)
+                pages[id] = tokenize_page(page_fields(page))
+
+        segment = cls({}, {}, {}, deleted)
+        for id, (title, _, words_to_count, links, _) in pages.items():
+            segment.ids_to_titles[id] = title
+            segment.page_links[title] = list(links)
+            if words_to_count:
+                aij = max(words_to_count.values())
+                for word, count in words_to_count.items():
+                    segment.words_to_tf.setdefault(word, {})[id] = \
+                        count / aij
+        return segment
+
+    def write(self, directory: str, name: str):
+        """
+        writes the segment's files; they are not live until the segment is
+        added to the manifest
+        """
+        file_io.write_title_file(segment_path(directory, name, "titles"),
+                                 self.ids_to_titles)
+        file_io.write_words_file(segment_path(directory, name, "words"),
+                                 self.words_to_tf)
+        file_io.write_links_file(segment_path(directory, name, "links"),
+                                 self.page_links)
+        file_io.write_ids_file(segment_path(directory, name, "deleted"),
+                               sorted(self.deleted))
+
+
+def live_ids(segments):
+    """
+    works out which pages of each segment are live: those not replaced or
+    deleted by a newer segment
+    :param segments: list of Segments, oldest first
+    :return: list of the live ids of each segment
+    """
+    hidden = set()
+    live = []
+    for segment in reversed(segments):
+        live.append({id for id in segment.ids_to_titles if id not in hidden})
+        hidden.update(segment.ids_to_titles)
+        hidden.update(segment.deleted)
+    live.reverse()
+    return live
+
+
+def merge_segments(segments, drop_deleted: bool):
+    """
+    merges consecutive segments into one with the same live pages
+    :param segments: list of Segments, oldest first
+    :param drop_deleted: whether the deleted ids can be forgotten, which is
+    only the case when no older segment remains for them to hide
+    :return: the merged Segment
+    """
+    merged = Segment({}, {}, {}, set())
+    for segment, ids in zip(segments, live_ids(segments)):
+        for id, title in segment.ids_to_titles.items():
+            if id in ids:
+                merged.ids_to_titles[id] = title
+        for title, links in segment.page_links.items():
+            merged.page_links[title] = links
+        for word, ids_to_tf in segment.words_to_tf.items():
+            for id, tf in ids_to_tf.items():
+                if id in ids:
+                    merged.words_to_tf.setdefault(word, {})[id] = tf
+        if not drop_deleted:
+            merged.deleted.update(segment.deleted)
+    # links are keyed by title, so keep only those of live pages
+    titles = set(merged.ids_to_titles.values())
+    merged.page_links = {title: links for title, links in
+                         merged.page_links.items() if title in titles}
+    return merged
+
+
+class TieredMergePolicy:
+    """
+    Merges merge_factor consecutive segments of the same size tier, where the
+    tier of a segment of n pages is floor(log(n, merge_factor)), so every page
+    is rewritten about log(pages, merge_factor) times. Segments of max_pages
+    or more are never merged
+    """
+
+    def __init__(self, merge_factor=4, max_pages=None):
+        if merge_factor < 2:
+            raise ValueError("merge_factor must be at least 2")
+        self.merge_factor = merge_factor
+        self.max_pages = max_pages
+
+    def tier(self, pages: int):
+        tier = 0
+        while pages >= self.merge_factor:
+            pages //= self.merge_factor
+            tier += 1
+        return tier
+
+    def __call__(self, sizes):
+        """
+        picks the segments to merge next
+        :param sizes: the number of pages of each live segment, oldest first,
+        or None for a segment that is already being merged
+        :return: (start, stop) of the run of segments to merge, lowest tier
+        first, or None
+        """
+        best = None
+        run = []  # indices of the current run of same-tier segments
+        for i, pages in enumerate(sizes):
+            if pages is None or (self.max_pages is not None and
+                                 pages >= self.max_pages):
+                run = []
+                continue
+            if run and self.tier(sizes[run[0]]) != self.tier(pages):
+                run = []
+            run.append(i)
+            if len(run) == self.merge_factor:
+                tier = self.tier(pages)
+                if best is None or tier < best[0]:
+                    best = (tier, run[0], i + 1)
+                run = []
+        return None if best is None else best[1:]
+
+
+class SegmentedIndex:
+    """
+    Writes batches of pages as segments of the index in directory, and merges
+    them as merge_policy asks, either in the foreground (merge_pending) or on
+    merge_threads background threads (start). One process writes an index;
+    any number of SegmentQueriers may read it meanwhile
+    """
+
+    def __init__(self, directory, merge_policy=None, merge_threads=1,
+                 rank_after_merge=True):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.manifest_fp = os.path.join(directory, MANIFEST)
+        self.merge_policy = merge_policy or TieredMergePolicy()
+        self.merge_threads = merge_threads
+        self.rank_after_merge = rank_after_merge
+
+        self.segments = []  # (name, pages), oldest first
+        if os.path.exists(self.manifest_fp):
+            file_io.read_manifest_file(self.manifest_fp, self.segments)
+        self.generation = max(
+            (int(name[3:]) for name, _ in self.segments), default=0)
+        self.merging = set()  # names of segments being merged
+        self.reading = Counter()  # names of segments being read -> readers
+        self.lock = threading.Condition()
+        self.rank_lock = threading.Lock()
+        self.threads = []
+        self.stopping = False
+        self.failure = None  # the exception that stopped a merger thread
+
+    def next_name(self):
+        """
+        returns a new segment name; called with the lock held
+        """
+        self.generation += 1
+        return "seg%06d" % self.generation
+
+    def add(self, xml_fp: str):
+        """
+        writes the pages of an xml as a new segment and makes it live
+        :return: the segment's name
+        """
+        segment = Segment.from_xml(xml_fp)
+        with self.lock:
+            name = self.next_name()
+        segment.write(self.directory, name)
+        with self.lock:
+            self.segments.append((name, len(segment.ids_to_titles)))
+            file_io.write_manifest_file(self.manifest_fp, self.segments)
+            self.lock.notify_all()
+        return name
+
+    def pick_merge(self):
+        """
+        asks the merge policy for the next run of segments to merge and marks
+        them as being merged; called with the lock held
+        :return: the names of the run, or None
+        """
+        sizes = [None if name in self.merging else pages
+                 for name, pages in self.segments]
+        run = self.merge_policy(sizes)
+        if run is None:
+            return None
+        names = [name for name, _ in self.segments[run[0]:run[1]]]
+        self.merging.update(names)
+        return names
+
+    def merge(self, names):
+        """
+        merges the named consecutive segments into a new one, swaps it into
+        the manifest in their place and deletes their files once no
+        update_pagerank is reading them
+        """
+        with self.lock:
+            drop_deleted = self.segments[0][0] == names[0]
+            name = self.next_name()
+        segments = [Segment.read(self.directory, n) for n in names]
+        merged = merge_segments(segments, drop_deleted)
+        merged.write(self.directory, name)
+
+        with self.lock:
+            start = [n for n, _ in self.segments].index(names[0])
+            self.segments[start:start + len(names)] = [
+                (name, len(merged.ids_to_titles))]
+            file_io.write_manifest_file(self.manifest_fp, self.segments)
+            self.merging.difference_update(names)
+            self.lock.notify_all()
+            # the segments update_pagerank is reading are deleted once it is
+            # done; queriers that read the old manifest retry with the new one
+            while any(self.reading[n] for n in names):
+                self.lock.wait()
+        for n in names:
+            for kind in ("titles", "words", "links", "deleted"):
+                os.remove(segment_path(self.directory, n, kind))
+        return name
+
+    def merge_pending(self):
+        """
+        merges in the foreground until the merge policy is satisfied
+        :return: the number of merges done
+        """
+        merges = 0
+        while True:
+            with self.lock:
+                names = self.pick_merge()
+            if names is None:
+                return merges
+            self.merge(names)
+            merges += 1
+            if self.rank_after_merge:
+                self.update_pagerank()
+
+    def start(self):
+        """
+        starts the background merger threads
+        """
+        self.stopping = False
+        self.failure = None
+        for _ in range(self.merge_threads):
+            thread = threading.Thread(target=self.merge_loop, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """
+        stops the merger threads once their current merges finish
+        """
+        with self.lock:
+            self.stopping = True
+            self.lock.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def wait_idle(self):
+        """
+        blocks until no merge is running and the merge policy has nothing
+        left to merge; the merger threads must have been started
+        :raises RuntimeError: if a merger thread stopped on an error
+        """
+        with self.lock:
+            while self.failure is None and (self.merging or self.merge_policy(
+                    [pages for _, pages in self.segments]) is not None):
+                self.lock.wait()
+            failure = self.failure
+        if failure is not None:
+            raise RuntimeError("a background merge failed") from failure
+
+    def merge_loop(self):
+        """
+        merges whenever the merge policy finds segments to merge, sleeping
+        until a segment is added or another merge finishes otherwise; a
+        failed merge is logged and stops the thread
+        """
+        while True:
+            with self.lock:
+                names = None
+                while not self.stopping:
+                    names = self.pick_merge()
+                    if names is not None:
+                        break
+                    self.lock.wait()
+                if self.stopping:
+                    if names is not None:
+                        self.merging.difference_update(names)
+                    return
+            try:
+                self.merge(names)
+                if self.rank_after_merge:
+                    self.update_pagerank()
+            except Exception as e:
+                log.exception("merging %s failed", ", ".join(names))
+                with self.lock:
+                    self.merging.difference_update(names)
+                    self.failure = e
+                    self.lock.notify_all()
+                return
+
+    def update_pagerank(self):
+        """
+        recomputes PageRank over the live pages of every segment, warm
+        started from the previous ranks, and writes it to the ranks file
+        """
+        with self.rank_lock:
+            with self.lock:
+                names = [name for name, _ in self.segments]
+                self.reading.update(names)
+            try:
+                segments = [Segment.read(self.directory, n) for n in names]
+            finally:
+                with self.lock:
+                    self.reading -= Counter(names)
+                    self.lock.notify_all()
+            ids_to_titles = {}
+            page_links = {}
+            for segment, ids in zip(segments, live_ids(segments)):
+                for id, title in segment.ids_to_titles.items():
+                    if id in ids:
+                        ids_to_titles[id] = title
+                        page_links[title] = segment.page_links.get(title, [])
+
+            ranks_fp = os.path.join(self.directory, RANKS)
+            previous = {}
+            if os.path.exists(ranks_fp):
+                file_io.read_docs_file(ranks_fp, previous)
+            ids_to_pageranks = pagerank.page_rank(
+                LinkGraph.from_page_links(ids_to_titles, page_links),
+                start=previous or None)
+            file_io.write_docs_file(ranks_fp + ".tmp", ids_to_pageranks)
+            os.replace(ranks_fp + ".tmp", ranks_fp)
+
+
+class SegmentedPostings(Mapping):
+    """
+    Read-only words -> ids -> relevance mapping over the live pages of a
+    list of segments. A lookup gathers the word's term frequencies from every
+    segment and weighs them by its idf over all live pages, as
+    Indexer.fill_relevancy would for one index of the same pages
+    """
+
+    def __init__(self, segments, live):
+        self.segments = segments
+        self.live = live
+        self.number_of_documents = sum(len(ids) for ids in live)
+
+    def __getitem__(self, word):
+        ids_to_tf = {}
+        for segment, ids in zip(self.segments, self.live):
+            for id, tf in segment.words_to_tf.get(word, {}).items():
+                if id in ids:
+                    ids_to_tf[id] = tf
+        if not ids_to_tf:
+            raise KeyError(word)
+        idfi = math.log(self.number_of_documents / len(ids_to_tf))
+        return {id: idfi * tf for id, tf in ids_to_tf.items()}
+
+    def __iter__(self):
+        seen = set()
+        for segment, ids in zip(self.segments, self.live):
+            for word, ids_to_tf in segment.words_to_tf.items():
+                if word not in seen and not ids.isdisjoint(ids_to_tf):
+                    seen.add(word)
+                    yield word
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class SegmentQuerier(Querier):
+    """
+    Querier over a segmented index directory. The manifest and ranks files
+    are the index files watched for changes, so a query after a segment is
+    added or merged reloads the index; segments are immutable, so only
+    the new ones are read from disk. Pages added since the last PageRank
+    update get rank 1/n
+    """
+
+    def __init__(self, directory, pagerank, **kwargs):
+        self.directory = directory
+        self.loaded_segments = {}  # name -> Segment
+        manifest_fp = os.path.join(directory, MANIFEST)
+        super().__init__(manifest_fp, os.path.join(directory, RANKS),
+                         manifest_fp, pagerank, **kwargs)
+
+    def reopen_args(self):
+        """Returns (class, args, kwargs) that open this index again"""
+        _, args, kwargs = super().reopen_args()
+        return type(self), (self.directory, self.pagerank), kwargs
+
+    def load_index(self):
+        """Reads the live segments and ranks into the instance variables,
+        replacing whatever was loaded before
+        """
+        manifest_fp, ranks_fp, _ = self.index_fps
+        version = result_cache.index_version(self.index_fps)
+
+        for attempt in range(3):
+            names = []
+            file_io.read_manifest_file(manifest_fp, names)
+            try:
+                segments = [self.segment(name) for name, _ in names]
+                break
+            except FileNotFoundError:
+                # a merge replaced segments after the manifest was read
+                if attempt == 2:
+                    raise
+        self.loaded_segments = {name: self.loaded_segments[name]
+                                for name, _ in names}
+
+        live = live_ids(segments)
+        ids_to_titles = {}
+        for segment, ids in zip(segments, live):
+            for id, title in segment.ids_to_titles.items():
+                if id in ids:
+                    ids_to_titles[id] = title
+        ranks = {}
+        if os.path.exists(ranks_fp):
+            file_io.read_docs_file(ranks_fp, ranks)
+        default = 1 / len(ids_to_titles) if ids_to_titles else 0.0
+        ids_to_pagerank = {id: ranks.get(id, default) for id in ids_to_titles}
+        self.set_index(ids_to_titles, ids_to_pagerank,
+                       SegmentedPostings(segments, live))
+        if self.result_cache is not None:
+            self.result_cache.validate(version)
+
+    def segment(self, name: str):
+        """
+        returns a segment, reading it only if it was not loaded before
+        """
+        if name not in self.loaded_segments:
+            self.loaded_segments[name] = Segment.read(self.directory, name)
+        return self.loaded_segments[name]
+
+
+# REPL
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    merge_factor = 4
+    if "--merge-factor" in args:
+        pos = args.index("--merge-factor")
+        try:
+            merge_factor = int(args[pos + 1])
+        except (IndexError, ValueError):
+            print("--merge-factor needs a number.")
+            sys.exit()
+        del args[pos:pos + 2]
+    use_pagerank = "--pagerank" in args
+    if use_pagerank:
+        args.remove("--pagerank")
+
+    if len(args) >= 3 and args[1] == "add":
+        segmented = SegmentedIndex(
+            args[0], TieredMergePolicy(merge_factor))
+        for xml_fp in args[2:]:
+            print("added", segmented.add(xml_fp))
+        segmented.merge_pending()
+    elif len(args) == 2 and args[1] == "merge":
+        segmented = SegmentedIndex(
+            args[0], TieredMergePolicy(merge_factor))
+        print(segmented.merge_pending(), "merges")
+    elif len(args) == 2 and args[1] == "rank":
+        SegmentedIndex(args[0]).update_pagerank()
+    elif len(args) == 2 and args[1] == "query":
+        q = SegmentQuerier(args[0], use_pagerank)
+        user_input = input("search> ")
+        while user_input != ":quit":
+            q.query(user_input)
+            user_input = input("search> ")
+    else:
+        print("usage: segments.py dir add pages.xml [more.xml ...] "
+              "[--merge-factor N]\n"
+              "       segments.py dir merge [--merge-factor N]\n"
+              "       segments.py dir rank\n"
+              "       segments.py dir query [--pagerank]")
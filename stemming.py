@@ -0,0 +1,115 @@
+"""
+Memoized Porter stemming shared by the indexer and querier. Word frequencies
+are heavily skewed, so a bounded LRU of recent stems avoids recomputing the
+same stems over and over
+"""
+import threading
+import time
+from collections import OrderedDict
+from nltk.stem import PorterStemmer
+import file_io
+
+DEFAULT_SIZE = 100000
+
+
+class StemCache:
+    """
+    A least-recently-used cache of word -> stem with hit/miss counters and
+    the seconds spent computing the stems of misses
+    """
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self.stemmer = PorterStemmer()
+        self.stems = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.seconds = 0.0
+        self.lock = threading.Lock()
+
+    def stem(self, word: str):
+        """returns the Porter stem of word, computing it only on a miss
+        """
+        with self.lock:
+            try:
+                stemmed = self.stems[word]
+                self.stems.move_to_end(word)
+                self.hits += 1
+                return stemmed
+            except KeyError:
+                self.misses += 1
+
+        start = time.perf_counter()
+        stemmed = self.stemmer.stem(word)
+        took = time.perf_counter() - start
+        with self.lock:
+            self.seconds += took
+            self.stems[word] = stemmed
+            if len(self.stems) > self.size:
+                self.stems.popitem(last=False)
+        return stemmed
+
+    def add(self, words_to_stems: dict):
+        """caches stems computed elsewhere, such as in worker processes, as
+        the most recently used ones
+        """
+        with self.lock:
+            for word, stemmed in words_to_stems.items():
+                self.stems[word] = stemmed
+                self.stems.move_to_end(word)
+            while len(self.stems) > self.size:
+                self.stems.popitem(last=False)
+
+    def resize(self, size: int):
+        """changes the maximum number of cached stems, evicting the least
+        recently used ones if needed
+        """
+        with self.lock:
+            self.size = size
+            while len(self.stems) > self.size:
+                self.stems.popitem(last=False)
+
+    def stats(self):
+        """returns the cache's hit/miss counts, size, hit rate and stemming
+        time
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "stem_seconds": self.seconds,
+                "entries": len(self.stems), "size": self.size,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def save(self, stems_fp: str):
+        """writes the cached stems to stems_fp, least recently used first
+        """
+        with self.lock:
+            file_io.write_stems_file(stems_fp, self.stems)
+
+    def load(self, stems_fp: str):
+        """warms the cache with the stems written to stems_fp by save
+        """
+        stems = {}
+        file_io.read_stems_file(stems_fp, stems)
+        self.add(stems)
+
+
+# the cache the tokenizer and Querier stem through (stem below); Indexer
+# saves it with stems_fp
+STEM_CACHE = StemCache()
+
+
+def stem(word: str):
+    """stems word through the shared cache
+    """
+    return STEM_CACHE.stem(word)
+
+
+def surface_words(words_to_stems: dict):
+    """returns stem -> the shortest word of words_to_stems with that stem
+    (the first in alphabetical order among equally short ones)
+    """
+    stems_to_words = {}
+    for word, stemmed in sorted(words_to_stems.items(),
+                                key=lambda x: (len(x[0]), x[0])):
+        stems_to_words.setdefault(stemmed, word)
+    return stems_to_words
@@ -0,0 +1,186 @@
+"""
+Term dictionary for type-ahead completion and "did you mean" spelling
+correction over the index terms or the page titles. The keys are held sorted,
+so the keys starting with a prefix form one contiguous range found by binary
+search (the leaves under that prefix's trie node), and every prefix whose
+range holds more than SCAN_LIMIT keys has its best COMPLETIONS keys
+precomputed, so completing any prefix ranks at most SCAN_LIMIT keys.
+Spelling correction is symmetric delete: the variants of every key's first
+PREFIX_LENGTH characters with up to MAX_EDITS characters deleted point back
+to the key, so the candidates for a word are found by looking up the word's
+own delete variants, and each is then checked with a bounded edit distance
+"""
+import heapq
+import threading
+from bisect import bisect_left, bisect_right
+
+COMPLETIONS = 10  # completions precomputed per heavy prefix
+SCAN_LIMIT = 256  # keys a prefix may hold before its completions are kept
+MAX_EDITS = 2
+PREFIX_LENGTH = 7  # characters of a key its delete variants are taken from
+LAST_KEY = chr(0x10ffff)  # sorts after any character of a key
+
+
+class TermDictionary:
+    """
+    Sorted keys with a weight (document frequency, pagerank...) and a value
+    each; completions and corrections return (key, weight, value) entries
+    keys: the keys, sorted
+    weights, values: the weight and value of each key, by position
+    """
+
+    def __init__(self, entries):
+        """
+        :param entries: iterable of (key, weight, value); keys may repeat
+        """
+        entries = sorted(entries, key=lambda entry: entry[0])
+        self.keys = [key for key, _, _ in entries]
+        self.weights = [weight for _, weight, _ in entries]
+        self.values = [value for _, _, value in entries]
+        self.tops = {}  # heavy prefix -> positions of its best keys
+        if self.keys:
+            self.best_positions(0, len(self.keys), 0)
+        self.deletes = None  # delete variant -> positions, built on first use
+        self.deletes_lock = threading.Lock()
+
+    def rank(self, pos: int):
+        """
+        sort key of the key at pos: higher weight first, then key order
+        """
+        return self.weights[pos], -pos
+
+    def best_positions(self, lo: int, hi: int, depth: int):
+        """
+        returns the positions of the COMPLETIONS best keys in keys[lo:hi],
+        which share their first depth characters, storing them in tops for
+        every heavy prefix at or below that node; a node's best keys are
+        among its own key and its children's best keys
+        """
+        if hi - lo <= SCAN_LIMIT:
+            return heapq.nlargest(COMPLETIONS, range(lo, hi), key=self.rank)
+        keys = self.keys
+        prefix = keys[lo][:depth]
+        candidates = []
+        i = lo
+        while i < hi and len(keys[i]) == depth:
+            candidates.append(i)
+            i += 1
+        while i < hi:
+            child = keys[i][:depth + 1]
+            j = bisect_right(keys, child + LAST_KEY, i, hi)
+            candidates.extend(self.best_positions(i, j, depth + 1))
+            i = j
+        best = heapq.nlargest(COMPLETIONS, candidates, key=self.rank)
+        self.tops[prefix] = best
+        return best
+
+    def entry(self, pos: int):
+        """
+        returns (key, weight, value) of the key at pos
+        """
+        return self.keys[pos], self.weights[pos], self.values[pos]
+
+    def complete(self, prefix: str, n=COMPLETIONS):
+        """
+        returns the n entries with the highest weight whose keys start with
+        prefix, best first (ties in key order)
+        """
+        if prefix in self.tops and n <= COMPLETIONS:
+            best = self.tops[prefix][:n]
+        else:
+            lo = bisect_left(self.keys, prefix)
+            hi = bisect_right(self.keys, prefix + LAST_KEY, lo)
+            best = heapq.nlargest(n, range(lo, hi), key=self.rank)
+        return [self.entry(pos) for pos in best]
+
+    def corrections(self, word: str, max_edits=MAX_EDITS, n=COMPLETIONS):
+        """
+        returns up to n entries whose keys are within max_edits insertions,
+        deletions, substitutions or adjacent transpositions of word, closest
+        first, then by weight, as (key, weight, value, distance). Closer keys
+        are looked for first, and farther ones only while fewer than n are
+        found. As delete variants are only taken of the first PREFIX_LENGTH
+        characters, a key two edits away can be missed when those edits
+        shift the rest of a long word
+        :param max_edits: at most MAX_EDITS
+        """
+        if max_edits > MAX_EDITS:
+            raise ValueError("at most %d edits are indexed" % MAX_EDITS)
+        deletes = self.delete_index()
+        for edits in range(max_edits + 1):
+            candidates = set()
+            for variant in delete_variants(word[:PREFIX_LENGTH], edits):
+                candidates.update(deletes.get(variant, ()))
+            found = []
+            for pos in candidates:
+                distance = edit_distance(word, self.keys[pos], edits)
+                if distance <= edits:
+                    found.append((distance, -self.weights[pos], pos))
+            if len(found) >= n:
+                break
+        return [self.entry(pos) + (distance,)
+                for distance, _, pos in heapq.nsmallest(n, found)]
+
+    def delete_index(self):
+        """
+        returns delete variant -> positions of the keys that have it, built
+        the first time a correction is looked up
+        """
+        with self.deletes_lock:
+            if self.deletes is None:
+                deletes = {}
+                for pos, key in enumerate(self.keys):
+                    for variant in delete_variants(key[:PREFIX_LENGTH],
+                                                   MAX_EDITS):
+                        deletes.setdefault(variant, []).append(pos)
+                self.deletes = deletes
+            return self.deletes
+
+    def __contains__(self, key):
+        pos = bisect_left(self.keys, key)
+        return pos < len(self.keys) and self.keys[pos] == key
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def delete_variants(word: str, max_edits: int):
+    """
+    returns the set of strings word becomes with up to max_edits characters
+    deleted, word itself included
+    """
+    variants = {word}
+    frontier = {word}
+    for _ in range(max_edits):
+        frontier = {variant[:i] + variant[i + 1:]
+                    for variant in frontier for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+def edit_distance(a: str, b: str, bound: int):
+    """
+    returns the optimal string alignment distance between a and b (edits
+    being insertions, deletions, substitutions and transpositions of adjacent
+    characters), or bound + 1 as soon as it must be more than bound. Only the
+    cells within bound of the diagonal are computed, as no alignment through
+    the others can stay within bound
+    """
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    over = bound + 1
+    previous = None
+    row = [j if j <= bound else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [i if i <= bound else over] + [over] * len(b)
+        for j in range(max(1, i - bound), min(len(b), i + bound) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(row[j] + 1, current[j - 1] + 1, row[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and
+                    a[i - 2] == b[j - 1]):
+                value = min(value, previous[j - 2] + 1)
+            current[j] = min(value, over)
+        if min(current) > bound:
+            return over
+        previous, row = row, current
+    return row[-1]
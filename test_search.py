@@ -1,5 +1,46 @@
+import glob
+import json
+import os
+import random
+import re
+import threading
+import xml.etree.ElementTree as et
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import bench
+import codec
+import file_io
 import index
+import link_graph
+import metrics
 import query
+import query_server
+import relevance
+import segments
+import pagerank
+import postings
+import stemming
+import term_dictionary
+import title_index
+import tokenizer
+import update
+
+# a corpus, a delta replacing B, deleting C and adding D, and the result
+BASE_XML = '''<xml>
+    <page><title>A</title><id>1</id><text>cats [[B]] [[C]]</text></page>
+    <page><title>B</title><id>2</id><text>dogs and cats</text></page>
+    <page><title>C</title><id>3</id><text>[[A|birds]] dogs</text></page>
+</xml>'''
+DELTA_XML = '''<xml>
+    <page><title>B</title><id>2</id><text>fish [[A]]</text></page>
+    <page deleted="true"><id>3</id></page>
+    <page><title>D</title><id>4</id><text>cats fish [[B]]</text></page>
+</xml>'''
+FULL_XML = '''<xml>
+    <page><title>A</title><id>1</id><text>cats [[B]] [[C]]</text></page>
+    <page><title>B</title><id>2</id><text>fish [[A]]</text></page>
+    <page><title>D</title><id>4</id><text>cats fish [[B]]</text></page>
+</xml>'''
 
 def test_index_SmallWiki():
     a = index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'words.txt', 'docs.txt')
@@ -136,4 +177,1009 @@ def test_one_relevant_page():
     for id in range(1, len(i.ids_to_pageranks) + 1):
         tot += i.ids_to_pageranks[id]
     assert round(tot, 2) == 1.00
-    assert round(i.ids_to_pageranks[100], 2) == 0.46
\ No newline at end of file
+    assert round(i.ids_to_pageranks[100], 2) == 0.46
+
+def test_streaming_matches_in_memory():
+    # streaming ingestion should index exactly what the in-memory parse does
+    a = index.Indexer('wikis/PageRankWiki.xml',
+                      'titles.txt', 'docs.txt', 'words.txt')
+    b = index.Indexer('wikis/PageRankWiki.xml',
+                      'titles.txt', 'docs.txt', 'words.txt', streaming=True)
+    assert a.ids_to_titles == b.ids_to_titles
+    assert a.relevance_dict == b.relevance_dict
+    assert a.ids_to_pageranks == b.ids_to_pageranks
+
+def test_sparse_page_rank_matches_dense():
+    # the sparse engine should agree with the dense N x N weights
+    i = index.Indexer('wikis/PageRankWiki.xml',
+                      'titles.txt', 'docs.txt', 'words.txt')
+    links = {title: [] for title in i.ids_to_titles.values()}
+    links['1'] = ['2', '1', 'not in corpus']
+    links['2'] = ['2']
+    dense = i.page_rank(i.calculate_weights(
+        i.get_valid_links(links)))
+    sparse = pagerank.page_rank(
+        link_graph.LinkGraph.from_page_links(i.ids_to_titles, links))
+    for id in dense:
+        assert round(dense[id], 4) == round(sparse[id], 4)
+
+def test_page_rank_methods_agree():
+    # every solver converges to power iteration's ranks, and extrapolation
+    # needs fewer steps to get there
+    i = index.Indexer('wikis/PageRankWiki.xml',
+                      'titles.txt', 'docs.txt', 'words.txt')
+    graph = i.link_graph
+    expected = pagerank.page_rank(graph, tol=1e-12)
+    power_steps = []
+    pagerank.page_rank(graph, tol=1e-10, history=power_steps)
+    for method in pagerank.METHODS:
+        steps = []
+        ranks = pagerank.page_rank(graph, method=method, tol=1e-10,
+                                   norm='l1', history=steps)
+        assert steps and steps[-1] < 1e-10
+        for id in expected:
+            assert abs(ranks[id] - expected[id]) < 1e-6
+        if method in ('aitken', 'quadratic'):
+            assert len(steps) < len(power_steps)
+    # warm starting from the answer converges at once
+    steps = []
+    pagerank.page_rank(graph, start=expected, tol=1e-6, history=steps)
+    assert len(steps) == 1
+    for bad in [{'method': 'jacobi'}, {'norm': 'l3'}]:
+        try:
+            pagerank.page_rank(graph, **bad)
+            assert False, bad
+        except ValueError:
+            pass
+    # the indexer passes its options through
+    i = index.Indexer('wikis/PageRankWiki.xml', 'titles.txt', 'docs.txt',
+                      'words.txt', rank_options={'method': 'gauss_seidel',
+                                                 'tol': 1e-10})
+    for id in expected:
+        assert abs(i.ids_to_pageranks[id] - expected[id]) < 1e-6
+
+def test_rank_matches_full_sort():
+    # term-at-a-time top-k should equal scoring and sorting every document
+    index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'docs.txt', 'words.txt')
+    for pr in [False, True]:
+        q = query.Querier('titles.txt', 'docs.txt', 'words.txt', pr)
+        for terms in [['cat'], ['war', 'battl'], ['bass', 'fish', 'bass']]:
+            scores = {}
+            for j in q.ids_to_titles:
+                tot = 0
+                for k in terms:
+                    if j in q.words_to_doc_to_relevance.get(k, {}):
+                        tot += q.words_to_doc_to_relevance[k][j]
+                        if pr:
+                            tot *= q.ids_to_pagerank[j]
+                scores[j] = tot
+            expected = [x for x in sorted(scores.items(), key=lambda x: x[1],
+                                          reverse=True) if x[1] != 0][:10]
+            assert q.rank(terms) == expected
+
+def test_binary_words_file(tmp_path):
+    # the memory-mapped binary words file should hold the same postings
+    titles, docs, words = [str(tmp_path / name)
+                           for name in ['titles.txt', 'docs.txt', 'words.bin']]
+    i = index.Indexer('wikis/SmallWiki.xml', titles, docs, words, binary=True)
+    q = query.Querier(titles, docs, words, False)
+    assert len(q.words_to_doc_to_relevance) == len(i.relevance_dict)
+    assert 'notaword' not in q.words_to_doc_to_relevance
+    for word in ['cat', 'war', 'carthag']:
+        postings = q.words_to_doc_to_relevance[word]
+        assert postings.keys() == i.relevance_dict[word].keys()
+        for id in postings:
+            assert abs(postings[id] - i.relevance_dict[word][id]) < 1e-6
+    assert sorted(q.words_to_doc_to_relevance) == sorted(i.relevance_dict)
+
+def test_parallel_matches_serial():
+    # tokenizing across worker processes must produce identical index files
+    index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'docs.txt', 'words.txt')
+    serial = [open(f).read() for f in ['titles.txt', 'docs.txt', 'words.txt']]
+    index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'docs.txt', 'words.txt',
+                  streaming=True, workers=2)
+    parallel = [open(f).read() for f in ['titles.txt', 'docs.txt', 'words.txt']]
+    assert serial == parallel
+
+def test_stem_cache(tmp_path):
+    # the shared cache memoizes stems, stays bounded and can be persisted
+    cache = stemming.StemCache(size=2)
+    assert cache.stem('running') == 'run'
+    assert cache.stem('running') == 'run'
+    cache.stem('cats')
+    cache.stem('wars')
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 3
+    assert list(cache.stems) == ['cats', 'wars']
+
+    stems_fp = str(tmp_path / 'stems.txt')
+    cache.save(stems_fp)
+    warm = stemming.StemCache()
+    warm.load(stems_fp)
+    assert warm.stem('cats') == 'cat'
+    assert warm.stats()['misses'] == 0
+
+    # stems computed in worker processes are merged back before saving
+    titles, docs, words = [str(tmp_path / name)
+                           for name in ['titles.txt', 'docs.txt', 'words.txt']]
+    shared = stemming.STEM_CACHE
+    stemming.STEM_CACHE = stemming.StemCache()
+    try:
+        i = index.Indexer('wikis/SmallWiki.xml', titles, docs, words,
+                          workers=2, stems_fp=stems_fp)
+    finally:
+        stemming.STEM_CACHE = shared
+    saved = {}
+    file_io.read_stems_file(stems_fp, saved)
+    assert saved['carthage'] == 'carthag'
+    assert set(i.relevance_dict) <= set(saved.values())
+
+def test_incremental_update(tmp_path):
+    # applying a delta should match reindexing the updated corpus
+    base, delta, full, titles, docs, words, counts, links, a, b, c = [
+        str(tmp_path / name) for name in
+        ['base.xml', 'delta.xml', 'full.xml', 'titles.txt', 'docs.txt',
+         'words.txt', 'counts.txt', 'links.txt', 'a.txt', 'b.txt', 'c.txt']]
+    for name, xml in [(base, BASE_XML), (delta, DELTA_XML),
+                      (full, FULL_XML)]:
+        with open(name, 'w') as f:
+            f.write(xml)
+
+    index.Indexer(base, titles, docs, words, counts_fp=counts, links_fp=links)
+    u = update.Updater(delta, titles, docs, words, counts, links)
+    f = index.Indexer(full, a, b, c)
+
+    assert u.ids_to_titles == f.ids_to_titles
+    assert u.relevance_dict == f.relevance_dict
+    for id in f.ids_to_pageranks:
+        assert abs(u.ids_to_pageranks[id] - f.ids_to_pageranks[id]) < 0.001
+    # the deleted page's title was appended as a deletion
+    assert query.Querier(titles, docs, words, False).ids_to_titles == \
+        f.ids_to_titles
+
+    # a delta that keeps the page count only recomputes the touched words,
+    # and appends them to the words file
+    with open(delta, 'w') as d:
+        d.write('<xml><page><title>D</title><id>4</id><text>owls</text>'
+                '</page></xml>')
+    with open(full, 'w') as d:
+        d.write(FULL_XML.replace('cats fish [[B]]', 'owls'))
+    with open(words, 'rb') as w:
+        written = w.read()
+    u = update.Updater(delta, titles, docs, words, counts, links)
+    f = index.Indexer(full, a, b, c)
+    assert u.affected_words == {'cat', 'fish', 'owl'}
+    assert u.relevance_dict == f.relevance_dict
+    with open(words, 'rb') as w:
+        assert w.read().startswith(written)
+    for lazy in [False, True]:
+        q = query.Querier(titles, docs, words, False, lazy=lazy)
+        assert q.ids_to_titles == f.ids_to_titles
+        postings = q.words_to_doc_to_relevance
+        assert {word: postings[word] for word in postings} == \
+            f.relevance_dict
+        assert q.rank(['owl']) == [(4, u.relevance_dict['owl'][4])]
+        assert q.rank(['dog']) == []
+
+    # the graph, positions, impact, dictionary and stems files are updated
+    # with the index
+    side = {name: str(tmp_path / name) for name in
+            ['graph', 'positions', 'impact', 'dictionary', 'stems']}
+    rebuilt = {name: fp + '.full' for name, fp in side.items()}
+    with open(full, 'w') as d:
+        d.write(FULL_XML)
+    index.Indexer(base, titles, docs, words, counts_fp=counts, links_fp=links,
+                  **{name + '_fp': fp for name, fp in side.items()})
+    with open(delta, 'w') as d:
+        d.write(DELTA_XML)
+    u = update.Updater(delta, titles, docs, words, counts, links,
+                       **{name + '_fp': fp for name, fp in side.items()})
+    f = index.Indexer(full, a, b, c,
+                      **{name + '_fp': fp for name, fp in rebuilt.items()
+                         if name != 'stems'})
+    graph = file_io.read_graph_file(side['graph'])
+    assert list(graph.ids) == list(f.ids_to_titles)
+    assert list(graph.targets) == list(f.link_graph.targets)
+    with open(side['positions'], 'rb') as updated, \
+            open(rebuilt['positions'], 'rb') as full_positions:
+        assert updated.read() == full_positions.read()
+    impact = file_io.ImpactPostings(side['impact'])
+    assert sorted(impact) == sorted(f.relevance_dict)
+    assert impact['fish'].keys() == f.relevance_dict['fish'].keys()
+    impact.close()
+    terms, titles_ranks, full_terms, full_titles = [], [], [], []
+    file_io.read_dictionary_file(side['dictionary'], terms, titles_ranks)
+    file_io.read_dictionary_file(rebuilt['dictionary'], full_terms,
+                                 full_titles)
+    assert sorted(terms) == sorted(full_terms)
+    assert [(id, title) for id, _, title in titles_ranks] == \
+        [(id, title) for id, _, title in full_titles]
+    saved = {}
+    file_io.read_stems_file(side['stems'], saved)
+    assert saved['fish'] == 'fish' and saved['cats'] == 'cat'
+
+    # a compressed index is updated from the exact counts rather than from
+    # its quantized relevances, so it matches a compressed rebuild
+    pages = ['<page><title>A</title><id>1</id><text>fish fish cats</text>'
+             '</page>', '<page><title>B</title><id>2</id><text>fish' +
+             ' dogs' * 7 + '</text></page>',
+             '<page><title>C</title><id>3</id><text>owls</text></page>']
+    with open(base, 'w') as d:
+        d.write('<xml>' + ''.join(pages) + '</xml>')
+    pages[2] = pages[2].replace('owls', 'owls cats')
+    with open(delta, 'w') as d:
+        d.write('<xml>' + pages[2] + '</xml>')
+    with open(full, 'w') as d:
+        d.write('<xml>' + ''.join(pages) + '</xml>')
+    compressed = str(tmp_path / 'words.cmp')
+    index.Indexer(base, titles, docs, compressed, counts_fp=counts,
+                  links_fp=links, compressed=8)
+    u = update.Updater(delta, titles, docs, compressed, counts, links)
+    f = index.Indexer(full, a, b, c, compressed=8)
+    assert 'fish' not in u.affected_words
+    assert u.relevance_dict == f.relevance_dict
+    with open(compressed, 'rb') as updated, open(c, 'rb') as rebuilt:
+        assert updated.read() == rebuilt.read()
+
+def test_query_server():
+    # the server answers concurrent json queries from one loaded Querier
+    index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'docs.txt', 'words.txt')
+    q = query.Querier('titles.txt', 'docs.txt', 'words.txt', True)
+    server = query_server.QueryServer(q, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def fetch(terms):
+        url = 'http://127.0.0.1:%d/query?q=%s&k=5' % (
+            server.server_address[1], terms)
+        return json.loads(urllib.request.urlopen(url).read())
+
+    try:
+        with ThreadPoolExecutor(4) as pool:
+            responses = list(pool.map(fetch, ['war', 'cats', 'war'] * 4))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    expected = [list(x) for x in q.search('war', 5)]
+    assert [[r['id'], r['title'], r['score']]
+            for r in responses[0]['results']] == expected
+    assert responses[2] == dict(responses[0], took_ms=responses[2]['took_ms'])
+
+def test_result_cache(tmp_path, caplog):
+    # repeated queries are served from the cache until the index changes
+    titles, docs, words = [str(tmp_path / name)
+                           for name in ['titles.txt', 'docs.txt', 'words.txt']]
+    index.Indexer('wikis/PageRankExample1.xml', titles, docs, words)
+    q = query.Querier(titles, docs, words, False, cache_size=1)
+    first = q.search('f')
+    assert q.search('F') == first
+    assert q.result_cache.stats()['hits'] == 1
+    q.search('a')
+    assert q.result_cache.stats()['evictions'] == 1
+
+    # reindexing a different wiki into the same files invalidates the cache
+    index.Indexer('wikis/PageRankWiki.xml', titles, docs, words)
+    assert q.search('f') != first
+    assert q.result_cache.stats()['invalidations'] == 1
+    assert len(q.ids_to_titles) == 100
+
+    # an index that cannot be read is logged, and the loaded one is searched
+    # until a reload succeeds
+    second = q.search('f')
+    version = q.result_cache.version
+    os.rename(words, words + '.moved')
+    assert q.search('f') == second
+    assert q.result_cache.version == version
+    assert 'index not reloaded' in caplog.text
+    os.rename(words + '.moved', words)
+    index.Indexer('wikis/PageRankExample1.xml', titles, docs, words)
+    assert q.search('f') == first
+    assert q.result_cache.version != version
+
+    uncached = query.Querier(titles, docs, words, False, cache_size=0)
+    assert uncached.result_cache is None
+    assert uncached.search('f') == q.search('f')
+
+def test_benchmark(tmp_path):
+    # a tiny synthetic wiki indexes cleanly and reports every phase
+    output = str(tmp_path / 'bench.json')
+    results = bench.run_benchmark(output, pages=50, vocabulary=300,
+                                  queries=20)
+    assert set(results['index']) >= {'load', 'parse', 'fill_relevancy',
+                                      'build_links', 'page_rank', 'write'}
+    assert results['query']['pagerank']['p99_ms'] >= 0
+    with open(output) as f:
+        assert json.load(f)['settings']['pages'] == 50
+    assert bench.compare_results(results, results)[0][3] == 1.0
+
+def test_title_index():
+    # links resolve to page positions in one lookup each, and pages without
+    # valid links get the ALL_PAGES marker instead of every other title
+    titles = title_index.TitleIndex({10: 'a', 20: 'b', 30: 'c'})
+    assert 'b' in titles and 'z' not in titles
+    positions, degree = titles.resolve('a', ['b', 'c', 'b', 'z'])
+    assert sorted(positions) == [1, 2] and degree == 2
+    positions, degree = titles.resolve('a', ['a', 'b'])
+    assert sorted(positions) == [0, 1] and degree == 2
+    assert titles.resolve('a', ['a']) == (title_index.ALL_PAGES, 2)
+    assert titles.resolve('a', ['z']) == (title_index.ALL_PAGES, 2)
+    assert titles.resolve('a', []) == (title_index.ALL_PAGES, 2)
+
+def test_link_graph_file(tmp_path):
+    # the saved integer link graph reproduces PageRank without the xml
+    graph_fp = str(tmp_path / 'graph.bin')
+    i = index.Indexer('wikis/PageRankExample2.xml', 'titles.txt', 'docs.txt',
+                      'words.txt', graph_fp=graph_fp)
+    graph = file_io.read_graph_file(graph_fp)
+    assert list(graph.ids) == list(i.ids_to_titles)
+    assert list(graph.targets) == list(i.link_graph.targets)
+    assert pagerank.page_rank(graph) == i.ids_to_pageranks
+
+def test_phrase_and_proximity_queries(tmp_path):
+    # the positional index round-trips, and a phrase query only returns the
+    # documents holding the phrase
+    positions_fp = str(tmp_path / 'positions.bin')
+    i = index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'docs.txt',
+                      'words.txt', positions_fp=positions_fp)
+    positions = file_io.PositionalPostings(positions_fp)
+    assert sorted(positions) == sorted(i.words_to_docs_to_positions)
+    for word in ['unit', 'state', 'war']:
+        assert positions[word] == i.words_to_docs_to_positions[word]
+
+    q = query.Querier('titles.txt', 'docs.txt', 'words.txt', False,
+                      positions_fp=positions_fp)
+    plain = q.search('united states', 100)
+    phrase = q.search('"united states"', 100)
+    assert 0 < len(phrase) < len(plain)
+    for j, _, _ in phrase:
+        states = positions['state'][j]
+        assert any(p + 1 in states for p in positions['unit'][j])
+    assert q.search('"states united"', 100) != phrase
+
+    # adjacent query terms double a document's score with proximity 1
+    near = query.Querier('titles.txt', 'docs.txt', 'words.txt', False,
+                         positions_fp=positions_fp, proximity=1.0)
+    assert near.search('united states', 1)[0][2] == 2 * plain[0][2]
+
+    assert postings.intersect([[1, 3, 5], [3, 4, 5], [0, 3, 9]]) == [3]
+    assert postings.min_span([[1, 10], [5, 20], [12]]) == 7
+
+def test_boolean_queries(tmp_path):
+    # boolean queries keep exactly the documents a set evaluation would
+    for words_fp, binary in [('words.txt', False),
+                             (str(tmp_path / 'words.bin'), True)]:
+        i = index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'docs.txt',
+                          words_fp, binary=binary)
+        q = query.Querier('titles.txt', 'docs.txt', words_fp, False)
+        docs = {word: set(ids) for word, ids in
+                i.words_to_docs_to_count.items()}
+        every = set(i.ids_to_titles)
+        expected = {
+            'war AND carthage': docs['war'] & docs['carthag'],
+            'war NOT carthage': docs['war'] - docs['carthag'],
+            '(war OR carthage) AND NOT rome':
+                (docs['war'] | docs['carthag']) - docs['rome'],
+            'war AND (NOT carthage OR rome)':
+                docs['war'] & ((every - docs['carthag']) | docs['rome']),
+            'war OR NOT carthage': docs['war'] | (every - docs['carthag'])}
+        for user_input, ids in expected.items():
+            results = q.search(user_input, 200)
+            assert {j for j, _, _ in results} == ids
+        # survivors are ranked by the non-negated terms only
+        ranked = [j for j, _, _ in q.search('war NOT carthage', 200)]
+        assert ranked == [j for j, _, _ in q.search('war', 200)
+                          if j not in docs['carthag']]
+        # matches without a scoring term follow the scored ones with score 0
+        results = q.search('war OR NOT carthage', 200)
+        unscored = [j for j, _, score in results if score == 0]
+        assert set(unscored) == every - docs['carthag'] - docs['war']
+        assert results[-len(unscored):] == [(j, i.ids_to_titles[j], 0.0)
+                                            for j in sorted(unscored)]
+
+    # stop words are dropped, as outside boolean queries
+    assert (q.search('war AND the loot', 200) ==
+            q.search('war AND loot', 200) ==
+            q.search('war AND (loot OR NOT the)', 200))
+    assert q.search('the OR war', 200) == q.search('war', 200)
+    for malformed in ['war AND', '(war', 'war )', 'OR war', 'NOT war',
+                      'the AND a', 'NOT war AND NOT the']:
+        try:
+            q.search(malformed)
+            assert False, malformed
+        except ValueError:
+            pass
+    assert postings.difference([1, 3, 5, 9], [0, 3, 9]) == [1, 5]
+    assert postings.union([[1, 5], [0, 5, 9], []]) == [0, 1, 5, 9]
+
+def test_pruned_top_k_is_exact(tmp_path):
+    # MaxScore pruning must return exactly the top k of scoring every
+    # document, and skip postings doing it
+    for words_fp, options in [('words.txt', {}),
+                              (str(tmp_path / 'words.bin'), {'binary': True}),
+                              (str(tmp_path / 'words.cmp'),
+                               {'compressed': 8})]:
+        index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'docs.txt',
+                      words_fp, **options)
+        for pr in [False, True]:
+            q = query.Querier('titles.txt', 'docs.txt', words_fp, pr,
+                              cache_size=0)
+            for terms in [['war', 'battl', 'carthag', 'rome'],
+                          ['unit', 'state', 'the', 'war', 'unit'],
+                          ['cat', 'notaword'], ['citi', 'empir', 'war']]:
+                scores = {}
+                for j in q.ids_to_titles:
+                    tot = 0
+                    for t in terms:
+                        postings_t = q.words_to_doc_to_relevance.get(t, {})
+                        if j in postings_t:
+                            tot += postings_t[j]
+                            if pr:
+                                tot *= q.ids_to_pagerank[j]
+                    if tot != 0:
+                        scores[j] = tot
+                expected = sorted(scores.items(), key=lambda x: x[1],
+                                  reverse=True)
+                for k in [1, 3, 10]:
+                    assert q.rank(terms, k) == expected[:k]
+            stats = q.pruning_stats()
+            assert stats['postings_scored'] > 0
+            if not pr:
+                assert stats['postings_skipped'] > 0
+
+def test_segmented_index(tmp_path, monkeypatch, caplog):
+    # segments answer like one index of the live pages, before and after
+    # merging, with newer segments replacing and deleting older pages
+    base, delta, full, batch, titles, docs, words = [
+        str(tmp_path / name) for name in
+        ['base.xml', 'delta.xml', 'full.xml', 'batch.xml', 'titles.txt',
+         'docs.txt', 'words.txt']]
+    for name, xml in [(base, BASE_XML), (delta, DELTA_XML),
+                      (full, FULL_XML)]:
+        with open(name, 'w') as f:
+            f.write(xml)
+
+    directory = str(tmp_path / 'merged')
+    s = segments.SegmentedIndex(directory, segments.TieredMergePolicy(2))
+    s.add(base)
+    s.add(delta)
+    index.Indexer(full, titles, docs, words)
+    full = query.Querier(titles, docs, words, False)
+    q = segments.SegmentQuerier(directory, False)
+    for user_input in ['cats', 'fish dogs', 'birds', 'cats NOT fish']:
+        assert q.search(user_input) == full.search(user_input)
+
+    assert s.merge_pending() == 1
+    assert len(s.segments) == 1
+    for user_input in ['cats', 'fish dogs', 'birds']:
+        assert q.search(user_input) == full.search(user_input)
+    assert q.ids_to_titles == full.ids_to_titles
+
+    # background merger threads compact batches added while querying
+    pages = et.parse('wikis/SmallWiki.xml').getroot().findall('page')
+    index.Indexer('wikis/SmallWiki.xml', titles, docs, words)
+    whole = query.Querier(titles, docs, words, False)
+    directory = str(tmp_path / 'threaded')
+    s = segments.SegmentedIndex(directory, segments.TieredMergePolicy(2),
+                                merge_threads=2)
+    s.start()
+    q = segments.SegmentQuerier(directory, False)
+    for b in range(0, len(pages), 16):
+        root = et.Element('xml')
+        root.extend(pages[b:b + 16])
+        et.ElementTree(root).write(batch)
+        s.add(batch)
+        q.search('war')
+    s.wait_idle()
+    s.stop()
+    assert len(s.segments) < len(range(0, len(pages), 16))
+    for user_input in ['war', 'united states', 'carthage']:
+        assert q.search(user_input) == whole.search(user_input)
+
+    # a merge deletes the segments it replaced only once update_pagerank
+    # is done reading them
+    directory = str(tmp_path / 'pinned')
+    s = segments.SegmentedIndex(directory, segments.TieredMergePolicy(2),
+                                rank_after_merge=False)
+    old = [s.add(base), s.add(delta)]
+    read = segments.Segment.read
+    merges = []
+
+    def read_during_merge(directory, name):
+        if not merges:
+            with s.lock:
+                names = s.pick_merge()
+            merges.append(threading.Thread(target=s.merge, args=(names,)))
+            merges[0].start()
+            merges[0].join(0.5)
+            assert merges[0].is_alive()
+        return read(directory, name)
+    monkeypatch.setattr(segments.Segment, 'read', read_during_merge)
+    s.update_pagerank()
+    merges[0].join()
+    assert len(s.segments) == 1
+    assert not os.path.exists(segments.segment_path(directory, old[0],
+                                                    'words'))
+
+    # a failed background merge is logged and raised by wait_idle, which
+    # would otherwise wait for it forever
+    def fail(merged, drop_deleted):
+        raise OSError('disk full')
+    monkeypatch.setattr(segments, 'merge_segments', fail)
+    s = segments.SegmentedIndex(str(tmp_path / 'failing'),
+                                segments.TieredMergePolicy(2))
+    s.add(base)
+    s.add(delta)
+    s.start()
+    try:
+        s.wait_idle()
+        assert False
+    except RuntimeError as e:
+        assert isinstance(e.__cause__, OSError)
+    s.stop()
+    assert not s.merging and len(s.segments) == 2
+    assert 'failed' in caplog.text and 'disk full' in caplog.text
+
+def test_relevance_arrays_match_fill_relevancy(tmp_path):
+    # the vectorized tf-idf writes the same words files, byte for byte
+    for words_fp, binary in [('words.txt', False),
+                             (str(tmp_path / 'words.bin'), True)]:
+        for wiki in ['wikis/SmallWiki.xml', 'wikis/MiniWiki1.xml',
+                     'wikis/Empty.xml']:
+            index.Indexer(wiki, 'titles.txt', 'docs.txt', words_fp,
+                          binary=binary)
+            with open(words_fp, 'rb') as f:
+                expected = f.read()
+            i = index.Indexer(wiki, 'titles.txt', 'docs.txt', words_fp,
+                              binary=binary, arrays=True)
+            assert i.relevance_dict == {}
+            with open(words_fp, 'rb') as f:
+                assert f.read() == expected
+
+def test_metrics(tmp_path):
+    # builds and queries report per-phase timings and counts, exported as
+    # json or Prometheus text
+    titles, docs, words = [str(tmp_path / name) for name in
+                           ['titles.txt', 'docs.txt', 'words.txt']]
+    i = index.Indexer('wikis/PageRankWiki.xml', titles, docs, words)
+    exported = i.metrics.to_dict()
+    for phase in ['load', 'parse', 'stem', 'fill_relevancy', 'build_links',
+                  'page_rank', 'write']:
+        assert exported['phases'][phase]['calls'] == 1
+    assert exported['counts']['pages'] == 100
+    assert exported['counts']['unique_terms'] == len(i.relevance_dict)
+    assert exported['counts']['links'] == len(i.link_graph.targets)
+    assert exported['counts']['pagerank_iterations'] > 0
+    assert i.timings['parse'] == exported['phases']['parse']['wall_s']
+    text = i.metrics.to_prometheus('search_index')
+    assert 'search_index_pages 100\n' in text
+    assert 'search_index_phase_wall_seconds{phase="page_rank"} ' in text
+
+    q = query.Querier(titles, docs, words, False)
+    q.search('page')
+    q.search('page')
+    counts = q.metrics.to_dict()['counts']
+    assert counts['queries'] == 2
+    assert q.metrics.to_dict()['phases']['rank']['calls'] == 2
+
+    profile_fp, report_fp, metrics_fp = [
+        str(tmp_path / name) for name in
+        ['profile.out', 'memory.txt', 'metrics.json']]
+    with metrics.profiled(profile_fp, report_fp):
+        q.search('page')
+    with open(report_fp) as f:
+        assert f.readline().startswith('traced memory')
+    q.metrics.write(metrics_fp, 'search_query')
+    with open(metrics_fp) as f:
+        assert json.load(f)['counts']['queries'] == 3
+    assert os.path.getsize(profile_fp) > 0
+
+def test_lazy_postings(tmp_path, monkeypatch):
+    # lazily parsed postings answer every query as the eagerly read index does
+    titles, docs, words_fp = [str(tmp_path / name) for name in
+                              ['titles.txt', 'docs.txt', 'words.txt']]
+    index.Indexer('wikis/SmallWiki.xml', titles, docs, words_fp)
+    eager = query.Querier(titles, docs, words_fp, False, cache_size=0)
+    lazy = query.Querier(titles, docs, words_fp, False, cache_size=0,
+                         lazy=True)
+    words = lazy.words_to_doc_to_relevance
+    assert isinstance(words, file_io.LazyPostings)
+    assert words.stats()['misses'] == 0
+    assert sorted(words) == sorted(eager.words_to_doc_to_relevance)
+    for user_input in ['war', 'cats dogs', 'war AND NOT carthage', 'zzzz']:
+        for pagerank in [False, True]:
+            eager.pagerank = lazy.pagerank = pagerank
+            assert lazy.search(user_input) == eager.search(user_input)
+    assert words['war'] == eager.words_to_doc_to_relevance['war']
+
+    # a query that is running when the index is reloaded keeps reading the
+    # postings it started with, which are released once it is done
+    binary_fp = str(tmp_path / 'words.bin')
+    index.Indexer('wikis/SmallWiki.xml', titles, docs, binary_fp, binary=True)
+    binary = query.Querier(titles, docs, binary_fp, False, cache_size=0)
+    for q in [lazy, binary]:
+        expected = q.search('rome AND NOT cat')
+        started = q.words_to_doc_to_relevance
+        boolean_docs = q.boolean_docs
+
+        def reload_midway(expression, words, ids_to_order):
+            q.load_index()
+            assert q.words_to_doc_to_relevance is not words
+            return boolean_docs(expression, words, ids_to_order)
+        monkeypatch.setattr(q, 'boolean_docs', reload_midway)
+        assert q.search('rome AND NOT cat') == expected
+        assert started['war'].keys() == \
+            eager.words_to_doc_to_relevance['war'].keys()
+    lazy.words_to_doc_to_relevance.close()
+
+    # a bounded cache, and a scan of the words file when the sidecar is stale
+    small = file_io.LazyPostings(words_fp, cache_size=2)
+    for term in ['war', 'cat', 'dog', 'war']:
+        assert small[term] == eager.words_to_doc_to_relevance[term]
+    assert small.stats()['entries'] == 2
+    assert small.stats()['misses'] == 4
+    small.close()
+    with open(words_fp + file_io.OFFSETS_SUFFIX, 'w') as f:
+        f.write('0 0\nwar 0\n')
+    rescanned = file_io.LazyPostings(words_fp)
+    assert rescanned['war'] == eager.words_to_doc_to_relevance['war']
+    rescanned.close()
+
+def test_query_batch(tmp_path):
+    # a batch answers every query as search does, in input order, with
+    # duplicates and malformed queries, in one process or several
+    titles, docs, words, tsv_fp, jsonl_fp = [
+        str(tmp_path / name) for name in
+        ['titles.txt', 'docs.txt', 'words.txt', 'out.tsv', 'out.jsonl']]
+    index.Indexer('wikis/SmallWiki.xml', titles, docs, words)
+    q = query.Querier(titles, docs, words, True)
+    queries = ['war', 'cats dogs', 'war', 'war AND', 'rome war',
+               'war NOT carthage', 'zzzz', 'Rome']
+    expected = []
+    for user_input in queries:
+        try:
+            expected.append((user_input, q.search(user_input, 5), None))
+        except ValueError as e:
+            expected.append((user_input, [], str(e)))
+    for workers in [1, 2]:
+        assert list(q.query_batch(iter(queries), 5, workers)) == expected
+    old_chunk = query.BATCH_CHUNK
+    query.BATCH_CHUNK = 3
+    try:
+        assert list(q.query_batch(queries, 5, 2)) == expected
+    finally:
+        query.BATCH_CHUNK = old_chunk
+
+    with open(tsv_fp, 'w') as f:
+        assert query.write_batch(expected, f, False) == len(queries)
+    with open(tsv_fp) as f:
+        lines = [line.rstrip('\n').split('\t') for line in f]
+    assert len(lines) == sum(max(len(results), 1)
+                             for _, results, _ in expected)
+    assert lines[0] == ['war', '1', str(expected[0][1][0][0]),
+                        expected[0][1][0][1], repr(expected[0][1][0][2])]
+    with open(jsonl_fp, 'w') as f:
+        query.write_batch(expected, f, True)
+    with open(jsonl_fp) as f:
+        answers = [json.loads(line) for line in f]
+    assert [answer['query'] for answer in answers] == queries
+    assert 'error' in answers[3] and 'error' not in answers[0]
+    assert [r['id'] for r in answers[4]['results']] == \
+        [j for j, _, _ in expected[4][1]]
+
+def test_impact_ordered_postings(tmp_path):
+    # postings sorted by fused static score, written alike from the dict and
+    # the arrays, and an approximate mode that is exact once it reads them all
+    impact_fp, arrays_fp = [str(tmp_path / name) for name in
+                            ['impact.bin', 'impact_arrays.bin']]
+    i = index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'docs.txt',
+                      'words.txt', impact_fp=impact_fp)
+    index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'docs.txt',
+                  'words.txt', arrays=True, impact_fp=arrays_fp)
+    with open(impact_fp, 'rb') as f, open(arrays_fp, 'rb') as g:
+        assert f.read() == g.read()
+    impact = file_io.ImpactPostings(impact_fp)
+    assert impact.fusion == 'product'
+    assert sorted(impact) == sorted(i.relevance_dict)
+    for word in ['war', 'rome', 'carthag']:
+        ids, relevances, fused = impact.postings(word)
+        assert impact[word] == i.relevance_dict[word]
+        assert list(fused) == sorted(fused, reverse=True)
+        assert list(fused) == [r * i.ids_to_pageranks[j]
+                               for j, r in zip(ids, relevances)]
+        assert impact.postings(word, 3)[0] == ids[:3]
+    assert impact.postings('zzzz') is None
+    try:
+        relevance.RelevanceArrays.from_relevance({}).write_impact(
+            impact_fp, {}, 'nope')
+        assert False
+    except ValueError:
+        pass
+
+    exact = query.Querier('titles.txt', 'docs.txt', 'words.txt', True,
+                          cache_size=0)
+    q = query.Querier('titles.txt', 'docs.txt', 'words.txt', True,
+                      cache_size=0, impact_fp=impact_fp,
+                      impact_limit=10 ** 6)
+    queries = ['war', 'rome war', 'war war carthage', 'zzzz', 'cats dogs']
+    for pagerank in [False, True]:
+        exact.pagerank = q.pagerank = pagerank
+        for user_input in queries:
+            assert q.search(user_input) == exact.search(user_input)
+    # a short prefix reads fewer postings and only finds documents that
+    # hold a query term; a one-term query ranks its top k exactly
+    q.pagerank = True
+    q.impact_limit = 10
+    before = q.pruning_stats()['postings_skipped']
+    found = q.search('war rome', 50)
+    assert q.pruning_stats()['postings_skipped'] > before
+    assert len(found) <= 20
+    assert {j for j, _, _ in found} <= \
+        set(i.relevance_dict['war']) | set(i.relevance_dict['rome'])
+    assert q.search('war', 10) == exact.search('war', 10)
+
+def test_term_dictionary(tmp_path):
+    # completions and corrections match a brute force over every key
+    rng = random.Random(7)
+    keys = {''.join(rng.choice('abcde') for _ in range(rng.randint(1, 8)))
+            for _ in range(3000)}
+    entries = [(key, rng.randint(1, 50), key.upper()) for key in keys]
+    d = term_dictionary.TermDictionary(entries)
+    assert len(d) == len(keys) and 'zz' not in d
+    assert d.tops  # heavy prefixes were precomputed
+    for prefix in ['', 'a', 'ab', 'abc', 'abcd', 'e', 'zz']:
+        expected = sorted((e for e in entries if e[0].startswith(prefix)),
+                          key=lambda e: (-e[1], e[0]))
+        assert d.complete(prefix) == expected[:10]
+        assert d.complete(prefix, 30) == expected[:30]
+    for word in ['abcdeab', 'ba', 'eeeeeeeee', 'q']:
+        expected = sorted(
+            (term_dictionary.edit_distance(word, key, 2), -weight, key)
+            for key, weight, _ in entries
+            if term_dictionary.edit_distance(word, key, 2) <= 2)
+        found = d.corrections(word, 2, 5)
+        assert [(distance, -weight, key)
+                for key, weight, _, distance in found] == expected[:5]
+    assert term_dictionary.edit_distance('ca', 'ac', 2) == 1
+    assert term_dictionary.edit_distance('kitten', 'sitting', 5) == 3
+    assert term_dictionary.edit_distance('kitten', 'sitting', 2) == 3
+    try:
+        d.corrections('abc', 3)
+        assert False
+    except ValueError:
+        pass
+
+    # the querier suggests index words for misspellings and completes
+    # partly typed words and titles
+    dictionary_fp = str(tmp_path / 'dictionary.txt')
+    i = index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'docs.txt',
+                      'words.txt', dictionary_fp=dictionary_fp)
+    q = query.Querier('titles.txt', 'docs.txt', 'words.txt', True,
+                      dictionary_fp=dictionary_fp)
+    assert len(q.term_dictionary) == len(i.relevance_dict)
+    assert q.search('carthoge') == []
+    suggestion = q.did_you_mean('carthoge AND the war')
+    assert suggestion.endswith(' AND the war')
+    assert stemming.stem(suggestion.split()[0]) == 'carthag'
+    assert q.search(suggestion) != []
+    assert q.did_you_mean('war') is None
+    assert q.did_you_mean('qqqqqqqq') is None
+    completions = q.complete('the war')
+    dfs = [df for _, df in completions['terms']]
+    assert dfs and dfs == sorted(dfs, reverse=True)
+    assert all(stemming.stem(word).startswith('war')
+               for word, _ in completions['terms'])
+    assert completions['titles'] == []
+    title = i.ids_to_titles[next(iter(i.ids_to_titles))]
+    titles = q.complete(title[:3].upper())['titles']
+    assert all(t.lower().startswith(title[:3].lower()) for _, t, _ in titles)
+    ranks = [rank for _, _, rank in titles]
+    assert ranks == sorted(ranks, reverse=True)
+    assert q.complete('war ')['terms'] == []
+
+    # terms are shown as words of the corpus, whichever process stemmed them
+    # and whatever the stem cache holds
+    workers_fp = str(tmp_path / 'workers.txt')
+    shared = stemming.STEM_CACHE
+    stemming.STEM_CACHE = stemming.StemCache()
+    try:
+        index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'docs.txt',
+                      'words.txt', workers=2, dictionary_fp=workers_fp)
+    finally:
+        stemming.STEM_CACHE = shared
+    with open(dictionary_fp) as f, open(workers_fp) as g:
+        assert f.read() == g.read()
+    assert 'unreferenced' in dict(q.complete('unreferenc')['terms'])
+
+def test_tokenizer_matches_legacy():
+    # the single-pass tokenizer indexes every page exactly as the old
+    # nested link handling did: same terms, counts, order, links, positions
+    for wiki in sorted(glob.glob('wikis/*.xml')):
+        for page in et.parse(wiki).getroot().findall('page'):
+            fields = index.page_fields(page)
+            assert index.tokenize_page(fields, positions=True) == \
+                legacy_tokenize_page(fields, positions=True)
+    texts = [
+        'plain [[Target]] words and the stop words',
+        '[[Category:Computer science]] [[a:the:b c d:e:f g]] [[:x]]',
+        '[[Page|shown text: with | pipes]] [[Cat:Page|shown]] [[x|]]',
+        '[[ Spaced  Target | A b ]] [[the]] [[a:]] [[and:or]]',
+        "it's [[multi\nline:link text]] ]] [[x]]] [[[y]]",
+        '',
+    ]
+    for text in texts:
+        fields = ('A Title', '7', text)
+        assert index.tokenize_page(fields, positions=True) == \
+            legacy_tokenize_page(fields, positions=True)
+    assert index.tokenize_page(('T', '1', None)) == \
+        legacy_tokenize_page(('T', '1', None))
+    # 'a' and 'the' are stop words, and a link target takes no position
+    assert list(tokenizer.tokenize('cats [[Dog|a b]]', 'the')) == [
+        ('cat', False), ('b', False), ('dog', True), (None, False)]
+
+def legacy_tokenize_page(fields, positions=False):
+    # tokenize_page as it was before tokenizer.py, the reference the
+    # single-pass tokenizer must reproduce exactly
+    regex = r'''\[\[[^\[]+?\]\]|[a-zA-Z0-9]+'[a-zA-Z0-9]+|[a-zA-Z0-9]+'''
+    raw_title, raw_id, text = fields
+    title: str = raw_title.strip().lower()
+    id: int = int(raw_id)
+    words_to_count = {}
+    links = []
+    words_to_positions = {} if positions else None
+    position = 0
+
+    # tokenize data
+    try:
+        t = re.findall(regex, text)
+        t += re.findall(regex, raw_title)
+        tokens = [x.strip() for x in t]
+    except TypeError:
+        tokens = []
+
+    for word in tokens:
+        # tokenize the word
+        return_list = []
+        pg_list = []  # tokenized word for use in page rank
+
+        # check if word is a link and handle appropriately based on
+        # contents of word
+        if '[[' and ']]' in word:
+            word = word.replace('[[', '').replace(']]', '')
+            pg_list = word
+
+            if ":" in word:
+                # strip, remove stop words
+                return_list = [i.strip().lower() for i in word.split(
+                    ":") if i not in index.Indexer.STOP_WORDS and i.strip(
+                ) != ""]
+
+                # remove spaces in words
+                for i in return_list:
+                    z = i.split()
+                    z = [j.strip() for j in z if j.strip() != ""]
+                    return_list = z + return_list
+                    return_list.remove(i)
+
+                # remove newlines in words
+                for i in return_list:
+                    z = i.split("\n")
+                    z = [k.strip() for k in z if k.strip() != ""]
+                    return_list = z + return_list
+                    return_list.remove(i)
+
+                # strip, remove stop words
+                return_list = [i.strip()
+                               for i in return_list if i.strip() != ""]
+
+                # handle pipes after splitting on colon
+                for i in return_list:
+                    if "|" in i:
+                        ind = i.index("|")
+                        words = i[ind + 1:]
+                        words = [i.strip().lower(
+                        ) for i in words if i.strip().lower(
+                        ) not in index.Indexer.STOP_WORDS and i.strip(
+                        ).lower() != ""]
+                        return_list = words + return_list
+
+            # handle pipes if colon is not in word
+            if "|" in word:
+                ind = word.index("|")
+
+                # don't include words before pipe
+                return_list = word[ind + 1:]
+
+                # strip, remove stop words
+                return_list = [i.strip().lower(
+                ) for i in return_list if i.strip().lower(
+                ) not in index.Indexer.STOP_WORDS and i.strip().lower() != ""]
+
+                pg_list = word.split("|")
+                pg_list = pg_list[0]
+
+            # stem words in return_list
+            return_list = [i for i in map(stemming.stem, return_list)
+                           if i != ""]
+
+            # add titles of linked pages
+            links.append(pg_list.strip().lower())
+
+        else:  # handling word if it is not a link
+            word = word.strip().lower()
+            word = stemming.stem(word)
+
+            if word not in index.Indexer.STOP_WORDS:
+                return_list = [word]
+            else:
+                return_list = []
+
+        # populate words_to_count
+        for offset, i in enumerate(return_list):
+            if i != ":" and i != "|":
+                try:
+                    words_to_count[i] += 1
+                except KeyError:
+                    words_to_count[i] = 1
+                if positions:
+                    try:
+                        words_to_positions[i].append(position + offset)
+                    except KeyError:
+                        words_to_positions[i] = [position + offset]
+        position += max(1, len(return_list))
+
+    return title, id, words_to_count, links, words_to_positions
+
+def test_compressed_words_file(tmp_path):
+    # delta + bit-packed ids and quantized relevances decode to the same
+    # postings, with every relevance within one quantization step
+    words_fp = str(tmp_path / 'words.cmp')
+    i = index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'docs.txt',
+                      'words.txt')
+    exact = query.Querier('titles.txt', 'docs.txt', 'words.txt', False,
+                          cache_size=0)
+    for bits in [8, 16]:
+        index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'docs.txt',
+                      words_fp, compressed=bits)
+        with open(words_fp, 'rb') as f:
+            written = f.read()
+        # the vectorized tf-idf writes the same file
+        index.Indexer('wikis/SmallWiki.xml', 'titles.txt', 'docs.txt',
+                      words_fp, compressed=bits, arrays=True)
+        with open(words_fp, 'rb') as f:
+            assert f.read() == written
+        assert file_io.is_binary_words_file(words_fp)
+        postings = file_io.binary_postings(words_fp)
+        assert isinstance(postings, file_io.CompressedPostings)
+        assert sorted(postings) == sorted(i.relevance_dict)
+        for word, docs in list(i.relevance_dict.items())[::10]:
+            step = max(docs.values()) / ((1 << bits) - 1)
+            decoded = postings[word]
+            assert sorted(decoded) == sorted(docs)
+            assert max(decoded.values()) == postings.max_relevance(word)
+            for j, relevance in docs.items():
+                assert abs(decoded[j] - relevance) <= step * 1.000001
+
+        q = query.Querier('titles.txt', 'docs.txt', words_fp, False,
+                          cache_size=0)
+        for user_input in ['war', 'cats dogs', 'the united states']:
+            found = [score for _, _, score in q.search(user_input)]
+            expected = [score for _, _, score in exact.search(user_input)]
+            assert len(found) == len(expected)
+            for a, b in zip(found, expected):
+                assert abs(a - b) <= 0.02 * expected[0]
+
+    # blocks round trip across block boundaries
+    ids = list(range(3, 3 + 7 * 300, 7)) + [10 ** 6]
+    quantized, scale = codec.quantize([0.001 * j for j in range(len(ids))], 8)
+    assert scale > 0 and quantized[0] == 0 and quantized[1] == 1
+    out = bytearray()
+    codec.encode_blocks(ids, quantized, '<u1', out)
+    decoded_ids, decoded = codec.decode_blocks(bytes(out), 0, len(ids), '<u1')
+    assert decoded_ids.tolist() == ids
+    assert decoded.tolist() == quantized.tolist()
+    report = bench.compression_report(
+        dict(list(i.relevance_dict.items())[:2000]), str(tmp_path))
+    assert report['text']['ratio'] == 1.0
+    assert report['compressed8']['bytes'] < report['compressed16']['bytes'] \
+        < report['binary']['bytes'] < report['text']['bytes']
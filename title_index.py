@@ -0,0 +1,69 @@
+"""
+Resolves link titles to pages. The title -> page map is built once per corpus,
+so checking or resolving a link is a hash lookup instead of a scan over every
+title, and a page without valid links gets the ALL_PAGES marker rather than a
+list of every other title
+"""
+
+
+class AllPages:
+    """
+    Marker for a page that links to every other page in the corpus
+    """
+
+    def __repr__(self):
+        return "ALL_PAGES"
+
+
+ALL_PAGES = AllPages()
+
+
+class TitleIndex:
+    """
+    Maps the lowercase titles of a corpus to the positions (0..n-1, in corpus
+    order) of the pages that have them
+    """
+
+    def __init__(self, ids_to_titles: dict):
+        self.ids = list(ids_to_titles)
+        self.title_to_positions = {}
+        for pos, id_num in enumerate(self.ids):
+            self.title_to_positions.setdefault(
+                ids_to_titles[id_num], []).append(pos)
+
+    def __contains__(self, title):
+        return title in self.title_to_positions
+
+    def __len__(self):
+        return len(self.ids)
+
+    def valid_links(self, title: str, links):
+        """
+        applies the link rules of Indexer.get_valid_links to one page:
+        duplicate links are dropped and links outside the corpus ignored,
+        and a page that only links to itself or has no valid links links to
+        every other page
+        :param title: the page's title
+        :param links: the titles the page links to
+        :return: the distinct valid link titles, or ALL_PAGES
+        """
+        links = set(links)
+        valid = [link for link in links if link in self.title_to_positions]
+        if (len(links) == 1 and title in links) or len(valid) == 0:
+            return ALL_PAGES
+        return valid
+
+    def resolve(self, title: str, links):
+        """
+        resolves a page's links to the positions of the pages they point to
+        :param title: the page's title
+        :param links: the titles the page links to
+        :return: (positions, out degree), or (ALL_PAGES, n - 1)
+        """
+        valid = self.valid_links(title, links)
+        if valid is ALL_PAGES:
+            return ALL_PAGES, len(self.ids) - 1
+        positions = []
+        for link in valid:
+            positions.extend(self.title_to_positions[link])
+        return positions, len(valid)
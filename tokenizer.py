@@ -0,0 +1,93 @@
+"""
+Single-pass tokenizer for wiki page text. One precompiled regex walks the
+text (then the title) and every match is turned into index terms right away:
+a plain word is lowercased, stemmed and dropped if it is a stop word, and a
+[[link]] yields the words it shows plus its target title. Terms come out of a
+generator as (term, is_link_target) pairs, so a page is never held as lists
+of intermediate tokens
+"""
+import re
+from nltk.corpus import stopwords
+import stemming
+
+STOP_WORDS = set(stopwords.words('english'))
+
+# a [[link]] (group 1 is what is between the brackets) or a plain word, which
+# may hold one apostrophe
+TOKEN_REGEX = re.compile(
+    r"\[\[([^\[]+?)\]\]|[a-zA-Z0-9]+'[a-zA-Z0-9]+|[a-zA-Z0-9]+")
+# link text characters that take a position but are never indexed
+SEPARATORS = {":", "|"}
+
+
+def tokenize(text, title, words_to_stems=None):
+    """
+    yields the terms of a page in order, as (term, is_link_target) pairs
+    :param text: the page text; None gives no terms at all
+    :param title: the page title, tokenized after the text
+    :param words_to_stems: optional dictionary every lowercase word stemmed
+    is recorded in, with its stem
+    :return: generator of pairs. A link target pair carries the lowercase
+    title the link points at and takes no position. Every other pair takes
+    one position: its term is a stemmed word to index, or None for a token
+    that indexes nothing there (a stop word, a link showing no words, or a
+    ":" or "|" shown by a link), which keeps the gaps phrases need
+    """
+    if text is None:
+        return
+    for source in (text, title):
+        for match in TOKEN_REGEX.finditer(source):
+            content = match.group(1)
+            if content is None:
+                lowered = match.group().lower()
+                word = stemming.stem(lowered)
+                if words_to_stems is not None:
+                    words_to_stems[lowered] = word
+                yield (word if word not in STOP_WORDS else None), False
+                continue
+
+            terms = link_terms(content, words_to_stems)
+            for term in terms:
+                yield (term if term not in SEPARATORS else None), False
+            if not terms:
+                yield None, False
+            yield content.split("|", 1)[0].strip().lower(), True
+
+
+def link_terms(content: str, words_to_stems=None):
+    """
+    returns the stemmed terms a link indexes, in the order the indexer has
+    always counted them
+    - [[target|shown]]: every character of the shown text except whitespace
+    and single letter stop words
+    - [[a:b c:d]] without a pipe: the colon-separated parts that are not stop
+    words, where the words of parts holding several words come first, last
+    part first, followed by the one-word parts in order
+    - [[target]]: nothing
+    :param content: the text between the brackets
+    :param words_to_stems: optional dictionary the words stemmed are
+    recorded in, with their stems
+    """
+    if "|" in content:
+        shown = content[content.index("|") + 1:]
+        words = [c.lower() for c in shown
+                 if not c.isspace() and c.lower() not in STOP_WORDS]
+    elif ":" in content:
+        single = []
+        several = []
+        for part in content.split(":"):
+            if part in STOP_WORDS:
+                continue
+            split = part.lower().split()
+            if len(split) == 1:
+                single.append(split[0])
+            elif split:
+                several.append(split)
+        words = [word for split in reversed(several) for word in split] + \
+            single
+    else:
+        return []
+    stems = [stemming.stem(word) for word in words]
+    if words_to_stems is not None:
+        words_to_stems.update(zip(words, stems))
+    return [term for term in stems if term != ""]
@@ -0,0 +1,287 @@
+import math
+import sys
+import file_io
+import pagerank
+import stemming
+from index import Indexer, page_fields, tokenize_page
+from link_graph import LinkGraph
+from relevance import RelevanceArrays
+
+
+class Updater(Indexer):
+    """Applies a delta xml of new, changed or deleted pages to an index that
+    was written with counts_fp and links_fp (index.py --state), without
+    reparsing the rest of the corpus. In the delta a new or changed page is an
+    ordinary <page>, and a deleted page is <page deleted="true"> with its <id>.
+    Only the changed records are appended to the titles, words, counts and
+    links files, where they replace the earlier ones; a file is rewritten
+    whole once more than half of its lines would be replaced ones, which is
+    always the case for the words when the page count, and so every idf,
+    changed. The docs file is rewritten, as PageRank moves every rank, and so
+    is a binary or compressed words file, from the counts.
+    The other files written for the index (the link graph, positional index,
+    impact-ordered postings, term dictionary and stems) must be given too, or
+    they are left describing the old corpus; they are rewritten
+    """
+
+    def __init__(self, delta_fp, titles_fp, docs_fp, words_fp, counts_fp,
+                 links_fp, graph_fp=None, positions_fp=None, impact_fp=None,
+                 dictionary_fp=None, stems_fp=None):
+        try:
+            self.workers = 1
+            self.relevance_arrays = None
+            self.words_to_docs_to_positions = None
+            if positions_fp is not None:
+                positions = file_io.PositionalPostings(positions_fp)
+                self.words_to_docs_to_positions = {
+                    word: positions[word] for word in positions}
+                positions.close()
+            # the words stemmed from the delta, kept for the stems and
+            # dictionary files
+            self.words_to_stems = None
+            if stems_fp is not None or dictionary_fp is not None:
+                self.words_to_stems = {}
+            if dictionary_fp is not None:
+                # terms keep the words they were shown as, unless the delta
+                # brings a shorter one
+                terms = []
+                file_io.read_dictionary_file(dictionary_fp, terms, [])
+                for term, _, display in terms:
+                    self.words_to_stems[display] = term
+            self.ids_to_titles = {}
+            self.ids_to_pageranks = {}
+            self.relevance_dict = {}
+            self.words_to_docs_to_count = {}
+            self.page_to_linked_pages = {}
+            self.affected_words = set()
+            self.changed_ids = set()  # ids added, changed or deleted
+            self.changed_titles = set()  # titles whose links were written
+
+            title_lines = file_io.read_title_file(
+                titles_fp, self.ids_to_titles)
+            file_io.read_docs_file(docs_fp, self.ids_to_pageranks)
+            count_lines = file_io.read_words_file(
+                counts_fp, self.words_to_docs_to_count, parse=int)
+            link_lines = file_io.read_links_file(
+                links_fp, self.page_to_linked_pages)
+            # links are kept by title, so those of deleted pages linger
+            titles = set(self.ids_to_titles.values())
+            self.page_to_linked_pages = {
+                title: links for title, links in
+                self.page_to_linked_pages.items() if title in titles}
+            previous_count = len(self.ids_to_titles)
+
+            self.apply_delta(delta_fp)
+            self.number_of_documents = len(self.ids_to_titles)
+
+            binary = file_io.is_binary_words_file(words_fp)
+            bits = None
+            if binary:
+                postings = file_io.binary_postings(words_fp)
+                if isinstance(postings, file_io.CompressedPostings):
+                    bits = postings.bits
+                postings.close()
+            word_lines = None
+            if self.number_of_documents == previous_count and not binary:
+                # idf only moved for the words of the changed pages
+                word_lines = file_io.read_words_file(
+                    words_fp, self.relevance_dict)
+                self.update_relevancy(self.affected_words)
+            else:
+                # n changed, so every word's idf changed with it; a binary
+                # file holds rounded relevances, so those are recomputed from
+                # the exact counts rather than rounded again on every update
+                self.fill_relevancy(self.words_to_docs_to_count)
+
+            # warm start from the previous ranks
+            self.link_graph = LinkGraph.from_page_links(
+                self.ids_to_titles, self.page_to_linked_pages)
+            self.ids_to_pageranks = pagerank.page_rank(
+                self.link_graph, start=self.ids_to_pageranks)
+
+            # write to files
+            affected_words = sorted(self.affected_words)
+            if self.compacts(title_lines, self.ids_to_titles,
+                             self.changed_ids):
+                file_io.write_title_file(titles_fp, self.ids_to_titles)
+            else:
+                file_io.append_title_file(titles_fp, self.ids_to_titles,
+                                          sorted(self.changed_ids))
+            file_io.write_docs_file(docs_fp, self.ids_to_pageranks)
+            if bits is not None:
+                file_io.write_words_compressed(
+                    words_fp, self.relevance_dict, bits)
+            elif binary:
+                file_io.write_words_binary(words_fp, self.relevance_dict)
+            elif word_lines is None or self.compacts(
+                    word_lines, self.relevance_dict, affected_words):
+                file_io.write_words_file(words_fp, self.relevance_dict,
+                                         offsets=True)
+            else:
+                file_io.append_words_file(words_fp, self.relevance_dict,
+                                          affected_words, offsets=True)
+            if self.compacts(count_lines, self.words_to_docs_to_count,
+                             affected_words):
+                file_io.write_words_file(counts_fp,
+                                         self.words_to_docs_to_count)
+            else:
+                file_io.append_words_file(
+                    counts_fp, self.words_to_docs_to_count, affected_words)
+            if self.compacts(link_lines, self.page_to_linked_pages,
+                             self.changed_titles):
+                file_io.write_links_file(links_fp, self.page_to_linked_pages)
+            else:
+                file_io.append_links_file(links_fp, self.page_to_linked_pages,
+                                          sorted(self.changed_titles))
+
+            if graph_fp is not None:
+                file_io.write_graph_file(graph_fp, self.link_graph)
+            if positions_fp is not None:
+                file_io.write_positions_file(
+                    positions_fp, self.words_to_docs_to_positions)
+            if impact_fp is not None:
+                # ranks moved for every page, so every posting may move
+                impact = file_io.ImpactPostings(impact_fp)
+                fusion = impact.fusion
+                impact.close()
+                RelevanceArrays.from_relevance(self.relevance_dict) \
+                    .write_impact(impact_fp, self.ids_to_pageranks, fusion)
+            if dictionary_fp is not None:
+                self.write_dictionary(dictionary_fp)
+            if stems_fp is not None:
+                stemming.STEM_CACHE.load(stems_fp)
+                stemming.STEM_CACHE.add(self.words_to_stems)
+                stemming.STEM_CACHE.save(stems_fp)
+
+        except FileNotFoundError:
+            print("Entered incorrect filepath! Please try again.")
+
+    def apply_delta(self, delta_fp):
+        """removes the old version of every page in delta_fp from the counts
+        and links, then adds the new versions, recording the words whose
+        postings changed in self.affected_words
+
+        Parameters:
+        delta_fp (str): filepath to the delta xml
+        """
+        positions = self.words_to_docs_to_positions
+        changed = {}  # id -> tokenize_page result, or None if deleted
+        for page in self.iter_pages(delta_fp):
+            id = int(page.find('id').text)
+            if page.get('deleted') == 'true':
+                changed[id] = None
+            else:
+                changed[id] = tokenize_page(
+                    page_fields(page), positions is not None,
+                    self.words_to_stems)
+        self.changed_ids.update(changed)
+
+        # drop the old versions of the changed pages
+        emptied = []
+        for word, docs in self.words_to_docs_to_count.items():
+            if docs.keys().isdisjoint(changed):
+                continue
+            self.affected_words.add(word)
+            for id in changed:
+                docs.pop(id, None)
+            if len(docs) == 0:
+                emptied.append(word)
+        for word in emptied:
+            del self.words_to_docs_to_count[word]
+        if positions is not None:
+            for word in list(positions):
+                docs = positions[word]
+                for id in changed:
+                    docs.pop(id, None)
+                if len(docs) == 0:
+                    del positions[word]
+
+        for id, result in changed.items():
+            if id in self.ids_to_titles:
+                self.page_to_linked_pages.pop(self.ids_to_titles[id], None)
+            if result is None:
+                self.ids_to_titles.pop(id, None)
+                continue
+
+            # add the new version, as parse_xml would
+            title, id, words_to_count, links, words_to_positions = result
+            self.ids_to_titles[id] = title
+            if positions is not None:
+                for word, word_positions in words_to_positions.items():
+                    positions.setdefault(word, {})[id] = word_positions
+            for word, count in words_to_count.items():
+                self.affected_words.add(word)
+                try:
+                    self.words_to_docs_to_count[word]
+                except KeyError:
+                    self.words_to_docs_to_count[word] = {}
+                self.words_to_docs_to_count[word][id] = count
+            self.page_to_linked_pages[title] = list(links)
+            self.changed_titles.add(title)
+
+    @staticmethod
+    def compacts(lines, records, changed):
+        """ whether a file is rewritten whole rather than appended the
+        changed records: once more than half of its lines would be replaced
+        ones
+
+        Parameters:
+        lines (int) -- the number of lines the file holds
+        records (dict) -- its live records, after the update
+        changed -- the records to append
+        """
+        return lines + len(changed) > 2 * len(records)
+
+    def update_relevancy(self, words):
+        """ recomputes self.relevance_dict for the given words only
+
+        Parameters:
+        words (set) -- the words whose postings or document frequency changed
+        """
+        # the max count of each document, needed for its term frequencies
+        max_counts = {}
+        for docs in self.words_to_docs_to_count.values():
+            for id, count in docs.items():
+                if count > max_counts.get(id, 0):
+                    max_counts[id] = count
+
+        for word in words:
+            docs = self.words_to_docs_to_count.get(word)
+            if docs is None:
+                self.relevance_dict.pop(word, None)
+                continue
+            idfi = math.log(self.number_of_documents / len(docs))
+            self.relevance_dict[word] = {
+                id: idfi * (count / max_counts[id])
+                for id, count in docs.items()}
+
+
+# REPL
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    # the other files written for the index, which are rewritten with it
+    outputs = {"--positions": None, "--impact": None, "--dictionary": None,
+               "--stems": None}
+    for flag in outputs:
+        if flag in args:
+            pos = args.index(flag)
+            try:
+                outputs[flag] = args[pos + 1]
+            except IndexError:
+                print(flag, "needs a filepath.")
+                sys.exit()
+            del args[pos:pos + 2]
+    try:
+        if len(args) != 4:
+            raise IOError
+        words_fp = args[3]
+        u = Updater(args[0], args[1], args[2], words_fp,
+                    words_fp + ".counts", words_fp + ".links",
+                    graph_fp=words_fp + ".graph",
+                    positions_fp=outputs["--positions"],
+                    impact_fp=outputs["--impact"],
+                    dictionary_fp=outputs["--dictionary"],
+                    stems_fp=outputs["--stems"])
+    except IOError:
+        print(len(args), "args entered. Please enter 4.")
+        sys.exit()